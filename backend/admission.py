@@ -0,0 +1,289 @@
+import asyncio
+import ipaddress
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+from fastapi import HTTPException, Request
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Max idle buckets kept by the in-memory backend before the least recently used are dropped
+MAX_MEMORY_BUCKETS = 10000
+
+
+class MemoryBucketBackend:
+    """Token buckets held in process memory. Each worker enforces its own limits."""
+
+    def __init__(self, max_keys: int = MAX_MEMORY_BUCKETS):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """Takes one token. Returns 0 if allowed, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class DatabaseBucketBackend:
+    """Token buckets stored in the shared database so limits hold across gunicorn workers."""
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        from .database import engine
+        from .models import RateLimitBucket
+
+        now = time.time()
+        with Session(engine) as session:
+            bucket = session.exec(
+                select(RateLimitBucket).where(RateLimitBucket.key == key).with_for_update()
+            ).first()
+            if not bucket:
+                bucket = RateLimitBucket(key=key, tokens=float(burst), updated_at=now)
+            tokens = min(float(burst), bucket.tokens + (now - bucket.updated_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            bucket.tokens = tokens
+            bucket.updated_at = now
+            session.add(bucket)
+            session.commit()
+        return wait
+
+
+class AdmissionController:
+    """Per-key token buckets plus a global concurrency limit for upload handling."""
+
+    def __init__(self, backend, max_concurrency: int, queue_target_ms: int):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.queue_target = queue_target_ms / 1000
+        self.semaphore = None
+        self.in_flight = 0
+        self.stats = {
+            "admitted": 0,
+            "rejected_rate_ip": 0,
+            "rejected_rate_phone": 0,
+            "rejected_rate_whatsapp": 0,
+            "rejected_rate_upload_chunks": 0,
+            "shed_overload": 0,
+            "backend_errors": 0,
+            "queue_wait_max_ms": 0.0,
+            "queue_wait_total_ms": 0.0,
+        }
+
+    async def _take(self, key: str, rate_per_minute: float, burst: int) -> float:
+        rate = rate_per_minute / 60
+        try:
+            if isinstance(self.backend, MemoryBucketBackend):
+                return self.backend.take(key, rate, burst)
+            return await run_in_threadpool(self.backend.take, key, rate, burst)
+        except Exception as e:
+            # Fail open: a broken limiter must not take submissions down
+            self.stats["backend_errors"] += 1
+            logger.error(f"Rate limit backend error for {key}: {e}")
+            return 0.0
+
+    async def check_ip(self, ip: str) -> float:
+        wait = await self._take(f"ip:{ip}", settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST)
+        if wait:
+            self.stats["rejected_rate_ip"] += 1
+        return wait
+
+    async def check_phone(self, phone: str) -> float:
+        digits = "".join(filter(str.isdigit, phone))
+        wait = await self._take(f"phone:{digits}", settings.RATE_LIMIT_PHONE_PER_MINUTE, settings.RATE_LIMIT_PHONE_BURST)
+        if wait:
+            self.stats["rejected_rate_phone"] += 1
+        return wait
+
+    async def check_whatsapp(self, phone: str) -> float:
+        # A chat conversation is several quick messages, so it gets its own, looser bucket
+        wait = await self._take(f"wa:{phone}", settings.RATE_LIMIT_WHATSAPP_PER_MINUTE, settings.RATE_LIMIT_WHATSAPP_BURST)
+        if wait:
+            self.stats["rejected_rate_whatsapp"] += 1
+        return wait
+
+    async def check_upload_chunk(self, ip: str) -> float:
+        # A photo is tens of chunks, so chunks get their own bucket rather than the per-IP one
+        wait = await self._take(f"chunk:{ip}", settings.RATE_LIMIT_UPLOAD_CHUNKS_PER_MINUTE, settings.RATE_LIMIT_UPLOAD_CHUNKS_BURST)
+        if wait:
+            self.stats["rejected_rate_upload_chunks"] += 1
+        return wait
+
+    async def acquire(self) -> bool:
+        """Waits for a processing slot up to the queue latency target. Returns False if shed."""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_target)
+        except asyncio.TimeoutError:
+            self.stats["shed_overload"] += 1
+            return False
+        waited_ms = (time.monotonic() - start) * 1000
+        self.stats["admitted"] += 1
+        self.stats["queue_wait_total_ms"] += waited_ms
+        self.stats["queue_wait_max_ms"] = max(self.stats["queue_wait_max_ms"], waited_ms)
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def get_stats(self) -> dict:
+        admitted = self.stats["admitted"]
+        return {
+            **self.stats,
+            "queue_wait_avg_ms": self.stats["queue_wait_total_ms"] / admitted if admitted else 0.0,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_target_ms": self.queue_target * 1000,
+            "backend": type(self.backend).__name__,
+        }
+
+
+def _create_backend():
+    if settings.ADMISSION_BACKEND == "database":
+        return DatabaseBucketBackend()
+    return MemoryBucketBackend()
+
+
+admission = AdmissionController(
+    _create_backend(),
+    max_concurrency=settings.UPLOAD_MAX_CONCURRENCY,
+    queue_target_ms=settings.UPLOAD_QUEUE_TARGET_MS,
+)
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+
+@lru_cache(maxsize=4)
+def _trusted_networks(text: str) -> tuple:
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in text.split(",") if part.strip())
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_networks(settings.TRUSTED_PROXIES))
+
+
+def client_ip(scope) -> str:
+    """
+    The address to rate limit. Render/HF Spaces sit behind a proxy, so X-Forwarded-For is used,
+    but only when the peer is in TRUSTED_PROXIES, and then only up to the right-most hop that
+    isn't: everything left of it was written by the client and could be anything.
+    """
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not _trusted(address):
+        return address
+    hops = []
+    for name, value in scope.get("headers", []):
+        if name == b"x-forwarded-for":
+            hops += [hop.strip() for hop in value.decode("latin-1").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        address = hop
+        if not _trusted(hop):
+            break
+    return address
+
+
+async def check_upload_chunk_rate(request: Request):
+    """Dependency: raises 429 if the client is sending upload chunks too fast."""
+    if not settings.ADMISSION_ENABLED:
+        return
+    wait = await admission.check_upload_chunk(client_ip(request.scope))
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+
+async def check_phone_rate(phone: str):
+    """Raises 429 if this phone number has exceeded its submission rate."""
+    if not settings.ADMISSION_ENABLED:
+        return
+    wait = await admission.check_phone(phone)
+    if wait:
+        logger.warning(f"Rate limited submissions from {phone}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many submissions, please try again later",
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+
+class AdmissionMiddleware:
+    """
+    Applies per-IP rate limits and the global upload concurrency limit to POSTs on the
+    given paths, before the (possibly multi-MB) request body is read. Paths in ip_exempt only
+    get the concurrency limit.
+    """
+
+    def __init__(self, app, paths: Optional[list] = None, ip_exempt: Optional[list] = None):
+        self.app = app
+        self.paths = set(paths or [])
+        self.ip_exempt = set(ip_exempt or [])
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+            or not settings.ADMISSION_ENABLED
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        wait = 0.0 if scope["path"] in self.ip_exempt else await admission.check_ip(client_ip(scope))
+        if wait:
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429, headers={"Retry-After": retry_after(wait)}
+            )
+            await response(scope, receive, send)
+            return
+
+        if not await admission.acquire():
+            logger.warning(f"Load shedding {scope['path']}: upload queue latency above target")
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": str(settings.UPLOAD_RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
@@ -0,0 +1,331 @@
+import json
+import re
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlmodel import Session, select
+from .database import engine
+from .models import Alert, Feedback
+from .jobs import enqueue
+from .scheduling import ALERTS_LOCK_KEY, LeaderElector
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# ro: one window per RO number; facility: one window per rated service (air, washroom) across ROs
+SCOPES = ("ro", "facility")
+FACILITIES = ("air", "washroom")
+
+# "<scope>:negatives>=<n>/<minutes>m" or "<scope>:rate><percent>%/<events>"
+RULE_PATTERN = re.compile(
+    r"^(?P<scope>\w+):(?:negatives>=(?P<count>\d+)/(?P<minutes>\d+)m|rate>(?P<percent>\d+(?:\.\d+)?)%/(?P<events>\d+))$"
+)
+
+SERIAL_KEY = "alerts"
+MAX_COUNTED_IDS = 10_000 # Feedback IDs remembered as counted; retries only ever concern the latest few
+
+
+class TimeWindow:
+    """Negatives in the last `minutes` (by feedback time). Amortized O(1) per event."""
+
+    def __init__(self, minutes: int):
+        self.span = timedelta(minutes=minutes)
+        self.negatives = deque() # (created_at, feedback_id), oldest first
+
+    def add(self, created_at: datetime, negative: bool, feedback_id: int):
+        if negative:
+            self.negatives.append((created_at, feedback_id))
+        latest = max(created_at, self.negatives[-1][0]) if self.negatives else created_at
+        while self.negatives and self.negatives[0][0] <= latest - self.span:
+            self.negatives.popleft()
+
+    @property
+    def value(self) -> float:
+        return len(self.negatives)
+
+    def feedback_ids(self) -> list:
+        return [fid for _, fid in self.negatives]
+
+
+class CountWindow:
+    """Negative share of the last `size` events: ring buffer with a running sum, O(1) per event."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.events = deque(maxlen=size) # (negative, feedback_id)
+        self.negative_count = 0
+
+    def add(self, created_at: datetime, negative: bool, feedback_id: int):
+        if len(self.events) == self.size and self.events[0][0]:
+            self.negative_count -= 1
+        self.events.append((negative, feedback_id))
+        self.negative_count += negative
+
+    @property
+    def full(self) -> bool:
+        return len(self.events) == self.size
+
+    @property
+    def value(self) -> float:
+        return self.negative_count / len(self.events) if self.events else 0.0
+
+    def feedback_ids(self) -> list:
+        return [fid for negative, fid in self.events if negative]
+
+
+class Rule:
+    def __init__(self, text: str):
+        match = RULE_PATTERN.match(text.strip())
+        if not match or match["scope"] not in SCOPES:
+            raise ValueError(
+                f"Invalid alert rule '{text}', expected e.g. 'ro:negatives>=3/30m' or 'facility:rate>40%/50'"
+            )
+        self.text = text.strip()
+        self.scope = match["scope"]
+        if match["count"]:
+            self.kind = "negatives"
+            self.threshold = int(match["count"])
+            self.minutes = int(match["minutes"])
+        else:
+            self.kind = "rate"
+            self.threshold = float(match["percent"]) / 100
+            self.events = int(match["events"])
+
+    def new_window(self):
+        return TimeWindow(self.minutes) if self.kind == "negatives" else CountWindow(self.events)
+
+    def tripped(self, window) -> bool:
+        if self.kind == "negatives":
+            return window.value >= self.threshold
+        # A rate needs a full window, or the first negative of the day would be a 100% rate
+        return window.full and window.value > self.threshold
+
+    def describe(self, key: str, window) -> str:
+        where = f"RO {key}" if self.scope == "ro" else f"{key.capitalize()} service"
+        if self.kind == "negatives":
+            return f"{int(window.value)} negative feedbacks in {self.minutes} min at {where}"
+        return f"{window.value:.0%} negative over the last {self.events} feedbacks at {where}"
+
+
+def parse_rules(text: str) -> list:
+    return [Rule(part) for part in text.split(";") if part.strip()]
+
+
+def _event_keys(scope: str, ro_number: Optional[str], rating_air: Optional[int], rating_washroom: Optional[int]):
+    """(key, negative) pairs one feedback contributes to in a scope."""
+    if scope == "ro":
+        if ro_number:
+            yield ro_number, rating_air == 1 or rating_washroom == 1
+    else:
+        if rating_air is not None:
+            yield "air", rating_air == 1
+        if rating_washroom is not None:
+            yield "washroom", rating_washroom == 1
+
+
+class AlertEngine:
+    """
+    Sliding-window counters per (rule, RO/facility), updated as feedback comes in (the
+    alerts.observe jobs queued by enqueue_feedback_event) instead of scanning the feedback table. Windows are rebuilt from the
+    most recent rows on startup. A rule that trips alerts once, then stays quiet for that RO or
+    facility for ALERT_COOLDOWN_MINUTES even if it keeps matching.
+
+    Counters live in memory, so only the worker holding alert_elector's leadership claims alert
+    jobs (Worker.run); the others would each see a share of the events. Alert jobs share a
+    serial key so they are applied one at a time, in order.
+
+    observe() is idempotent per feedback ID: an event already counted (by an earlier attempt or
+    by rebuild()) isn't added again, only checked against the rules. Cooldowns start in
+    confirm(), once the alerts are committed, so a failed commit is retried in full.
+    """
+
+    def __init__(self, rules_text: str):
+        self.rules = parse_rules(rules_text)
+        self.windows = {} # (rule index, key) -> window
+        self.last_alert = {} # (rule text, key) -> datetime
+        self.counted = OrderedDict() # Feedback IDs in the windows, oldest first
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.stats = {"events": 0, "alerts": 0, "suppressed": 0, "rebuild_rows": 0}
+
+    def _apply(self, rules, feedback_id, ro_number, rating_air, rating_washroom, created_at) -> list:
+        tripped = []
+        for index, rule in rules:
+            for key, negative in _event_keys(rule.scope, ro_number, rating_air, rating_washroom):
+                window = self.windows.get((index, key))
+                if window is None:
+                    window = self.windows[(index, key)] = rule.new_window()
+                window.add(created_at, negative, feedback_id)
+                if negative and rule.tripped(window):
+                    tripped.append((rule, key, window))
+        return tripped
+
+    def _check(self, ro_number, rating_air, rating_washroom) -> list:
+        """Rules tripped by an event that is already in the windows."""
+        tripped = []
+        for index, rule in enumerate(self.rules):
+            for key, negative in _event_keys(rule.scope, ro_number, rating_air, rating_washroom):
+                window = self.windows.get((index, key))
+                if negative and window is not None and rule.tripped(window):
+                    tripped.append((rule, key, window))
+        return tripped
+
+    def observe(self, feedback_id: int, ro_number: Optional[str], rating_air: Optional[int],
+                rating_washroom: Optional[int], created_at: datetime) -> list:
+        """
+        Counts one submitted feedback. Returns the alerts to send (already past the cooldown
+        check); pass them to confirm() once they're committed.
+        """
+        with self.lock:
+            if feedback_id in self.counted:
+                tripped = self._check(ro_number, rating_air, rating_washroom)
+            else:
+                self.stats["events"] += 1
+                tripped = self._apply(list(enumerate(self.rules)), feedback_id, ro_number, rating_air, rating_washroom, created_at)
+                self.counted[feedback_id] = True
+                while len(self.counted) > MAX_COUNTED_IDS:
+                    self.counted.popitem(last=False)
+            alerts = []
+            now = datetime.utcnow()
+            cooldown = timedelta(minutes=settings.ALERT_COOLDOWN_MINUTES)
+            for rule, key, window in tripped:
+                last = self.last_alert.get((rule.text, key))
+                if last and now - last < cooldown:
+                    self.stats["suppressed"] += 1
+                    continue
+                alerts.append(Alert(
+                    rule=rule.text,
+                    scope=rule.scope,
+                    key=key,
+                    value=round(window.value, 4),
+                    message=rule.describe(key, window),
+                    feedback_ids=json.dumps(window.feedback_ids()),
+                ))
+            return alerts
+
+    def confirm(self, alerts: list):
+        """Starts the cooldown of committed alerts."""
+        with self.lock:
+            for alert in alerts:
+                self.last_alert[(alert.rule, alert.key)] = alert.created_at
+                self.stats["alerts"] += 1
+
+    def invalidate(self):
+        """Drops the windows; the next observe_feedback() rebuilds them from the database."""
+        with self.lock:
+            self.loaded = False
+
+    def rebuild(self):
+        """Reloads the windows from the latest feedback, and cooldowns from recent alerts."""
+        time_rules = [(i, r) for i, r in enumerate(self.rules) if r.kind == "negatives"]
+        count_rules = [(i, r) for i, r in enumerate(self.rules) if r.kind == "rate"]
+        columns = (Feedback.id, Feedback.ro_number, Feedback.rating_air, Feedback.rating_washroom, Feedback.created_at)
+        submitted = Feedback.status != "draft"
+        rows = []
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            if time_rules:
+                since = now - timedelta(minutes=max(r.minutes for _, r in time_rules))
+                rows += [("time", row) for row in session.exec(
+                    select(*columns).where(submitted, Feedback.created_at >= since).order_by(Feedback.created_at)
+                ).all()]
+            for index, rule in count_rules:
+                # Latest N events per key, straight from the created_at/ro_number indexes
+                if rule.scope == "ro":
+                    rank = func.row_number().over(partition_by=Feedback.ro_number, order_by=Feedback.created_at.desc()).label("rank")
+                    ranked = select(*columns, rank).where(submitted, Feedback.ro_number.is_not(None)).subquery()
+                    latest = session.exec(select(*[ranked.c[c.key] for c in columns]).where(ranked.c.rank <= rule.events)).all()
+                else:
+                    # Rows rated for both services come back twice; replaying the union oldest
+                    # first still leaves each ring buffer holding its own latest N
+                    latest = {}
+                    for facility in FACILITIES:
+                        rated = getattr(Feedback, f"rating_{facility}").is_not(None)
+                        for row in session.exec(
+                            select(*columns).where(submitted, rated).order_by(Feedback.created_at.desc()).limit(rule.events)
+                        ).all():
+                            latest[row.id] = row
+                    latest = list(latest.values())
+                rows += [((index, rule), row) for row in sorted(latest, key=lambda r: (r.created_at, r.id))]
+            recent_alerts = session.exec(
+                select(Alert.rule, Alert.key, func.max(Alert.created_at))
+                .where(Alert.created_at >= now - timedelta(minutes=settings.ALERT_COOLDOWN_MINUTES))
+                .group_by(Alert.rule, Alert.key)
+            ).all()
+
+        with self.lock:
+            self.windows = {}
+            self.counted = OrderedDict()
+            for target, row in rows:
+                rules = time_rules if target == "time" else [target]
+                self._apply(rules, row.id, row.ro_number, row.rating_air, row.rating_washroom, row.created_at)
+                self.counted[row.id] = True
+            self.last_alert = {(rule, key): created_at for rule, key, created_at in recent_alerts}
+            self.stats["rebuild_rows"] = len(rows)
+            self.loaded = True
+        logger.info(f"Alert windows rebuilt from {len(rows)} rows for {len(self.rules)} rules")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "rules": [r.text for r in self.rules],
+            "windows": len(self.windows),
+            "loaded": self.loaded,
+            "leader": alert_elector.is_leader,
+        }
+
+
+alert_engine = AlertEngine(settings.ALERT_RULES)
+alert_elector = LeaderElector("alerts", ALERTS_LOCK_KEY)
+
+
+def enqueue_feedback_event(session: Session, feedback: Feedback):
+    """
+    Queues a submitted feedback for the alert rules (in the caller's transaction). Replaces the
+    one-email-per-negative report, which is only sent as well with ALERT_EVERY_NEGATIVE.
+    """
+    enqueue(
+        session,
+        "alerts.observe",
+        {
+            "feedback_id": feedback.id,
+            "ro_number": feedback.ro_number,
+            "rating_air": feedback.rating_air,
+            "rating_washroom": feedback.rating_washroom,
+            "created_at": feedback.created_at.isoformat(),
+        },
+        priority=5,
+        serial_key=SERIAL_KEY,
+    )
+    if settings.ALERT_EVERY_NEGATIVE and (feedback.rating_air == 1 or feedback.rating_washroom == 1):
+        enqueue(session, "report.negative", {"feedback_id": feedback.id}, priority=5)
+
+
+def observe_feedback(feedback_id: int, ro_number: Optional[str], rating_air: Optional[int],
+                     rating_washroom: Optional[int], created_at: str) -> int:
+    """Worker side of enqueue_feedback_event: updates the windows and queues an email per alert."""
+    if not alert_engine.loaded:
+        # Includes this feedback, which observe() then only checks against the rules
+        alert_engine.rebuild()
+    alerts = alert_engine.observe(feedback_id, ro_number, rating_air, rating_washroom, datetime.fromisoformat(created_at))
+    if alerts:
+        try:
+            with Session(engine) as session:
+                for alert in alerts:
+                    session.add(alert)
+                    session.flush()
+                    enqueue(session, "report.alert", {"alert_id": alert.id}, priority=5)
+                session.commit()
+                for alert in alerts:
+                    session.refresh(alert)
+        except Exception:
+            # The retry starts over from what's in the database
+            alert_engine.invalidate()
+            raise
+        alert_engine.confirm(alerts)
+        for alert in alerts:
+            logger.warning(f"Alert rule {alert.rule} tripped: {alert.message}")
+    return len(alerts)
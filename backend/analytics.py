@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_, case, func, literal_column, or_
+from sqlmodel import Session, select
+from .models import Feedback, FeedbackFilter
+from .filters import filter_conditions
+
+BUCKETS = ("hour", "day", "week")
+PERCENTILES = (0.5, 0.9, 0.99)
+RATINGS = (1, 2, 3) # Sad, neutral, happy
+TOP_ROS = 20
+
+NEGATIVE = or_(Feedback.rating_air == 1, Feedback.rating_washroom == 1)
+
+
+def _count_if(condition):
+    return func.sum(case((condition, 1), else_=0))
+
+
+def bucket_expression(dialect: str, bucket: str, tz: str, reference: datetime):
+    """
+    SQL expression for the local-time bucket start of created_at (stored as naive UTC).
+    Postgres converts per row, so DST is exact. SQLite has no time zone support, so the zone's
+    UTC offset at `reference` is applied to every row (exact for zones without DST, like IST).
+    """
+    if dialect == "postgresql":
+        local = func.timezone(tz, func.timezone("UTC", Feedback.created_at))
+        return func.to_char(func.date_trunc(bucket, local), "YYYY-MM-DD\"T\"HH24:MI:SS")
+
+    offset = ZoneInfo(tz).utcoffset(reference) or timedelta(0)
+    local = func.datetime(Feedback.created_at, f"{int(offset.total_seconds() // 60):+d} minutes")
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%dT%H:00:00", local)
+    if bucket == "week":
+        # Monday of the week: next Sunday (or today if Sunday), minus 6 days
+        return func.strftime("%Y-%m-%dT00:00:00", local, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-%dT00:00:00", local)
+
+
+def _resolution_seconds(dialect: str):
+    if dialect == "postgresql":
+        return func.extract("epoch", Feedback.resolved_at - Feedback.created_at)
+    return (func.julianday(Feedback.resolved_at) - func.julianday(Feedback.created_at)) * 86400
+
+
+def _resolution_percentiles(session: Session, dialect: str, conditions: list) -> dict:
+    seconds = _resolution_seconds(dialect)
+    resolved = conditions + [Feedback.resolved_at.is_not(None)]
+    if dialect == "postgresql":
+        row = session.execute(
+            select(
+                func.count(),
+                *[func.percentile_cont(p).within_group(seconds) for p in PERCENTILES],
+            ).where(*resolved)
+        ).one()
+        count, values = row[0], row[1:]
+    else:
+        # No percentile aggregate in SQLite: sort once (from the covering index) and pick ranks
+        durations = session.execute(select(seconds.label("s")).where(*resolved).order_by(literal_column("s"))).scalars().all()
+        count = len(durations)
+        values = [durations[min(count - 1, int(p * count))] if count else None for p in PERCENTILES]
+    return {
+        "resolved_count": count,
+        **{f"p{int(p * 100)}_seconds": round(float(v), 1) if v is not None else None for p, v in zip(PERCENTILES, values)},
+    }
+
+
+def feedback_analytics(
+    session: Session,
+    f: FeedbackFilter,
+    bucket: str = "day",
+    tz: str = "UTC",
+) -> dict:
+    """
+    All dashboard aggregates computed in SQL over the filtered rows (created_at range defaults to
+    the last 30 days). Queries are GROUP BYs answered from the ix_feedback_analytics covering
+    index, and the response size depends on the number of buckets, not on the number of rows.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    try:
+        ZoneInfo(tz)
+    except Exception:
+        raise ValueError(f"Unknown time zone: {tz}")
+
+    f = f.model_copy()
+    f.created_to = f.created_to or datetime.utcnow()
+    f.created_from = f.created_from or f.created_to - timedelta(days=30)
+    conditions = filter_conditions(f)
+    dialect = session.get_bind().dialect.name
+
+    # One pass over the range: per bucket counts from which the summary, rating distributions and
+    # per method figures are summed up (there are few buckets, however many rows)
+    bucket_start = bucket_expression(dialect, bucket, tz, f.created_to).label("bucket")
+    columns = {
+        "total": func.count(),
+        "negative": _count_if(NEGATIVE),
+        "resolved": _count_if(Feedback.status == "resolved"),
+        "web": _count_if(Feedback.feedback_method == "web"),
+        "whatsapp": _count_if(Feedback.feedback_method == "whatsapp"),
+        "web_negative": _count_if(and_(Feedback.feedback_method == "web", NEGATIVE)),
+        "whatsapp_negative": _count_if(and_(Feedback.feedback_method == "whatsapp", NEGATIVE)),
+        "air_sum": func.sum(Feedback.rating_air),
+        "air_n": func.count(Feedback.rating_air),
+        "washroom_sum": func.sum(Feedback.rating_washroom),
+        "washroom_n": func.count(Feedback.rating_washroom),
+    }
+    for rating in RATINGS:
+        columns[f"air_{rating}"] = _count_if(Feedback.rating_air == rating)
+        columns[f"washroom_{rating}"] = _count_if(Feedback.rating_washroom == rating)
+    rows = session.execute(
+        select(bucket_start, *[c.label(name) for name, c in columns.items()])
+        .where(*conditions)
+        .group_by(literal_column("bucket"))
+        .order_by(literal_column("bucket"))
+    ).mappings().all()
+    totals = {name: sum(row[name] or 0 for row in rows) for name in columns}
+
+    by_ro = session.execute(
+        select(Feedback.ro_number, func.count().label("n"), _count_if(NEGATIVE))
+        .where(*conditions)
+        .group_by(Feedback.ro_number)
+        .order_by(literal_column("n").desc())
+        .limit(TOP_ROS)
+    ).all()
+
+    def rate(part, whole):
+        return round((part or 0) / whole, 4) if whole else 0.0
+
+    return {
+        "range": {"from": f.created_from.isoformat(), "to": f.created_to.isoformat(), "bucket": bucket, "tz": tz},
+        "summary": {
+            "total": totals["total"],
+            "resolved": totals["resolved"],
+            "pending": totals["total"] - totals["resolved"],
+            "negative": totals["negative"],
+            "negative_rate": rate(totals["negative"], totals["total"]),
+            "avg_rating_air": round(totals["air_sum"] / totals["air_n"], 2) if totals["air_n"] else None,
+            "avg_rating_washroom": round(totals["washroom_sum"] / totals["washroom_n"], 2) if totals["washroom_n"] else None,
+        },
+        "trend": [
+            {
+                "bucket": row["bucket"],
+                "total": row["total"],
+                "negative": row["negative"],
+                "negative_rate": rate(row["negative"], row["total"]),
+                "web": row["web"],
+                "whatsapp": row["whatsapp"],
+            }
+            for row in rows
+        ],
+        "ratings": {
+            name: {str(r): totals[f"{name}_{r}"] for r in RATINGS if totals[f"{name}_{r}"]}
+            for name in ("air", "washroom")
+        },
+        "by_ro": [{"ro_number": ro, "total": n, "negative": neg, "negative_rate": rate(neg, n)} for ro, n, neg in by_ro],
+        "by_method": [
+            {"method": m, "total": totals[m], "negative": totals[f"{m}_negative"], "negative_rate": rate(totals[f"{m}_negative"], totals[m])}
+            for m in ("web", "whatsapp") if totals[m]
+        ],
+        "resolution": _resolution_percentiles(session, dialect, conditions),
+    }
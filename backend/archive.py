@@ -0,0 +1,233 @@
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from .database import engine
+from .models import Feedback, ArchiveIndex, ArchiveSegment
+from .scheduling import ARCHIVE_LOCK_KEY, LeaderElector
+from .config import settings
+from .cache import response_cache, REPORTS, IMAGES
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+PHOTO_FIELDS = ["photo_air", "photo_washroom", "photo_receipt"]
+
+# One archiver at a time: the lock within this process (a timed-out job's thread keeps running
+# next to its retry), the lease across processes
+_archive_lock = threading.Lock()
+_archive_lease = LeaderElector("archive", ARCHIVE_LOCK_KEY)
+
+
+def _archive_dir() -> Path:
+    path = Path(settings.ARCHIVE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _zstandard():
+    # zstd is preferred; gzip keeps archiving working where zstandard isn't installed.
+    # Imported on first use to keep startup fast.
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _compress(data: bytes):
+    zstandard = _zstandard()
+    if zstandard:
+        return zstandard.ZstdCompressor(level=10).compress(data), "zst"
+    return gzip.compress(data), "gz"
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        return _zstandard().ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _serialize(feedback: Feedback, blob, offset: int):
+    """Returns the NDJSON record for a feedback row, appending its photos to the blob buffer."""
+    record = feedback.model_dump(exclude=set(PHOTO_FIELDS))
+    record["created_at"] = feedback.created_at.isoformat()
+    record["resolved_at"] = feedback.resolved_at.isoformat() if feedback.resolved_at else None
+    for field in PHOTO_FIELDS:
+        data = getattr(feedback, field)
+        if data:
+            # [offset, length] into the segment's blob file
+            record[field] = [offset, len(data)]
+            blob.append(data)
+            offset += len(data)
+        else:
+            record[field] = None
+    return record, offset
+
+
+def archive_batch(session: Session, cutoff: datetime, batch_size: int) -> int:
+    """
+    Moves up to batch_size feedback rows created before cutoff into a new segment:
+    <name>.ndjson.<codec> (compressed records) and <name>.blobs (packed photos).
+    Files are written before the DB transaction that indexes them and deletes the hot rows,
+    so a crash leaves at worst an unreferenced segment file, never lost data.
+    """
+    feedbacks = session.exec(
+        select(Feedback)
+        .where(Feedback.created_at < cutoff, Feedback.status != "draft")
+        .order_by(Feedback.id)
+        .limit(batch_size)
+    ).all()
+    if not feedbacks:
+        return 0
+
+    name = f"seg_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    blob, lines, offset = [], [], 0
+    for feedback in feedbacks:
+        record, offset = _serialize(feedback, blob, offset)
+        lines.append(json.dumps(record, separators=(",", ":")))
+
+    compressed, codec = _compress("\n".join(lines).encode("utf-8"))
+    directory = _archive_dir()
+    # Photos are already compressed JPEG/WebP, so the blob file is stored as is
+    _write_atomic(directory / f"{name}.blobs", b"".join(blob))
+    _write_atomic(directory / f"{name}.ndjson.{codec}", compressed)
+
+    ids = [f.id for f in feedbacks]
+    session.add(ArchiveSegment(
+        name=name,
+        codec=codec,
+        record_count=len(feedbacks),
+        min_created_at=min(f.created_at for f in feedbacks),
+        max_created_at=max(f.created_at for f in feedbacks),
+    ))
+    for feedback in feedbacks:
+        session.add(ArchiveIndex(feedback_id=feedback.id, segment=name, created_at=feedback.created_at))
+    session.execute(delete(Feedback).where(Feedback.id.in_(ids)).execution_options(synchronize_session=False))
+    session.commit()
+    session.expunge_all()
+    logger.info(f"Archived {len(ids)} feedback into {name} ({len(compressed)} + {offset} bytes)")
+    return len(ids)
+
+
+def archive_old_feedback() -> int:
+    """
+    Archives all feedback older than ARCHIVE_AFTER_DAYS in batches. Returns rows archived, 0 if
+    another run is in progress (two runs would write the same rows into two segments).
+    """
+    if settings.ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    if not _archive_lock.acquire(blocking=False):
+        logger.info("Archiving already running in this process, skipping")
+        return 0
+    try:
+        total = _archive_with_lease()
+    finally:
+        _archive_lock.release()
+    return total
+
+
+def _archive_with_lease() -> int:
+    if not _archive_lease.ensure_leadership():
+        logger.info("Archiving already running in another process, skipping")
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    total = 0
+    try:
+        with Session(engine) as session:
+            while True:
+                count = archive_batch(session, cutoff, settings.ARCHIVE_BATCH_SIZE)
+                if not count:
+                    break
+                total += count
+                # Renews the lease; stop if it lapsed and another process may have taken over
+                if not _archive_lease.ensure_leadership():
+                    logger.warning("Archive lease lost, stopping; the next run continues")
+                    break
+    finally:
+        _archive_lease.release()
+    if total:
+        response_cache.invalidate(REPORTS, IMAGES)
+        logger.info(f"Archiving complete: {total} feedback older than {cutoff} moved to cold storage")
+    return total
+
+
+@lru_cache(maxsize=8)
+def _load_segment(name: str, codec: str) -> dict:
+    """Decompresses a segment into {feedback_id: record}. Segments are immutable, so cache them."""
+    data = (_archive_dir() / f"{name}.ndjson.{codec}").read_bytes()
+    records = {}
+    for line in _decompress(data, codec).splitlines():
+        record = json.loads(line)
+        records[record["id"]] = record
+    return records
+
+
+def _read_blob(name: str, ref) -> Optional[bytes]:
+    if not ref:
+        return None
+    offset, length = ref
+    with open(_archive_dir() / f"{name}.blobs", "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def _index_entry(session: Session, feedback_id: int):
+    return session.exec(
+        select(ArchiveIndex.segment, ArchiveSegment.codec)
+        .join(ArchiveSegment, ArchiveSegment.name == ArchiveIndex.segment)
+        .where(ArchiveIndex.feedback_id == feedback_id)
+    ).first()
+
+
+def get_archived_record(session: Session, feedback_id: int) -> Optional[dict]:
+    """Looks up an archived feedback by ID through the index. Photos are returned as bytes."""
+    entry = _index_entry(session, feedback_id)
+    if not entry:
+        return None
+    segment, codec = entry
+    record = dict(_load_segment(segment, codec)[feedback_id])
+    for field in PHOTO_FIELDS:
+        record[field] = _read_blob(segment, record[field])
+    return record
+
+
+def get_archived_photo(session: Session, feedback_id: int, field: str) -> Optional[bytes]:
+    entry = _index_entry(session, feedback_id)
+    if not entry:
+        return None
+    segment, codec = entry
+    return _read_blob(segment, _load_segment(segment, codec)[feedback_id][field])
+
+
+def iter_archived_records(session: Session, created_from: datetime = None, created_to: datetime = None):
+    """Yields archived records (without photos) in the given created_at range, segment by segment."""
+    query = select(ArchiveSegment).order_by(ArchiveSegment.min_created_at)
+    if created_from:
+        query = query.where(ArchiveSegment.max_created_at >= created_from)
+    if created_to:
+        query = query.where(ArchiveSegment.min_created_at < created_to)
+    for segment in session.exec(query).all():
+        for record in _load_segment(segment.name, segment.codec).values():
+            created_at = datetime.fromisoformat(record["created_at"])
+            if created_from and created_at < created_from:
+                continue
+            if created_to and created_at >= created_to:
+                continue
+            yield {**record, **{field: bool(record[field]) for field in PHOTO_FIELDS}}
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import re
+import threading
+from pathlib import Path
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Brotli is optional; gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTML_SUFFIXES = {".html"}
+COMPRESSIBLE_SUFFIXES = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# HTML always revalidates so a deploy is picked up on the next visit
+HTML_CACHE = "no-cache"
+
+# href="style.css" / src="script.js?v=2" (local, relative references only)
+ASSET_REF = re.compile(r'(?P<attr>\b(?:href|src)=)(?P<quote>["\'])(?P<path>[^"\'?#:]+)(?:\?[^"\']*)?(?P=quote)')
+
+MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+    ".txt": "text/plain; charset=utf-8",
+}
+
+
+class Asset:
+    """A file held in memory with its precompressed variants."""
+
+    def __init__(self, body: bytes, media_type: str, compress: bool):
+        self.body = body
+        self.media_type = media_type
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.variants = {}
+        if compress and settings.STATIC_PRECOMPRESS:
+            if brotli:
+                self.variants["br"] = brotli.compress(body, quality=11)
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            # Don't bother if compression doesn't pay off
+            self.variants = {k: v for k, v in self.variants.items() if len(v) < len(body)}
+
+    def pick(self, accept_encoding: str):
+        accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return self.variants[encoding], encoding
+        return self.body, None
+
+
+class FrontendFiles(StaticFiles):
+    """
+    StaticFiles with a build-free asset pipeline. On first request every CSS/JS file is
+    hashed and served as name.<hash>.ext with immutable caching; references in the HTML pages
+    are rewritten to those URLs. HTML and assets are served from memory, precompressed with
+    brotli/gzip when the client accepts it. Anything else falls back to plain StaticFiles.
+    Files are read once per process, so restart after editing the frontend.
+    """
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.root = Path(directory)
+        self.assets = None # URL path -> Asset
+        self.lock = threading.Lock()
+
+    def _build(self) -> dict:
+        assets, fingerprinted = {}, {}
+        files = [p for p in sorted(self.root.rglob("*")) if p.is_file()]
+        for path in files:
+            if path.suffix in HTML_SUFFIXES or path.suffix not in MEDIA_TYPES:
+                continue
+            body = path.read_bytes()
+            rel = path.relative_to(self.root).as_posix()
+            digest = hashlib.sha256(body).hexdigest()[:10]
+            name = f"{rel[:-len(path.suffix)]}.{digest}{path.suffix}"
+            fingerprinted[rel] = name
+            assets[name] = Asset(body, MEDIA_TYPES[path.suffix], compress=path.suffix in COMPRESSIBLE_SUFFIXES)
+
+        for path in files:
+            if path.suffix not in HTML_SUFFIXES:
+                continue
+            rel = path.relative_to(self.root).as_posix()
+            base = rel.rsplit("/", 1)[0] + "/" if "/" in rel else ""
+
+            def rewrite(match):
+                target = fingerprinted.get(base + match.group("path").lstrip("./"))
+                if not target:
+                    return match.group(0)
+                return f'{match.group("attr")}{match.group("quote")}/{target}{match.group("quote")}'
+
+            html = ASSET_REF.sub(rewrite, path.read_text(encoding="utf-8"))
+            assets[rel] = Asset(html.encode("utf-8"), MEDIA_TYPES[".html"], compress=True)
+
+        logger.info(f"Frontend assets fingerprinted: {len(fingerprinted)} files, brotli={'on' if brotli else 'off'}")
+        return assets
+
+    def _get_assets(self) -> dict:
+        if self.assets is None:
+            with self.lock:
+                if self.assets is None:
+                    try:
+                        self.assets = self._build()
+                    except Exception as e:
+                        # Serve the plain files rather than fail the site
+                        logger.error(f"Failed to build frontend assets: {e}")
+                        self.assets = {}
+        return self.assets
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        rel = path.replace("\\", "/").strip("/")
+        if rel in ("", "."):
+            rel = "index.html"
+
+        asset = self._get_assets().get(rel)
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        headers = Headers(scope=scope)
+        is_html = rel.endswith(".html")
+        response_headers = {
+            "Cache-Control": HTML_CACHE if is_html else IMMUTABLE_CACHE,
+            "ETag": asset.etag,
+            "Vary": "Accept-Encoding",
+        }
+        if asset.etag in headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=response_headers)
+
+        body, encoding = asset.pick(headers.get("accept-encoding", ""))
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(content=body, headers=response_headers, media_type=asset.media_type)
@@ -0,0 +1,383 @@
+"""
+Micro-benchmarks for performance sensitive paths.
+
+Usage:
+    python -m backend.benchmarks search --rows 1000000
+    python -m backend.benchmarks startup --max-import-ms 800
+    python -m backend.benchmarks writes --profiles sqlite,default --threads 8
+    python -m backend.benchmarks analytics --rows 1000000 --explain
+    python -m backend.benchmarks serialize --rows 10000 --photos
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+from sqlmodel import SQLModel, Session, create_engine
+
+from .models import Feedback, FeedbackRead, Job
+from . import search
+from .analytics import feedback_analytics
+from .models import FeedbackFilter
+from .engine_profiles import create_profiled_engine, pool_stats
+from .serialization import report_query, encode_reports
+
+WORDS = ["air", "washroom", "dirty", "clean", "staff", "rude", "good", "slow", "pump", "water",
+         "queue", "receipt", "smell", "broken", "excellent", "tyre", "pressure", "soap", "toilet", "fast"]
+
+
+def _timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def _sqlite_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        search.register_sqlite_functions(dbapi_connection)
+
+    return engine
+
+
+def _fill_feedback(engine, rows, batch=50000):
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    insert = text(
+        "INSERT INTO feedback (phone, is_testimonial, rating_air, rating_washroom, comment, terms_accepted, "
+        "ro_number, status, feedback_method, created_at) VALUES "
+        "(:phone, 0, :ra, :rw, :comment, 1, :ro, 'pending', 'web', :created_at)"
+    )
+    for start in range(0, rows, batch):
+        params = [
+            {
+                "phone": f"+91 9{rnd.randint(0, 999999999):09d}",
+                "ra": rnd.randint(1, 3),
+                "rw": rnd.randint(1, 3),
+                "comment": " ".join(rnd.choices(WORDS, k=rnd.randint(3, 12))),
+                "ro": f"RO{rnd.randint(1, 500)}",
+                "created_at": now - timedelta(minutes=rnd.randint(0, 525600)),
+            }
+            for _ in range(min(batch, rows - start))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert, params)
+        print(f"  inserted {start + len(params)}/{rows}", end="\r")
+    print()
+
+
+def bench_search(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _sqlite_engine(os.path.join(tmp, "bench.db")) if not args.database_url else create_engine(args.database_url)
+        SQLModel.metadata.create_all(engine)
+        search.create_search_index(engine)
+        print(f"Populating {args.rows} rows ({engine.dialect.name})...")
+        start = time.perf_counter()
+        _fill_feedback(engine, args.rows)
+        print(f"Populated in {time.perf_counter() - start:.1f}s (index maintained by triggers/indexes)")
+
+        queries = ["dirty", "rude staff", "RO123", "43210", "98765", "excellent pressure", "soa"]
+        with Session(engine) as session:
+            print(f"{'query':<22}{'matches':>10}{'p50 ms':>10}{'p95 ms':>10}")
+            for q in queries:
+                total, _ = search.search_feedback(session, q, 1, 50)
+                p50, p95 = _timeit(lambda: search.search_feedback(session, q, 1, 50), args.repeat)
+                print(f"{q:<22}{total:>10}{p50:>10.1f}{p95:>10.1f}")
+
+            # Baseline: the unindexed LIKE scan the endpoint would otherwise need
+            available = search._fts_available
+            search._fts_available = False
+            p50, p95 = _timeit(lambda: search.search_feedback(session, "dirty", 1, 50), max(1, args.repeat // 5))
+            search._fts_available = available
+            print(f"{'dirty (LIKE scan)':<22}{'':>10}{p50:>10.1f}{p95:>10.1f}")
+        engine.dispose()
+
+
+def bench_analytics(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _sqlite_engine(os.path.join(tmp, "bench.db")) if not args.database_url else create_engine(args.database_url)
+        SQLModel.metadata.create_all(engine)
+        print(f"Populating {args.rows} rows ({engine.dialect.name})...")
+        _fill_feedback(engine, args.rows)
+
+        with Session(engine) as session:
+            if args.explain:
+                # Plans for the trend query; the created_at index should be used for the range
+                statements = []
+
+                def _capture(conn, cursor, statement, params, context, executemany):
+                    statements.append((statement, params))
+
+                event.listen(engine, "before_cursor_execute", _capture)
+                feedback_analytics(session, FeedbackFilter(), "day", "Asia/Kolkata")
+                event.remove(engine, "before_cursor_execute", _capture)
+                prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+                for statement, params in statements[:2]:
+                    print(statement.split("FROM")[0][:80].strip(), "...")
+                    for row in session.connection().exec_driver_sql(prefix + statement, params).all():
+                        print("   ", row[-1])
+
+            print(f"{'bucket':<10}{'range':>8}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>8}")
+            for bucket, days in (("hour", 2), ("day", 30), ("week", 365)):
+                f = FeedbackFilter(created_from=datetime.utcnow() - timedelta(days=days))
+                result = feedback_analytics(session, f, bucket, "Asia/Kolkata")
+                p50, p95 = _timeit(lambda: feedback_analytics(session, f, bucket, "Asia/Kolkata"), args.repeat)
+                size = len(json.dumps(result, separators=(",", ":"), default=str))
+                print(f"{bucket:<10}{str(days) + 'd':>8}{p50:>10.1f}{p95:>10.1f}{size:>8}")
+        engine.dispose()
+
+
+def _reports_pydantic(session):
+    # The /admin/reports path before serialization.py: ORM rows, model_dump, FeedbackRead, jsonable_encoder
+    import base64
+    from fastapi.encoders import jsonable_encoder
+    from sqlmodel import select
+    results = []
+    for f in session.exec(select(Feedback)).all():
+        f_dict = f.model_dump()
+        for field in ("photo_air", "photo_washroom", "photo_receipt"):
+            if getattr(f, field):
+                f_dict[field] = base64.b64encode(getattr(f, field)).decode("utf-8")
+        results.append(FeedbackRead(**f_dict))
+    return json.dumps(jsonable_encoder(results)).encode("utf-8")
+
+
+def _reports_lean(session, include_photos):
+    return encode_reports(session.execute(report_query(include_photos)).all(), include_photos)
+
+
+def bench_serialize(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _sqlite_engine(os.path.join(tmp, "bench.db"))
+        SQLModel.metadata.create_all(engine)
+        print(f"Populating {args.rows} rows...")
+        _fill_feedback(engine, args.rows)
+        if args.photos:
+            # A small JPEG-sized blob on every 10th row, like the real data
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE feedback SET photo_air = :photo WHERE id % 10 = 0"), {"photo": os.urandom(20000)})
+
+        with Session(engine) as session:
+            old = _reports_pydantic(session)
+            new = _reports_lean(session, True)
+            # Same JSON, only the whitespace differs
+            same = json.loads(old) == json.loads(new)
+            print(f"Identical output: {'yes' if same else 'NO'}")
+            print(f"{'path':<34}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>12}")
+            for name, fn in (
+                ("pydantic (model_dump+FeedbackRead)", lambda: _reports_pydantic(session)),
+                ("lean tuples + orjson", lambda: _reports_lean(session, True)),
+                ("lean, include_photos=false", lambda: _reports_lean(session, False)),
+            ):
+                p50, p95 = _timeit(fn, args.repeat)
+                print(f"{name:<34}{p50:>10.1f}{p95:>10.1f}{len(fn()):>12}")
+        engine.dispose()
+        if not same:
+            sys.exit(1)
+
+
+def _write_worker(engine, deadline, results, rnd):
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            # Same shape as a web submit: feedback row plus its queued notification, one transaction
+            with Session(engine) as session:
+                feedback = Feedback(
+                    phone=f"+91 9{rnd.randint(0, 999999999):09d}",
+                    rating_air=rnd.randint(1, 3),
+                    comment=" ".join(rnd.choices(WORDS, k=8)),
+                    terms_accepted=True,
+                    ro_number=f"RO{rnd.randint(1, 500)}",
+                )
+                session.add(feedback)
+                session.flush()
+                session.add(Job(kind="bench", payload=f'{{"feedback_id": {feedback.id}}}'))
+                session.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            errors += 1
+    results.append((latencies, errors))
+
+
+def _read_worker(engine, deadline, counter):
+    while time.perf_counter() < deadline:
+        with Session(engine) as session:
+            session.execute(text("SELECT COUNT(*) FROM feedback WHERE status = 'pending'")).scalar()
+        counter.append(1)
+
+
+def bench_writes(args):
+    print(f"{'profile':<12}{'writes/s':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'reads/s':>9}")
+    for profile in args.profiles.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine = create_profiled_engine(url, profile)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", lambda conn, record: search.register_sqlite_functions(conn))
+            SQLModel.metadata.create_all(engine)
+            search.create_search_index(engine)
+
+            results, reads = [], []
+            deadline = time.perf_counter() + args.seconds
+            threads = [
+                threading.Thread(target=_write_worker, args=(engine, deadline, results, random.Random(i)))
+                for i in range(args.threads)
+            ] + [threading.Thread(target=_read_worker, args=(engine, deadline, reads)) for _ in range(args.readers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            latencies = sorted(l for worker, _ in results for l in worker)
+            errors = sum(e for _, e in results)
+            p50 = statistics.median(latencies) if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+            print(f"{profile:<12}{len(latencies) / args.seconds:>10.0f}{errors:>8}{p50:>9.1f}{p95:>9.1f}{len(reads) / args.seconds:>9.0f}")
+            if args.verbose:
+                print(f"  {pool_stats(engine)}")
+            if args.database_url:
+                SQLModel.metadata.drop_all(engine)
+            engine.dispose()
+
+
+# Must only be imported on first use, never by `import backend.main`
+HEAVY_MODULES = ["fpdf", "fastapi_mail", "apscheduler", "httpx", "jose", "PIL", "passlib", "zstandard"]
+
+IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import backend.main\n"
+    "elapsed = (time.perf_counter() - start) * 1000\n"
+    "print(json.dumps({'ms': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+) % HEAVY_MODULES
+
+
+def _wait_for(url, timeout, status=200):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == status:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_startup(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "FAST_STARTUP": "true"}
+    failures = []
+
+    samples, loaded = [], []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=root, env=env,
+                             capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        loaded = result["loaded"]
+    import_ms = statistics.median(samples)
+    print(f"import backend.main: p50 {import_ms:.0f} ms (min {min(samples):.0f}, max {max(samples):.0f})")
+    if loaded:
+        failures.append(f"heavy modules imported eagerly: {', '.join(loaded)}")
+    if args.max_import_ms and import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.0f} ms (limit {args.max_import_ms} ms)")
+
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not _wait_for(f"{base}/health/live", args.timeout):
+            failures.append("server did not answer /health/live")
+        else:
+            first_ms = (time.perf_counter() - start) * 1000
+            print(f"first request (/health/live): {first_ms:.0f} ms after spawn")
+            if args.max_first_request_ms and first_ms > args.max_first_request_ms:
+                failures.append(f"first request took {first_ms:.0f} ms (limit {args.max_first_request_ms} ms)")
+            if _wait_for(f"{base}/health/ready", args.timeout):
+                print(f"ready (/health/ready): {(time.perf_counter() - start) * 1000:.0f} ms after spawn")
+            else:
+                failures.append("server never became ready")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Survey backend micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_search = sub.add_parser("search", help="Full-text search latency")
+    p_search.add_argument("--rows", type=int, default=1000000)
+    p_search.add_argument("--repeat", type=int, default=20)
+    p_search.add_argument("--database-url", default="", help="Benchmark against an empty database instead of a temp SQLite file")
+    p_search.set_defaults(func=bench_search)
+
+    p_analytics = sub.add_parser("analytics", help="Dashboard aggregate latency and query plans")
+    p_analytics.add_argument("--rows", type=int, default=1000000)
+    p_analytics.add_argument("--repeat", type=int, default=5)
+    p_analytics.add_argument("--explain", action="store_true")
+    p_analytics.add_argument("--database-url", default="", help="Benchmark against an empty database instead of a temp SQLite file")
+    p_analytics.set_defaults(func=bench_analytics)
+
+    p_serialize = sub.add_parser("serialize", help="/admin/reports JSON encoding: Pydantic path vs lean tuples + orjson")
+    p_serialize.add_argument("--rows", type=int, default=10000)
+    p_serialize.add_argument("--repeat", type=int, default=10)
+    p_serialize.add_argument("--photos", action="store_true", help="Store a photo on every 10th row")
+    p_serialize.set_defaults(func=bench_serialize)
+
+    p_writes = sub.add_parser("writes", help="Concurrent write throughput per engine profile")
+    p_writes.add_argument("--profiles", default="sqlite,default", help="Comma separated DB_PROFILE values")
+    p_writes.add_argument("--threads", type=int, default=8)
+    p_writes.add_argument("--readers", type=int, default=2, help="Concurrent dashboard-style readers")
+    p_writes.add_argument("--seconds", type=float, default=5)
+    p_writes.add_argument("--database-url", default="", help="Empty database to use instead of a temp SQLite file (tables are dropped afterwards)")
+    p_writes.add_argument("--verbose", action="store_true", help="Print pool statistics per profile")
+    p_writes.set_defaults(func=bench_writes)
+
+    p_startup = sub.add_parser("startup", help="Import time and time to first request (fails on regressions)")
+    p_startup.add_argument("--repeat", type=int, default=5)
+    p_startup.add_argument("--max-import-ms", type=float, default=0, help="Fail if median import time exceeds this")
+    p_startup.add_argument("--max-first-request-ms", type=float, default=0)
+    p_startup.add_argument("--timeout", type=float, default=30)
+    p_startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Namespaces invalidated by writes
+REPORTS = "reports" # Anything derived from the feedback table (reports, search, analytics)
+IMAGES = "images" # Photo bytes by feedback ID
+
+
+class ResponseCache:
+    """
+    In-process LRU of serialized responses, bounded by total bytes.
+    Keys embed a version per namespace; invalidating a namespace bumps its version so old
+    entries are never served again and age out of the LRU. With CACHE_BACKEND=database the
+    versions live in the shared database, so a write on one worker invalidates all workers.
+
+    Results read from a replica are not cached for REPLICA_MAX_LAG_SECONDS after their namespace
+    was invalidated: the replica may not have the write yet, and the entry would outlive the lag.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict() # key -> (body, expires_at)
+        self.size = 0
+        self.versions = {}
+        self.invalidated_at = {} # namespace -> time.time() of the latest invalidation seen
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes_served": 0, "replica_skips": 0}
+
+    def _version(self, namespace: str) -> int:
+        if settings.CACHE_BACKEND == "database":
+            from .database import engine
+            from .models import CacheVersion
+            with Session(engine) as session:
+                row = session.get(CacheVersion, namespace)
+            if row and row.invalidated_at:
+                self.invalidated_at[namespace] = (row.invalidated_at - datetime(1970, 1, 1)).total_seconds()
+            return row.version if row else 0
+        return self.versions.get(namespace, 0)
+
+    def make_key(self, namespace: str, **params) -> str:
+        """Builds a key from the namespace version and the normalized (sorted, non-empty) query."""
+        query = "&".join(f"{k}={params[k]}" for k in sorted(params) if params[k] is not None)
+        return f"{namespace}:{self._version(namespace)}:{query}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not settings.CACHE_ENABLED:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["bytes_served"] += len(entry[0])
+                return entry[0]
+            if entry:
+                self._remove(key)
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, body: bytes, source: str = "primary"):
+        """source is read_source() of the session the body was built from."""
+        if not settings.CACHE_ENABLED or len(body) > self.max_bytes:
+            return
+        if source == "replica":
+            invalidated_at = self.invalidated_at.get(key.split(":", 1)[0])
+            if invalidated_at and time.time() - invalidated_at < settings.REPLICA_MAX_LAG_SECONDS:
+                self.stats["replica_skips"] += 1
+                return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (body, time.monotonic() + self.ttl)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        body, _ = self.entries.pop(key)
+        self.size -= len(body)
+
+    def invalidate(self, *namespaces: str):
+        """Called after a committed write; entries of these namespaces are never served again."""
+        for namespace in namespaces:
+            self.stats["invalidations"] += 1
+            if settings.CACHE_BACKEND == "database":
+                try:
+                    self._bump_shared(namespace)
+                except Exception as e:
+                    logger.error(f"Failed to invalidate shared cache namespace {namespace}: {e}")
+            with self.lock:
+                self.versions[namespace] = self.versions.get(namespace, 0) + 1
+                self.invalidated_at[namespace] = time.time()
+                prefix = f"{namespace}:"
+                for key in [k for k in self.entries if k.startswith(prefix)]:
+                    self._remove(key)
+
+    def _bump_shared(self, namespace: str):
+        from .database import engine
+        from .models import CacheVersion
+        with Session(engine) as session:
+            now = datetime.utcnow()
+            result = session.execute(
+                update(CacheVersion)
+                .where(CacheVersion.namespace == namespace)
+                .values(version=CacheVersion.version + 1, invalidated_at=now)
+            )
+            if not result.rowcount:
+                try:
+                    session.add(CacheVersion(namespace=namespace, version=1, invalidated_at=now))
+                    session.commit()
+                except IntegrityError:
+                    # Created concurrently by another worker
+                    session.rollback()
+                    session.execute(
+                        update(CacheVersion)
+                        .where(CacheVersion.namespace == namespace)
+                        .values(version=CacheVersion.version + 1, invalidated_at=now)
+                    )
+                    session.commit()
+            else:
+                session.commit()
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "backend": settings.CACHE_BACKEND,
+        }
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=settings.CACHE_TTL_SECONDS,
+)
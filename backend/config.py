@@ -6,6 +6,22 @@ class Settings(BaseSettings):
     ADMIN_USERNAME: str
     ADMIN_PASSWORD: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Database engine profile: auto (sqlite or postgres from DATABASE_URL), sqlite, postgres,
+    # pgbouncer (transaction pooling) or default (untuned)
+    DB_PROFILE: str = "auto"
+    SQLITE_WAL: bool = True # Disable on network filesystems, where WAL doesn't work
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_LOOP_WRITE_WAIT_MS: int = 50 # Max wait for the writer queue on the event loop thread, then 503
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_MB: int = 128
+    DB_POOL_SIZE: int = 5 # With pgbouncer, 0 opens a bouncer connection per checkout
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30 # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 300
+    DB_CONNECT_TIMEOUT: int = 10
+    DB_STATEMENT_TIMEOUT_MS: int = 30000 # 0 disables
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS: int = 60000 # 0 disables; ignored with pgbouncer
     ALGORITHM: str = "HS256"
     
     MAIL_USERNAME: str
@@ -16,12 +32,116 @@ class Settings(BaseSettings):
     MAIL_FROM_NAME: str
     MAIL_TO: str
     
+    # Admission control for /feedback/ and the WhatsApp webhook
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_BACKEND: str = "memory" # memory (per worker) or database (shared)
+    RATE_LIMIT_PHONE_PER_MINUTE: float = 6
+    RATE_LIMIT_PHONE_BURST: int = 3
+    RATE_LIMIT_WHATSAPP_PER_MINUTE: float = 30
+    RATE_LIMIT_WHATSAPP_BURST: int = 10
+    RATE_LIMIT_IP_PER_MINUTE: float = 60
+    RATE_LIMIT_IP_BURST: int = 20
+    RATE_LIMIT_UPLOAD_CHUNKS_PER_MINUTE: float = 600 # Chunked photo uploads, per IP
+    RATE_LIMIT_UPLOAD_CHUNKS_BURST: int = 120 # Three full-size photos
+    # Peers whose X-Forwarded-For is believed (comma separated IPs/CIDRs); the default covers
+    # private-network load balancers such as Render's and HF Spaces'
+    TRUSTED_PROXIES: str = "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7"
+    UPLOAD_MAX_CONCURRENCY: int = 8 # Concurrent upload requests per worker
+    UPLOAD_QUEUE_TARGET_MS: int = 2000 # Shed load if a request waits longer than this for a slot
+    UPLOAD_RETRY_AFTER_SECONDS: int = 5
+
+    # Background job queue
+    JOB_WORKER_EMBEDDED: bool = True # Run a queue worker inside the web process; disable when running backend.worker
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 300 # A running job is retried if not finished within this
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF_SECONDS: int = 10
+
+    # Archival of old feedback into compressed segment files (0 disables)
+    ARCHIVE_AFTER_DAYS: int = 0
+    ARCHIVE_DIR: str = "archive" # Must be on persistent storage
+    ARCHIVE_BATCH_SIZE: int = 2000 # Records per segment
+    ARCHIVE_INTERVAL_MINUTES: int = 1440
+
+    # Response cache for admin read endpoints
+    CACHE_ENABLED: bool = True
+    CACHE_BACKEND: str = "database" # database (shared invalidation across workers) or memory (single process only)
+    CACHE_MAX_MB: int = 64
+    CACHE_TTL_SECONDS: int = 300
+    WEB_CONCURRENCY: int = 1 # Web processes (gunicorn --workers); a memory cache with more logs a warning at startup
+
+    # Duplicate submission protection for /feedback/
+    IDEMPOTENCY_TTL_HOURS: int = 24 # How long an Idempotency-Key replays the original response
+    IDEMPOTENCY_LOCK_SECONDS: int = 60 # A retry during this window gets 409 while the first is processing
+    DUPLICATE_WINDOW_SECONDS: int = 300 # Identical submissions (no key) within this are treated as retries
+
+    # Negative feedback alerts: sliding-window rules, ';' separated (see alerts.py)
+    # ro:negatives>=3/30m = 3+ negatives at one RO within 30 minutes
+    # ro:rate>40%/50 = more than 40% of an RO's last 50 feedbacks negative
+    ALERT_RULES: str = "ro:negatives>=3/30m; ro:rate>40%/50; facility:negatives>=10/60m"
+    ALERT_COOLDOWN_MINUTES: int = 120 # Per rule and RO/facility, after an alert
+    ALERT_EVERY_NEGATIVE: bool = False # Also send the per-feedback negative report email
+
+    # Reused photo detection (perceptual hashes, see photo_index.py)
+    PHOTO_MATCH_DISTANCE: int = 6 # Max differing bits (of 64) for two photos to count as the same
+    PHOTO_BACKFILL_BATCH_SIZE: int = 200 # Feedback rows hashed per backfill job
+
+    # Tracing (spans for requests, queue jobs, DB, Meta API and SMTP; see tracing.py)
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATE: float = 1.0 # Fraction of new traces recorded
+    TRACING_FILE: str = "logs/traces.jsonl" # JSON lines, one span per line ("" to disable)
+    TRACING_OTLP_ENDPOINT: str = "" # e.g. http://localhost:4318/v1/traces for a local collector
+    TRACING_SERVICE_NAME: str = "feedback-backend"
+    TRACING_DB_STATEMENTS: bool = True # A span per SQL statement, not just per commit
+
+    # Bulk import of historical feedback (/admin/import, python -m backend.import_feedback)
+    IMPORT_DIR: str = "imports" # Uploaded files wait here until their import finishes
+    IMPORT_BATCH_SIZE: int = 5000 # Rows per INSERT/COPY and per checkpoint
+    IMPORT_SLICE_SECONDS: int = 120 # A worker job imports this long, then queues the rest (< JOB_VISIBILITY_TIMEOUT_SECONDS)
+
+    # Resumable photo uploads (the form downscales to IMAGE_MAX_EDGE/IMAGE_QUALITY first)
+    UPLOAD_CHUNK_BYTES: int = 256 * 1024
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024 # Per photo
+    UPLOAD_EXPIRY_HOURS: int = 24 # Unfinished/unused uploads are deleted after this
+    UPLOAD_MAX_PENDING: int = 12 # Uploads started but not yet submitted, per IP
+    UPLOAD_MAX_PENDING_BYTES: int = 60 * 1024 * 1024 # Declared bytes of those uploads, per IP
+
+    # Read replicas for dashboard/report queries (comma separated URLs; empty = primary only)
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_HEALTH_CHECK_SECONDS: int = 30
+    REPLICA_MAX_LAG_SECONDS: float = 30 # Postgres replicas further behind are skipped
+    READ_YOUR_WRITES_SECONDS: int = 10 # Admin reads stay on the primary this long after a write
+
+    # Frontend assets are fingerprinted and served precompressed (brotli if installed, gzip)
+    STATIC_PRECOMPRESS: bool = True
+
+    # Cold start: serve immediately and run schema checks in the background (see /health/ready)
+    FAST_STARTUP: bool = False
+    STARTUP_DB_RETRY_SECONDS: int = 5 # Delay between schema attempts while the database wakes up
+
+    ANALYTICS_TIMEZONE: str = "Asia/Kolkata" # Default bucket boundaries for /admin/analytics
+
     REPORT_INTERVAL_MINUTES: int = 1440 # Default to 24 hours if not set
 
+    # Scheduler leadership (only one worker runs scheduled jobs)
+    SCHEDULER_POLL_SECONDS: int = 60
+    SCHEDULER_LEASE_SECONDS: int = 180 # Lease expiry for non-Postgres databases
+    SCHEDULER_JOB_TIMEOUT_SECONDS: int = 1800 # A run still 'running' after this is taken over
+    SCHEDULER_MAX_CATCHUP: int = 7 # Max missed intervals to run after downtime
+
     WHATSAPP_TOKEN: str = ""
     WHATSAPP_PHONE_ID: str = ""
     ENABLE_WHATSAPP: bool = False
 
+    # Image normalization on ingest
+    IMAGE_NORMALIZE: bool = True
+    IMAGE_MAX_EDGE: int = 1600 # Longest edge in pixels
+    IMAGE_FORMAT: str = "JPEG" # JPEG or WEBP
+    IMAGE_QUALITY: int = 80
+    IMAGE_POOL: str = "thread" # thread or process
+    IMAGE_WORKERS: int = 2
+
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
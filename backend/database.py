@@ -1,20 +1,174 @@
-from sqlmodel import SQLModel, create_engine, Session
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import event, inspect, text
+from sqlmodel import SQLModel, Session
 from .config import settings
+from .engine_profiles import create_profiled_engine, pool_stats
+from .search import register_sqlite_functions, create_search_index
+from .tracing import instrument_engine
+from .logger import get_logger
 
-connect_args = {}
-if "sqlite" in settings.DATABASE_URL:
-    connect_args["check_same_thread"] = False
+logger = get_logger(__name__)
 
-# Fix for some platforms (like Render/Neon) using postgres:// which SQLAlchemy doesn't like
-database_url = settings.DATABASE_URL
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+# Pooling, pragmas and timeouts come from DB_PROFILE (see engine_profiles.py)
+engine = create_profiled_engine(settings.DATABASE_URL)
 
-engine = create_engine(database_url, connect_args=connect_args, pool_pre_ping=True, pool_recycle=300)
+# Read-only copies of the primary for dashboard/report queries (optional)
+replica_engines = [
+    create_profiled_engine(url.strip())
+    for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()
+]
+
+def _register_sqlite_functions(db_engine):
+    # Helper functions used by the full-text search triggers
+    @event.listens_for(db_engine, "connect")
+    def _on_sqlite_connect(dbapi_connection, connection_record):
+        register_sqlite_functions(dbapi_connection)
+
+for _engine in [engine] + replica_engines:
+    if _engine.dialect.name == "sqlite":
+        _register_sqlite_functions(_engine)
+    instrument_engine(_engine)
+
+# Cookie set after an admin write; reads go to the primary until it expires
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+
+class ReplicaRouter:
+    """
+    Picks a replica for read-only work, round robin over the healthy ones. Each replica is
+    pinged (and, on Postgres, checked for replay lag) at most every REPLICA_HEALTH_CHECK_SECONDS;
+    if none is healthy, reads fall back to the primary.
+    """
+
+    def __init__(self, replicas):
+        self.replicas = [{"engine": e, "healthy": True, "checked_at": 0.0, "lag": None, "error": None} for e in replicas]
+        self.next = 0
+        self.lock = threading.Lock()
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "fallbacks": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def _check(self, replica):
+        try:
+            with replica["engine"].connect() as conn:
+                # Also catches a replica that is reachable but has no schema yet
+                conn.execute(text("SELECT 1 FROM feedback LIMIT 1"))
+                lag = None
+                if conn.dialect.name == "postgresql":
+                    # NULL on a primary or before anything has been replayed
+                    lag = conn.execute(text(
+                        "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                    )).scalar()
+            replica["lag"] = float(lag) if lag is not None else None
+            too_far_behind = lag is not None and lag > settings.REPLICA_MAX_LAG_SECONDS
+            replica["error"] = f"lag {lag:.1f}s" if too_far_behind else None
+            healthy = not too_far_behind
+        except Exception as e:
+            replica["error"] = str(e)
+            healthy = False
+        if healthy != replica["healthy"]:
+            name = replica["engine"].url.render_as_string(hide_password=True)
+            logger.warning(f"Replica {name} is {'healthy again' if healthy else 'unhealthy: ' + replica['error']}")
+        replica["healthy"] = healthy
+        replica["checked_at"] = time.monotonic()
+
+    def read_engine(self):
+        if not self.replicas:
+            return engine
+        now = time.monotonic()
+        for replica in self.replicas:
+            if now - replica["checked_at"] >= settings.REPLICA_HEALTH_CHECK_SECONDS:
+                with self.lock:
+                    if now - replica["checked_at"] >= settings.REPLICA_HEALTH_CHECK_SECONDS:
+                        self._check(replica)
+        healthy = [r for r in self.replicas if r["healthy"]]
+        if not healthy:
+            self.stats["fallbacks"] += 1
+            return engine
+        self.next = (self.next + 1) % len(healthy)
+        self.stats["replica_reads"] += 1
+        return healthy[self.next]["engine"]
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "replicas": [
+                {**pool_stats(r["engine"]), "healthy": r["healthy"], "lag_seconds": r["lag"], "error": r["error"]}
+                for r in self.replicas
+            ],
+        }
+
+
+replicas = ReplicaRouter(replica_engines)
+
+
+def read_engine():
+    """Engine for read-only work that tolerates replica lag (reports, exports)."""
+    return replicas.read_engine()
+
+
+def pin_to_primary(response):
+    """Called after an admin write so the same browser reads its own writes."""
+    if replicas.enabled:
+        response.set_cookie(
+            PRIMARY_PIN_COOKIE,
+            str(int(time.time() + settings.READ_YOUR_WRITES_SECONDS)),
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="strict",
+        )
+
+
+def _pinned(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_source(session: Session) -> str:
+    """'primary' or 'replica'; part of cache keys so pinned reads never get replica-built entries."""
+    return "primary" if session.get_bind() is engine else "replica"
+
+
+def _add_missing_columns_and_indexes(db_engine):
+    # create_all only creates missing tables; bring existing ones up to date with
+    # nullable columns and indexes added since they were created
+    inspector = inspect(db_engine)
+    existing_tables = set(inspector.get_table_names())
+    with db_engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=db_engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def create_db_and_tables():
+    from . import models  # noqa: F401 - registers every table on the metadata
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns_and_indexes(engine)
+    create_search_index(engine)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def get_read_session(request: Request):
+    """Session for read-only endpoints: a healthy replica, or the primary if pinned/unavailable."""
+    if _pinned(request) or not replicas.enabled:
+        replicas.stats["primary_reads"] += 1
+        bind = engine
+    else:
+        bind = replicas.read_engine()
+    with Session(bind) as session:
+        yield session
@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import time
+import weakref
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# sqlite: WAL + pragmas + in-process writer queue
+# postgres: sized pool with statement/idle timeouts set at connect
+# pgbouncer: postgres behind PgBouncer in transaction mode (no startup options or session state)
+# default: the original settings (pre_ping + recycle only), kept for comparison
+PROFILES = ("sqlite", "postgres", "pgbouncer", "default")
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+_engine_info = weakref.WeakKeyDictionary() # engine -> {"profile", "counters", "writer_queue"}
+
+
+def normalize_url(url: str) -> str:
+    # Fix for some platforms (like Render/Neon) using postgres:// which SQLAlchemy doesn't like
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def resolve_profile(url: str, profile: str = None) -> str:
+    profile = (profile or settings.DB_PROFILE).lower()
+    if profile == "auto":
+        return "sqlite" if url.startswith("sqlite") else "postgres"
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE '{profile}', expected auto or one of {', '.join(PROFILES)}")
+    return profile
+
+
+class WriterQueueBusy(RuntimeError):
+    """A write on the event loop thread found the SQLite writer queue busy (answered with a 503)."""
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class SQLiteWriterQueue:
+    """
+    SQLite allows one writer at a time. Rather than letting threads race for the file lock and
+    fail with "database is locked" once busy_timeout runs out, a connection takes this lock before
+    its first write statement and holds it until it goes back to the pool (after commit/rollback),
+    so writers in this process queue up in order. Other processes are still covered by busy_timeout.
+
+    Async endpoints and jobs that use a sync Session write on the event loop thread, where
+    waiting would stall every other request: there the wait is capped at loop_timeout, then
+    WriterQueueBusy is raised instead of blocking.
+    """
+
+    def __init__(self, timeout_seconds: float, loop_timeout_seconds: float = 0.0):
+        self.timeout = timeout_seconds
+        self.loop_timeout = loop_timeout_seconds
+        self.lock = threading.Lock()
+        self.owner = None # (thread id, id of the connection's info dict)
+        self.stats = {"writes": 0, "waits": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0, "timeouts": 0, "loop_busy": 0}
+
+    def acquire(self, info: dict):
+        if info.get("writer"):
+            return
+        thread_id = threading.get_ident()
+        if self.owner and self.owner[0] == thread_id:
+            # Another connection on this same thread is mid-transaction and can't release while we
+            # wait. On the event loop (another coroutine's session), SQLite's busy handler would
+            # block the loop until busy_timeout and then fail anyway: give up right away
+            if _on_event_loop():
+                self.stats["loop_busy"] += 1
+                raise WriterQueueBusy("SQLite writer queue held by another connection on the event loop thread")
+            # Elsewhere, fall back to SQLite's own busy handling
+            return
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking=False)
+        on_loop = False
+        if not acquired:
+            self.stats["waits"] += 1
+            on_loop = _on_event_loop()
+            acquired = self.lock.acquire(timeout=self.loop_timeout if on_loop else self.timeout)
+        waited = (time.perf_counter() - start) * 1000
+        self.stats["wait_ms_total"] += waited
+        self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], waited)
+        if not acquired and on_loop:
+            self.stats["loop_busy"] += 1
+            raise WriterQueueBusy(f"SQLite writer queue busy for {waited:.0f} ms on the event loop thread")
+        if not acquired:
+            self.stats["timeouts"] += 1
+            logger.warning(f"SQLite writer queue wait exceeded {self.timeout}s, writing without it")
+            return
+        self.stats["writes"] += 1
+        self.owner = (thread_id, id(info))
+        info["writer"] = True
+
+    def release(self, info: dict):
+        if info.pop("writer", False):
+            self.owner = None
+            self.lock.release()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "busy": self.lock.locked()}
+
+
+def _sqlite_engine(url: str):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_pre_ping=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            # Readers no longer block the writer (and vice versa); persistent in the database file
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        # NORMAL is durable in WAL mode except for the last commits on power loss
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_MB * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    queue = SQLiteWriterQueue(settings.SQLITE_BUSY_TIMEOUT_MS / 1000, settings.SQLITE_LOOP_WRITE_WAIT_MS / 1000)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _queue_writer(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(WRITE_PREFIXES):
+            # The proxied connection shares its info dict with the pool record released below
+            queue.acquire(conn.connection.info)
+
+    @event.listens_for(engine.pool, "checkin")
+    def _release_writer(dbapi_connection, connection_record):
+        queue.release(connection_record.info)
+
+    @event.listens_for(engine.pool, "invalidate")
+    def _release_invalidated(dbapi_connection, connection_record, exception):
+        queue.release(connection_record.info)
+
+    return engine, queue
+
+
+def _postgres_engine(url: str, pgbouncer: bool):
+    connect_args = {"connect_timeout": settings.DB_CONNECT_TIMEOUT}
+    options = []
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        options.append(f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}")
+    if settings.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS:
+        options.append(f"-c idle_in_transaction_session_timeout={settings.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS}")
+    if options and not pgbouncer:
+        connect_args["options"] = " ".join(options)
+
+    kwargs = {"pool_pre_ping": True}
+    if pgbouncer and settings.DB_POOL_SIZE <= 0:
+        # PgBouncer does the pooling; open a (cheap) bouncer connection per checkout
+        kwargs["poolclass"] = NullPool
+    else:
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            # LIFO keeps the hot connections busy so idle ones can expire server side
+            pool_use_lifo=True,
+        )
+    engine = create_engine(url, connect_args=connect_args, **kwargs)
+
+    if pgbouncer and settings.DB_STATEMENT_TIMEOUT_MS:
+        # Transaction pooling rejects startup options and loses session SETs, so scope it to each transaction
+        @event.listens_for(engine, "begin")
+        def _set_local_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+
+    return engine
+
+
+def create_profiled_engine(url: str, profile: str = None):
+    """Creates an engine tuned for the configured (or given) profile. See PROFILES."""
+    url = normalize_url(url)
+    profile = resolve_profile(url, profile)
+    queue = None
+    if profile == "sqlite":
+        engine, queue = _sqlite_engine(url)
+    elif profile in ("postgres", "pgbouncer"):
+        engine = _postgres_engine(url, pgbouncer=profile == "pgbouncer")
+    else:
+        connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+        engine = create_engine(url, connect_args=connect_args, pool_pre_ping=True, pool_recycle=300)
+
+    counters = {"connects": 0, "checkouts": 0, "invalidations": 0}
+
+    @event.listens_for(engine.pool, "connect")
+    def _count_connect(dbapi_connection, connection_record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine.pool, "checkout")
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+
+    @event.listens_for(engine.pool, "invalidate")
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        counters["invalidations"] += 1
+
+    _engine_info[engine] = {"profile": profile, "counters": counters, "writer_queue": queue}
+    logger.info(f"Database engine created with profile '{profile}' ({engine.dialect.name})")
+    return engine
+
+
+def engine_profile(engine) -> str:
+    info = _engine_info.get(engine)
+    return info["profile"] if info else "default"
+
+
+def pool_stats(engine) -> dict:
+    info = _engine_info.get(engine, {})
+    pool = engine.pool
+    stats = {
+        "profile": info.get("profile", "default"),
+        "dialect": engine.dialect.name,
+        "pool": type(pool).__name__,
+        **info.get("counters", {}),
+    }
+    # QueuePool exposes its sizing; NullPool/StaticPool don't
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    if info.get("writer_queue"):
+        stats["writer_queue"] = info["writer_queue"].get_stats()
+    return stats
@@ -0,0 +1,20 @@
+from sqlmodel import or_
+from .models import Feedback, FeedbackFilter
+
+
+def filter_conditions(f: FeedbackFilter) -> list:
+    """Translates a FeedbackFilter into SQL WHERE clauses on the Feedback table."""
+    conditions = []
+    if f.status:
+        conditions.append(Feedback.status == f.status)
+    if f.feedback_method:
+        conditions.append(Feedback.feedback_method == f.feedback_method)
+    if f.ro_number:
+        conditions.append(Feedback.ro_number == f.ro_number)
+    if f.created_from:
+        conditions.append(Feedback.created_at >= f.created_from)
+    if f.created_to:
+        conditions.append(Feedback.created_at < f.created_to)
+    if f.negative_only:
+        conditions.append(or_(Feedback.rating_air == 1, Feedback.rating_washroom == 1))
+    return conditions
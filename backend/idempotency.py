@@ -0,0 +1,170 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from .database import engine
+from .models import IdempotencyRecord
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 200
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def header_key(value: str) -> str:
+    return f"key:{value.strip()[:MAX_KEY_LENGTH]}"
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of the fields that identify a submission (phone, ratings, photo hashes...)."""
+    raw = json.dumps([p if p is not None else "" for p in parts], separators=(",", ":"))
+    return "fp:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def claim(key: str) -> tuple:
+    """
+    Claims a key before the request is processed. Returns ("new", None) if this request should
+    proceed, ("done", record) to replay the stored response, or ("in_progress", record) while
+    another request with the same key is still running.
+    """
+    now = datetime.utcnow()
+    locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    expires_at = now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    with Session(engine) as session:
+        try:
+            session.add(IdempotencyRecord(key=key, locked_until=locked_until, expires_at=expires_at))
+            session.commit()
+            return "new", None
+        except IntegrityError:
+            session.rollback()
+        record = session.get(IdempotencyRecord, key)
+        if record is None:
+            return "new", None
+        if record.status == "done" and record.expires_at > now:
+            return "done", record
+        if record.status == "pending" and record.locked_until and record.locked_until > now:
+            return "in_progress", record
+        # Expired, or a pending claim whose request died: take it over
+        result = session.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key, IdempotencyRecord.locked_until == record.locked_until)
+            .values(status="pending", response=None, feedback_id=None, locked_until=locked_until, expires_at=expires_at)
+        )
+        session.commit()
+        return ("new", None) if result.rowcount else ("in_progress", record)
+
+
+def release(key: str):
+    """Drops a pending claim after a failed request so the client can retry straight away."""
+    with Session(engine) as session:
+        session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.key == key, IdempotencyRecord.status == "pending")
+        )
+        session.commit()
+
+
+def find_done(session: Session, key: str) -> Optional[IdempotencyRecord]:
+    record = session.get(IdempotencyRecord, key)
+    if record and record.status == "done" and record.expires_at > datetime.utcnow():
+        return record
+    return None
+
+
+def record_response(session: Session, key: str, feedback_id: int, body: str, ttl_seconds: int):
+    """
+    Stores the response for a key in the caller's transaction, so the key and the feedback it
+    created are committed together (a crash can't leave one without the other).
+    """
+    now = datetime.utcnow()
+    values = dict(status="done", feedback_id=feedback_id, response=body, locked_until=None,
+                  expires_at=now + timedelta(seconds=ttl_seconds))
+    result = session.execute(update(IdempotencyRecord).where(IdempotencyRecord.key == key).values(**values))
+    if not result.rowcount:
+        session.add(IdempotencyRecord(key=key, **values))
+
+
+def replay(record: IdempotencyRecord) -> Response:
+    return Response(
+        content=record.response,
+        media_type="application/json",
+        headers={REPLAY_HEADER: "true"},
+    )
+
+
+def delete_expired() -> int:
+    with Session(engine) as session:
+        count = session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.expires_at < datetime.utcnow())
+        ).rowcount
+        session.commit()
+    if count:
+        logger.info(f"Deleted {count} expired idempotency records")
+    return count
+
+
+class IdempotencyMiddleware:
+    """
+    For POSTs carrying an Idempotency-Key header on the given paths: replays the stored response
+    of a completed request without reading the (multipart) body, and answers 409 while the first
+    request is still being processed. The endpoint records the response (see record_response);
+    a failed request releases its claim.
+    """
+
+    def __init__(self, app, paths: Optional[list] = None):
+        self.app = app
+        self.paths = set(paths or [])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        value = next((v.decode("latin-1") for k, v in scope["headers"] if k == HEADER.encode()), None)
+        if not value or not value.strip():
+            await self.app(scope, receive, send)
+            return
+
+        key = header_key(value)
+        try:
+            state, record = await run_in_threadpool(claim, key)
+        except Exception as e:
+            # The key store being down shouldn't block submissions
+            logger.error(f"Idempotency claim failed for {key}: {e}")
+            await self.app(scope, receive, send)
+            return
+
+        if state == "done":
+            logger.info(f"Replaying response for {key} (feedback {record.feedback_id})")
+            await replay(record)(scope, receive, send)
+            return
+        if state == "in_progress":
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still being processed"},
+                status_code=409,
+                headers={"Retry-After": "2"},
+            )
+            await response(scope, receive, send)
+            return
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status.get("code", 500) >= 400:
+                try:
+                    await run_in_threadpool(release, key)
+                except Exception as e:
+                    logger.error(f"Failed to release idempotency key {key}: {e}")
@@ -0,0 +1,135 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from .config import settings
+from .tracing import span
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+_executor = None
+_pil_loaded = False
+
+
+def _load_pil():
+    """Imports Pillow on first use (keeps startup fast) and enables optional HEIC support."""
+    global _pil_loaded
+    if not _pil_loaded:
+        # HEIC/HEIF support is optional (iOS uploads)
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+        except ImportError:
+            pass
+        _pil_loaded = True
+
+MEDIA_TYPES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG": "image/png",
+    b"GIF8": "image/gif",
+}
+
+
+def image_media_type(data: bytes) -> str:
+    """Sniffs the stored image format so it can be served with the right Content-Type."""
+    for magic, media_type in MEDIA_TYPES.items():
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def normalize_image(data: bytes) -> bytes:
+    """
+    Applies EXIF orientation, caps the longest edge and re-encodes at the configured
+    format/quality. Metadata (EXIF, GPS, ICC comments) is dropped by re-encoding.
+    Returns the original bytes if they can't be decoded as an image.
+    """
+    _load_pil()
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            max_edge = settings.IMAGE_MAX_EDGE
+            if max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            fmt = settings.IMAGE_FORMAT.upper()
+            if fmt == "JPEG" and img.mode != "RGB":
+                # JPEG has no alpha channel - flatten transparent screenshots onto white
+                if img.mode in ("RGBA", "LA", "P"):
+                    img = img.convert("RGBA")
+                    background = Image.new("RGB", img.size, (255, 255, 255))
+                    background.paste(img, mask=img.split()[-1])
+                    img = background
+                else:
+                    img = img.convert("RGB")
+
+            out = io.BytesIO()
+            if fmt == "WEBP":
+                img.save(out, format="WEBP", quality=settings.IMAGE_QUALITY, method=4)
+            else:
+                img.save(out, format="JPEG", quality=settings.IMAGE_QUALITY, optimize=True, progressive=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning(f"Could not normalize image ({len(data)} bytes), storing as received: {e}")
+        return data
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if settings.IMAGE_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image")
+    return _executor
+
+
+async def normalize_image_async(data: Optional[bytes]) -> Optional[bytes]:
+    """Runs normalize_image in the worker pool so large decodes don't block the event loop."""
+    if not data or not settings.IMAGE_NORMALIZE:
+        return data
+    loop = asyncio.get_running_loop()
+    with span("image.normalize", **{"image.input_bytes": len(data), "image.pool": settings.IMAGE_POOL}) as s:
+        result = await loop.run_in_executor(_get_executor(), normalize_image, data)
+        s.set_attribute("image.output_bytes", len(result))
+    logger.info(f"Image normalized: {len(data)} -> {len(result)} bytes")
+    return result
+
+
+HASH_SIZE = 8 # 8x8 gradient bits = 64-bit hash
+
+
+def photo_hash(data: bytes) -> Optional[int]:
+    """
+    64-bit difference hash (dHash) of a photo: brightness gradients of a 9x8 grayscale thumbnail.
+    Survives re-encoding, resizing and small edits, so the same photo submitted twice hashes
+    within a few bits. Returned signed so it fits a BIGINT column. None if it isn't an image.
+    """
+    _load_pil()
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # Lets JPEG decode at 1/8 scale; the hash only needs a few pixels
+            img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            pixels = list(img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.warning(f"Could not hash image ({len(data)} bytes): {e}")
+        return None
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+async def photo_hash_async(data: Optional[bytes]) -> Optional[int]:
+    if not data:
+        return None
+    loop = asyncio.get_running_loop()
+    with span("image.hash", **{"image.input_bytes": len(data)}):
+        return await loop.run_in_executor(_get_executor(), photo_hash, data)
@@ -0,0 +1,79 @@
+"""
+Bulk import of historical feedback (paper forms, old kiosks) from CSV or NDJSON.
+
+Usage:
+    python -m backend.import_feedback feedback.csv --photos photos.zip
+    python -m backend.import_feedback --resume <import id>
+
+Columns: phone, rating_air, rating_washroom, comment, ro_number, created_at (ISO 8601),
+status, resolved_at, is_testimonial, terms_accepted, feedback_method and photo_air /
+photo_washroom / photo_receipt (file names inside the --photos zip). Rows are validated like
+the feedback form; invalid rows are skipped and reported. No WhatsApp messages, alerts or
+reports are sent for imported rows. Progress is checkpointed after every batch, so an
+interrupted import continues where it stopped with --resume.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from sqlmodel import Session
+from .database import engine, create_db_and_tables
+from .importer import FORMATS, ImportConflict, create_import, run_import
+from .config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical feedback from CSV/NDJSON")
+    parser.add_argument("file", nargs="?", help="CSV or NDJSON file (.gz allowed)")
+    parser.add_argument("--photos", help="Zip with the photos named in the photo_* columns")
+    parser.add_argument("--format", choices=FORMATS, help="Override detection by file extension")
+    parser.add_argument("--resume", metavar="IMPORT_ID", help="Continue an interrupted import")
+    parser.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    if not args.file and not args.resume:
+        parser.error("give a file to import or --resume IMPORT_ID")
+
+    create_db_and_tables()
+    if args.resume:
+        import_id = args.resume
+    else:
+        with Session(engine) as session:
+            run = create_import(
+                session,
+                os.path.abspath(args.file),
+                os.path.abspath(args.photos) if args.photos else None,
+                args.format,
+            )
+            import_id = run.id
+        print(f"Import {import_id} started (resume with --resume {import_id})")
+
+    started = time.monotonic()
+    first_row = None
+
+    def progress(run):
+        nonlocal first_row
+        if first_row is None:
+            first_row = run.rows_done - run.imported - run.rejected
+        elapsed = time.monotonic() - started
+        rate = (run.rows_done - first_row) / elapsed * 60 if elapsed else 0
+        print(f"  {run.rows_done} rows: {run.imported} imported, {run.rejected} rejected ({rate:,.0f} rows/min)", flush=True)
+
+    try:
+        run = run_import(import_id, progress=progress, batch_size=args.batch_size)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Resume with: python -m backend.import_feedback --resume {import_id}")
+        sys.exit(1)
+    except ImportConflict:
+        print(f"\nImport {import_id} is being run by another process (e.g. the job worker); stopped.")
+        sys.exit(1)
+
+    print(f"Done in {time.monotonic() - started:.1f}s: {run.imported} imported, {run.rejected} rejected")
+    if run.rejected:
+        print("First rejected rows:")
+        for error in json.loads(run.errors)[:20]:
+            print(f"  row {error['row']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
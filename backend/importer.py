@@ -0,0 +1,326 @@
+import csv
+import gzip
+import io
+import json
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import insert, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session
+from .database import engine
+from .models import Feedback, ImportRun
+from .validation import feedback_error
+from .images import normalize_image
+from .cache import response_cache, REPORTS
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+FORMATS = ("csv", "ndjson")
+PHOTO_FIELDS = ("photo_air", "photo_washroom", "photo_receipt")
+IMPORT_STATUSES = ("pending", "submitted", "resolved")
+RATINGS = (1, 2, 3)
+MAX_ERRORS = 100 # Row errors kept on the run; the rest are only counted
+
+# Inserted for every row, so a batch is one executemany (or one COPY) with the same columns
+COLUMNS = [
+    "phone", "is_testimonial", "rating_air", "rating_washroom", "comment", "terms_accepted",
+    "ro_number", "status", "feedback_method", "session_id", "created_at", "resolved_at",
+    *PHOTO_FIELDS,
+]
+
+
+class ImportConflict(RuntimeError):
+    """Another runner moved the run's checkpoint; this one stops without writing its batch."""
+
+
+def detect_format(filename: str) -> str:
+    name = filename.lower().removesuffix(".gz")
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    raise ValueError("Unsupported file type, expected .csv, .ndjson or .jsonl (optionally .gz)")
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def iter_records(path: str, fmt: str):
+    """Yields one dict per record, or the exception for a record that can't be parsed."""
+    with _open_text(path) as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield record if isinstance(record, dict) else ValueError("Record is not a JSON object")
+            except ValueError as e:
+                yield e
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _rating(record: dict, field: str) -> Optional[int]:
+    value = _text(record.get(field))
+    if value is None:
+        return None
+    try:
+        rating = int(float(value))
+    except ValueError:
+        raise ValueError(f"{field} must be a number")
+    if rating not in RATINGS:
+        raise ValueError(f"{field} must be 1, 2 or 3")
+    return rating
+
+
+def _bool(record: dict, field: str, default: bool) -> bool:
+    value = record.get(field)
+    if isinstance(value, bool):
+        return value
+    value = _text(value)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "y", "t")
+
+
+def _datetime(record: dict, field: str) -> Optional[datetime]:
+    value = _text(record.get(field))
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{field} must be an ISO 8601 date/time")
+    # Stored as naive UTC like everything else
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_record(record: dict, photos: Optional[zipfile.ZipFile], run_id: str, row_number: int) -> dict:
+    """Column values for one import record. Raises ValueError with the reason if it's invalid."""
+    phone = _text(record.get("phone")) or ""
+    rating_air = _rating(record, "rating_air")
+    rating_washroom = _rating(record, "rating_washroom")
+    # Paper/kiosk records were collected with consent, so terms default to accepted
+    terms_accepted = _bool(record, "terms_accepted", True)
+    error = feedback_error(phone, rating_air, rating_washroom, terms_accepted)
+    if error:
+        raise ValueError(error)
+
+    status = _text(record.get("status")) or "pending"
+    if status not in IMPORT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(IMPORT_STATUSES)}")
+    created_at = _datetime(record, "created_at") or datetime.utcnow()
+    resolved_at = _datetime(record, "resolved_at") or (created_at if status == "resolved" else None)
+
+    values = {
+        "phone": phone,
+        "is_testimonial": _bool(record, "is_testimonial", False),
+        "rating_air": rating_air,
+        "rating_washroom": rating_washroom,
+        "comment": _text(record.get("comment")),
+        "terms_accepted": terms_accepted,
+        "ro_number": _text(record.get("ro_number")) or _text(record.get("source_id")),
+        "status": status,
+        "feedback_method": _text(record.get("feedback_method")) or "import",
+        "session_id": f"import:{run_id}:{row_number}",
+        "created_at": created_at,
+        "resolved_at": resolved_at,
+    }
+    for field in PHOTO_FIELDS:
+        name = _text(record.get(field))
+        if name is None:
+            values[field] = None
+            continue
+        if photos is None:
+            raise ValueError(f"{field} refers to {name} but no photo archive was given")
+        try:
+            data = photos.read(name)
+        except KeyError:
+            raise ValueError(f"{field}: {name} not found in the photo archive")
+        values[field] = normalize_image(data) if settings.IMAGE_NORMALIZE else data
+    return values
+
+
+def _copy_value(value) -> str:
+    # COPY text format: \N for NULL, backslash escapes for the delimiter and line breaks
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def insert_rows(session: Session, rows: list):
+    """One round trip per batch: COPY on Postgres (psycopg2), executemany elsewhere."""
+    if not rows:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        dbapi_connection = session.connection().connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        if hasattr(cursor, "copy_expert"):
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write("\t".join(_copy_value(row[c]) for c in COLUMNS))
+                buffer.write("\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY feedback ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+            cursor.close()
+            return
+        cursor.close()
+    session.execute(insert(Feedback.__table__), rows)
+
+
+def create_import(session: Session, source: str, photos: Optional[str] = None, fmt: Optional[str] = None) -> ImportRun:
+    run = ImportRun(
+        id=uuid.uuid4().hex,
+        source=source,
+        photos=photos,
+        format=fmt or detect_format(source),
+    )
+    session.add(run)
+    session.commit()
+    session.refresh(run)
+    return run
+
+
+def _record_batch(session: Session, run: ImportRun, rows: list, errors: list, consumed: int, done: bool = False):
+    """
+    The rows and the checkpoint commit together, so a resumed import neither skips nor repeats
+    rows. The checkpoint only moves from the value this runner read: if another runner (e.g. a
+    retry started while this one overran its job) got there first, nothing is written.
+    """
+    insert_rows(session, rows)
+    now = datetime.utcnow()
+    values = {"rows_done": consumed, "imported": run.imported + len(rows), "rejected": run.rejected + len(errors), "updated_at": now}
+    if errors:
+        values["errors"] = json.dumps((json.loads(run.errors) + errors)[:MAX_ERRORS])
+    if done:
+        values.update(status="done", finished_at=now)
+    result = session.execute(
+        update(ImportRun).where(ImportRun.id == run.id, ImportRun.rows_done == run.rows_done).values(**values)
+    )
+    if not result.rowcount:
+        session.rollback()
+        raise ImportConflict(f"Import {run.id} checkpoint moved past row {run.rows_done} in another runner")
+    session.commit()
+    # Not marked dirty, so the run object is never flushed over the guarded checkpoint
+    for key, value in values.items():
+        set_committed_value(run, key, value)
+
+
+def run_import(import_id: str, max_seconds: Optional[float] = None, progress=None, batch_size: Optional[int] = None) -> ImportRun:
+    """
+    Imports (or resumes) a run from its last checkpoint. No jobs are queued for imported rows:
+    no WhatsApp thank-you, no alerts or negative reports. With max_seconds, commits what it has
+    and returns as soon as a record takes it past the limit, with status still 'running' (the
+    worker queues the next slice). Raises ImportConflict if another runner moved the checkpoint.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    started = time.monotonic()
+    # The run is returned (and read by progress callbacks) after the session closes
+    with Session(engine, expire_on_commit=False) as session:
+        run = session.get(ImportRun, import_id)
+        if run is None:
+            raise ValueError(f"Import {import_id} not found")
+        if run.status == "done":
+            return run
+        run.status = "running"
+        run.error = None
+        session.add(run)
+        session.commit()
+
+        photos = zipfile.ZipFile(run.photos) if run.photos else None
+        try:
+            rows, errors = [], []
+            consumed = run.rows_done
+            for row_number, record in enumerate(iter_records(run.source, run.format), start=1):
+                if row_number <= run.rows_done:
+                    continue # Already imported before the checkpoint
+                try:
+                    if isinstance(record, Exception):
+                        raise ValueError(f"Unreadable record: {record}")
+                    rows.append(parse_record(record, photos, run.id, row_number))
+                except ValueError as e:
+                    errors.append({"row": row_number, "error": str(e)})
+                consumed = row_number
+                # Checked per record: photo normalization makes a full batch slow enough to
+                # outlive the job's visibility timeout
+                out_of_time = max_seconds and time.monotonic() - started > max_seconds
+                if out_of_time or len(rows) + len(errors) >= batch_size:
+                    _record_batch(session, run, rows, errors, consumed)
+                    rows, errors = [], []
+                    if progress:
+                        progress(run)
+                    if out_of_time:
+                        return run
+            _record_batch(session, run, rows, errors, consumed, done=True)
+            if progress:
+                progress(run)
+        except ImportConflict:
+            # The other runner owns the run now; it's not failed
+            logger.warning(f"Import {import_id} stopped: another runner is ahead of row {run.rows_done}")
+            raise
+        except Exception as e:
+            session.rollback()
+            run = session.get(ImportRun, import_id)
+            run.status = "failed"
+            run.error = f"{type(e).__name__}: {e}"[:2000]
+            session.add(run)
+            session.commit()
+            logger.error(f"Import {import_id} failed after {run.rows_done} rows: {e}")
+            raise
+        finally:
+            if photos:
+                photos.close()
+
+    response_cache.invalidate(REPORTS)
+    logger.info(f"Import {import_id} done: {run.imported} imported, {run.rejected} rejected")
+    _remove_uploaded_files(run)
+    return run
+
+
+def _remove_uploaded_files(run: ImportRun):
+    # Files uploaded through /admin/import are kept only until the run finishes
+    import_dir = Path(settings.IMPORT_DIR).resolve()
+    for path in (run.source, run.photos):
+        if path and Path(path).resolve().parent == import_dir:
+            Path(path).unlink(missing_ok=True)
+
+
+def import_status(run: ImportRun) -> dict:
+    return {
+        "id": run.id,
+        "status": run.status,
+        "format": run.format,
+        "rows_done": run.rows_done,
+        "imported": run.imported,
+        "rejected": run.rejected,
+        "errors": json.loads(run.errors),
+        "error": run.error,
+        "created_at": run.created_at,
+        "updated_at": run.updated_at,
+        "finished_at": run.finished_at,
+    }
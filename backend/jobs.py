@@ -0,0 +1,146 @@
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import exists, or_, and_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, func
+from .database import engine
+from .models import Job
+from .config import settings
+from .tracing import current_traceparent
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def enqueue(
+    session: Session,
+    kind: str,
+    payload: dict,
+    priority: int = 0,
+    delay_seconds: int = 0,
+    serial_key: Optional[str] = None,
+    max_attempts: Optional[int] = None,
+) -> Job:
+    """
+    Adds a job to the queue as part of the caller's transaction (the caller commits), so a job
+    is only visible to workers if the data it refers to was committed too.
+    Jobs sharing a serial_key are processed one at a time in enqueue order.
+    """
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        priority=priority,
+        serial_key=serial_key,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=datetime.utcnow() + timedelta(seconds=delay_seconds),
+        traceparent=current_traceparent(),
+    )
+    session.add(job)
+    return job
+
+
+def claim_jobs(worker_id: str, limit: int, skip_serial_keys: tuple = ()):
+    """
+    Atomically marks up to `limit` runnable jobs as running for this worker and returns them.
+    Jobs whose visibility timeout expired (worker died mid-job) become runnable again. Jobs with
+    one of `skip_serial_keys` are left for another worker.
+    Postgres uses FOR UPDATE SKIP LOCKED so concurrent workers never block on each other;
+    SQLite serializes writers so the single UPDATE ... RETURNING is already atomic.
+    """
+    now = datetime.utcnow()
+    earlier = aliased(Job)
+    conditions = [or_(Job.serial_key.is_(None), Job.serial_key.not_in(skip_serial_keys))] if skip_serial_keys else []
+    runnable = (
+        select(Job.id)
+        .where(
+            or_(
+                and_(Job.status == "queued", Job.run_at <= now),
+                and_(Job.status == "running", Job.locked_until < now),
+            ),
+            *conditions,
+            # Keep per-key ordering: skip while an earlier job with the same key is pending
+            ~exists().where(
+                earlier.serial_key == Job.serial_key,
+                earlier.id < Job.id,
+                earlier.status.in_(["queued", "running"]),
+            ),
+        )
+        .order_by(Job.priority.desc(), Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Job)
+        .where(Job.id.in_(runnable.scalar_subquery()))
+        .values(
+            status="running",
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT_SECONDS),
+            attempts=Job.attempts + 1,
+            updated_at=now,
+        )
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts, Job.traceparent)
+        .execution_options(synchronize_session=False)
+    )
+    with Session(engine) as session:
+        rows = session.execute(statement).all()
+        session.commit()
+    return rows
+
+
+def complete_job(job_id: int):
+    # Finished jobs are removed to keep the queue table small
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        if job:
+            session.delete(job)
+            session.commit()
+
+
+def fail_job(job_id: int, error: str, permanent: bool = False) -> Optional[str]:
+    """
+    Schedules a retry with exponential backoff, or dead-letters the job once out of attempts.
+    Returns the job's new status (queued or dead).
+    """
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        if not job:
+            return None
+        job.last_error = error[:2000]
+        job.locked_by = None
+        job.locked_until = None
+        job.updated_at = datetime.utcnow()
+        if permanent or job.attempts >= job.max_attempts:
+            job.status = "dead"
+            logger.error(f"Job {job.id} ({job.kind}) dead-lettered after {job.attempts} attempts: {error}")
+        else:
+            backoff = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.run_at = datetime.utcnow() + timedelta(seconds=backoff)
+            logger.warning(f"Job {job.id} ({job.kind}) failed, retrying in {backoff}s: {error}")
+        session.add(job)
+        session.commit()
+        return job.status
+
+
+def retry_job(session: Session, job_id: int) -> bool:
+    """Moves a dead-lettered job back onto the queue."""
+    job = session.get(Job, job_id)
+    if not job or job.status != "dead":
+        return False
+    job.status = "queued"
+    job.attempts = 0
+    job.run_at = datetime.utcnow()
+    job.updated_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+    return True
+
+
+def queue_stats(session: Session) -> dict:
+    rows = session.exec(select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status)).all()
+    stats = {}
+    for kind, status, count in rows:
+        stats.setdefault(kind, {})[status] = count
+    return stats
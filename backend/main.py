@@ -1,11 +1,20 @@
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
-from .database import create_db_and_tables
-from .routers import feedback, admin, whatsapp
-from .tasks import start_scheduler
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from .database import create_db_and_tables, engine, pin_to_primary
+from .routers import feedback, admin, whatsapp, uploads
+from .tasks import start_scheduler, stop_scheduler
 from .logger import get_logger
+from .admission import AdmissionMiddleware
+from .idempotency import IdempotencyMiddleware
+from .tracing import TracingMiddleware, exporter
+from .assets import FrontendFiles
+from .engine_profiles import WriterQueueBusy
+from .worker import start_embedded_worker, stop_embedded_worker
+from .config import settings
 
 logger = get_logger(__name__)
 
@@ -19,12 +28,93 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal Server Error"},
     )
 
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+@app.exception_handler(WriterQueueBusy)
+async def writer_queue_busy_handler(request: Request, exc: WriterQueueBusy):
+    logger.warning(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+# Set once the schema has been created/verified; scheduler and worker start after that
+_schema_ready = False
+_startup_task = None
+
+def _check_multi_process_settings():
+    if settings.WEB_CONCURRENCY > 1 and settings.CACHE_BACKEND == "memory":
+        logger.warning(
+            f"CACHE_BACKEND=memory with {settings.WEB_CONCURRENCY} web workers: writes only invalidate "
+            "the worker that made them, so the others serve stale reports. Use CACHE_BACKEND=database."
+        )
+
+def _start_background_services():
+    global _schema_ready
+    _schema_ready = True
     start_scheduler()
+    if settings.JOB_WORKER_EMBEDDED:
+        start_embedded_worker()
+
+async def _deferred_startup():
+    # Remote Postgres may still be waking up, so keep retrying instead of failing the boot
+    while True:
+        try:
+            await run_in_threadpool(create_db_and_tables)
+            break
+        except Exception as e:
+            logger.error(f"Schema check failed, retrying in {settings.STARTUP_DB_RETRY_SECONDS}s: {e}")
+            await asyncio.sleep(settings.STARTUP_DB_RETRY_SECONDS)
+    _start_background_services()
+    logger.info("Deferred startup complete")
+
+@app.on_event("startup")
+async def on_startup():
+    global _startup_task
+    _check_multi_process_settings()
+    if settings.FAST_STARTUP:
+        _startup_task = asyncio.create_task(_deferred_startup())
+        logger.info("Application started (schema check running in background)")
+        return
+    await run_in_threadpool(create_db_and_tables)
+    _start_background_services()
     logger.info("Application started")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    if _startup_task and not _startup_task.done():
+        _startup_task.cancel()
+    stop_scheduler()
+    await stop_embedded_worker()
+    exporter.flush()
+
+def _ping_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    if not _schema_ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "schema": False})
+    try:
+        await run_in_threadpool(_ping_database)
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e}")
+        return JSONResponse(status_code=503, content={"status": "unavailable", "schema": True, "database": False})
+    return {"status": "ready", "schema": True, "database": True}
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    # After an admin write, keep this browser's reads on the primary (replica lag)
+    response = await call_next(request)
+    path = request.url.path
+    if request.method not in ("GET", "HEAD") and path.startswith("/admin/") and path != "/admin/login" and response.status_code < 400:
+        pin_to_primary(response)
+    return response
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -34,10 +124,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Inside admission control: replays of completed Idempotency-Keys skip the handler entirely
+app.add_middleware(IdempotencyMiddleware, paths=["/feedback/"])
+
+# Rate limiting and load shedding for upload endpoints. Every webhook call comes from Meta's
+# servers, so an IP bucket would throttle all users together; check_whatsapp limits per number
+app.add_middleware(AdmissionMiddleware, paths=["/feedback/", "/feedback/uploads/", "/whatsapp/webhook"], ip_exempt=["/whatsapp/webhook"])
+
+# Outermost, so time spent queued in admission control is part of the request span
+app.add_middleware(TracingMiddleware)
+
 # Routers
 app.include_router(feedback.router)
+app.include_router(uploads.router)
 app.include_router(admin.router)
 app.include_router(whatsapp.router)
 
-# Serve frontend files
-app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
\ No newline at end of file
+# Serve frontend files (fingerprinted, precompressed CSS/JS)
+app.mount("/", FrontendFiles(directory="frontend", html=True), name="frontend")
\ No newline at end of file
@@ -1,8 +1,19 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from sqlalchemy import BigInteger, Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 class Feedback(SQLModel, table=True):
+    __table_args__ = (
+        # Covers every column /admin/analytics aggregates, so those queries never touch the
+        # (photo heavy) table rows
+        Index(
+            "ix_feedback_analytics",
+            "created_at", "feedback_method", "ro_number", "status",
+            "rating_air", "rating_washroom", "resolved_at",
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     phone: str
     is_testimonial: bool = False
@@ -13,11 +24,12 @@ class Feedback(SQLModel, table=True):
     photo_washroom: Optional[bytes] = None
     photo_receipt: Optional[bytes] = None
     terms_accepted: bool = False
-    ro_number: Optional[str] = None
+    ro_number: Optional[str] = Field(default=None, index=True)
     status: str = Field(default="pending")
     feedback_method: str = Field(default="web") # web or whatsapp
     session_id: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    resolved_at: Optional[datetime] = None # Set when status changes to resolved
 
 class WhatsAppState(SQLModel, table=True):
     phone: str = Field(primary_key=True)
@@ -25,6 +37,150 @@ class WhatsAppState(SQLModel, table=True):
     temp_data: str = Field(default="{}") # JSON string
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class RateLimitBucket(SQLModel, table=True):
+    key: str = Field(primary_key=True) # e.g. "ip:1.2.3.4" or "phone:919876543210"
+    tokens: float
+    updated_at: float # Unix timestamp
+
+class SchedulerLease(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    holder: str # hostname:pid of the current leader
+    expires_at: datetime
+
+class JobRun(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("job_name", "interval_start"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_name: str = Field(index=True)
+    interval_start: datetime
+    status: str = Field(default="running") # running, queued (handed to the job queue), done or failed
+    holder: str
+    error: Optional[str] = None
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class Job(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str # Handler name, see worker.HANDLERS
+    payload: str = Field(default="{}") # JSON kwargs for the handler
+    priority: int = Field(default=0, index=True) # Higher runs first
+    status: str = Field(default="queued", index=True) # queued, running or dead
+    serial_key: Optional[str] = Field(default=None, index=True) # Jobs with the same key run in order
+    attempts: int = 0
+    max_attempts: int = 5
+    run_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    locked_by: Optional[str] = None
+    locked_until: Optional[datetime] = None
+    last_error: Optional[str] = None
+    traceparent: Optional[str] = None # Trace of the request/job that enqueued it
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ArchiveSegment(SQLModel, table=True):
+    name: str = Field(primary_key=True) # Files: <name>.ndjson.<codec> and <name>.blobs
+    codec: str # zst or gz
+    record_count: int
+    min_created_at: datetime = Field(index=True)
+    max_created_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ArchiveIndex(SQLModel, table=True):
+    feedback_id: int = Field(primary_key=True)
+    segment: str = Field(index=True)
+    created_at: datetime
+
+class CacheVersion(SQLModel, table=True):
+    namespace: str = Field(primary_key=True)
+    version: int = 0
+    invalidated_at: Optional[datetime] = None
+
+class Upload(SQLModel, table=True):
+    id: str = Field(primary_key=True) # Random UUID handed to the client
+    size: int # Declared total bytes
+    received: int = 0 # Bytes stored so far; the next chunk must start here
+    content_type: str = "application/octet-stream"
+    client: Optional[str] = Field(default=None, index=True) # IP that started it, for the pending upload caps
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class UploadChunk(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("upload_id", "offset"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    upload_id: str = Field(index=True)
+    offset: int
+    data: bytes
+
+class UploadCreate(SQLModel):
+    size: int
+    content_type: str = "application/octet-stream"
+
+class UploadStatus(SQLModel):
+    upload_id: str
+    size: int
+    offset: int
+    complete: bool
+    chunk_size: int
+
+class IdempotencyRecord(SQLModel, table=True):
+    key: str = Field(primary_key=True) # "key:<Idempotency-Key header>" or "fp:<request fingerprint>"
+    status: str = "pending" # pending (being processed) or done
+    feedback_id: Optional[int] = None
+    response: Optional[str] = None # JSON body returned to the original request
+    locked_until: Optional[datetime] = None # A pending claim older than this can be taken over
+    expires_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Alert(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    rule: str # Rule text, e.g. "ro:negatives>=3/30m"
+    scope: str # ro or facility
+    key: str # RO number or facility name
+    value: float # Negatives counted, or the negative rate, when it tripped
+    message: str
+    feedback_ids: str = Field(default="[]") # JSON list of the negative feedback in the window
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class ImportRun(SQLModel, table=True):
+    id: str = Field(primary_key=True) # uuid4 hex
+    source: str # Path of the CSV/NDJSON file
+    photos: Optional[str] = None # Path of the zip the photo columns refer to
+    format: str # csv or ndjson
+    status: str = Field(default="queued") # queued, running, done or failed
+    rows_done: int = 0 # Checkpoint: records consumed (imported or rejected)
+    imported: int = 0
+    rejected: int = 0
+    errors: str = Field(default="[]") # JSON list of {"row", "error"}, first 100
+    error: Optional[str] = None # Why the run failed, if it did
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class PhotoHash(SQLModel, table=True):
+    # Perceptual hash of one stored photo. The four 16-bit chunks are indexed separately so
+    # near-duplicates are found without scanning (see photo_index.py). Rows outlive archiving,
+    # so reuse of old photos is still caught.
+    __table_args__ = (UniqueConstraint("feedback_id", "photo_type"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    feedback_id: int = Field(index=True)
+    photo_type: str # air, washroom or receipt
+    hash: int = Field(sa_type=BigInteger) # 64-bit dHash, stored signed
+    chunk0: int = Field(index=True)
+    chunk1: int = Field(index=True)
+    chunk2: int = Field(index=True)
+    chunk3: int = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PhotoMatch(SQLModel, table=True):
+    # A pair of near-identical photos: feedback_id is the later submission
+    id: Optional[int] = Field(default=None, primary_key=True)
+    feedback_id: int = Field(index=True)
+    photo_type: str
+    match_feedback_id: int = Field(index=True)
+    match_photo_type: str
+    distance: int # Differing bits out of 64
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
 class FeedbackRead(SQLModel):
     id: Optional[int]
     phone: str
@@ -41,3 +197,35 @@ class FeedbackRead(SQLModel):
     feedback_method: str
     session_id: Optional[str]
     created_at: datetime
+    resolved_at: Optional[datetime] = None
+    photos: Optional[List[str]] = None # Photo types present when the photo data itself is left out
+
+class SearchResults(SQLModel):
+    total: int
+    page: int
+    page_size: int
+    results: List[FeedbackRead]
+
+class FeedbackFilter(SQLModel):
+    status: Optional[str] = None
+    feedback_method: Optional[str] = None
+    ro_number: Optional[str] = None
+    created_from: Optional[datetime] = None # Inclusive, UTC
+    created_to: Optional[datetime] = None # Exclusive, UTC
+    negative_only: bool = False # Any rating of 1
+
+class BulkStatusUpdate(SQLModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[FeedbackFilter] = None
+    status: str
+
+class BulkDelete(SQLModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[FeedbackFilter] = None
+
+class BulkResult(SQLModel):
+    matched: int
+    updated: List[int] = []
+    deleted: List[int] = []
+    locked: List[int] = [] # Already resolved, left unchanged
+    not_found: List[int] = []
@@ -0,0 +1,184 @@
+from functools import lru_cache
+from itertools import combinations
+from typing import Optional
+from sqlalchemy import delete, or_
+from sqlmodel import Session, select
+from .database import engine
+from .models import Feedback, PhotoHash, PhotoMatch
+from .images import photo_hash
+from .jobs import enqueue
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+PHOTO_TYPES = ("air", "washroom", "receipt")
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_MATCHES = 20 # Per photo; a stock photo reused hundreds of times doesn't need every pair
+SERIAL_KEY = "photos" # Match and backfill jobs run one at a time, so each pair is recorded once
+
+
+def _unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(_unsigned(a) ^ _unsigned(b)).count("1")
+
+
+def chunks(value: int) -> list:
+    value = _unsigned(value)
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+@lru_cache(maxsize=None)
+def _probe_masks(radius: int) -> tuple:
+    """Every 16-bit mask with at most `radius` bits set."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+def candidate_condition(value: int, max_distance: int):
+    """
+    Multi-index hashing: if two hashes differ in at most d bits, at least one of their four
+    16-bit chunks differs in at most d // 4 bits (pigeonhole). So candidates are the rows where
+    some chunk is within that radius, found through the chunk indexes; the caller checks the
+    full distance. With the default distance (radius 1) that's 17 index probes per chunk.
+    """
+    masks = _probe_masks(max_distance // CHUNKS)
+    columns = (PhotoHash.chunk0, PhotoHash.chunk1, PhotoHash.chunk2, PhotoHash.chunk3)
+    return or_(*[
+        column.in_([chunk ^ mask for mask in masks])
+        for column, chunk in zip(columns, chunks(value))
+    ])
+
+
+def find_similar(session: Session, value: int, max_distance: Optional[int] = None) -> list:
+    """(PhotoHash, distance) for every stored photo within max_distance bits, closest first."""
+    max_distance = settings.PHOTO_MATCH_DISTANCE if max_distance is None else max_distance
+    rows = session.exec(select(PhotoHash).where(candidate_condition(value, max_distance))).all()
+    matches = [(row, hamming(value, row.hash)) for row in rows]
+    return sorted([m for m in matches if m[1] <= max_distance], key=lambda m: (m[1], m[0].feedback_id))
+
+
+def store_photo_hash(session: Session, feedback_id: int, photo_type: str, value: Optional[int]):
+    """Adds (or replaces) the hash of one photo in the caller's transaction."""
+    if value is None:
+        return
+    session.execute(delete(PhotoHash).where(PhotoHash.feedback_id == feedback_id, PhotoHash.photo_type == photo_type))
+    session.add(PhotoHash(feedback_id=feedback_id, photo_type=photo_type, hash=value, **dict(zip(
+        ("chunk0", "chunk1", "chunk2", "chunk3"), chunks(value)
+    ))))
+
+
+def delete_photo_index(session: Session, feedback_ids: list):
+    """Removes deleted feedback's hashes and matches (either side) in the caller's transaction."""
+    if not feedback_ids:
+        return
+    session.execute(delete(PhotoHash).where(PhotoHash.feedback_id.in_(feedback_ids)))
+    session.execute(delete(PhotoMatch).where(
+        or_(PhotoMatch.feedback_id.in_(feedback_ids), PhotoMatch.match_feedback_id.in_(feedback_ids))
+    ))
+
+
+def enqueue_photo_match(session: Session, feedback_id: int):
+    enqueue(session, "photos.match", {"feedback_id": feedback_id}, priority=8, serial_key=SERIAL_KEY)
+
+
+def _order(feedback_id: int, photo_type: str) -> tuple:
+    return feedback_id, PHOTO_TYPES.index(photo_type) if photo_type in PHOTO_TYPES else len(PHOTO_TYPES)
+
+
+def _match_in_session(session: Session, feedback_id: int) -> int:
+    # Recomputes every pair this feedback's photos are part of: a retry, or a photo added
+    # later in a WhatsApp conversation, never leaves stale or duplicate pairs
+    session.execute(delete(PhotoMatch).where(
+        or_(PhotoMatch.feedback_id == feedback_id, PhotoMatch.match_feedback_id == feedback_id)
+    ))
+    hashes = session.exec(select(PhotoHash).where(PhotoHash.feedback_id == feedback_id)).all()
+    count = 0
+    for photo in hashes:
+        for other, distance in find_similar(session, photo.hash)[:MAX_MATCHES + 1]:
+            if other.id == photo.id:
+                continue
+            # Same photo in one submission (air and washroom): counted once, not twice
+            if other.feedback_id == feedback_id and _order(feedback_id, other.photo_type) < _order(feedback_id, photo.photo_type):
+                continue
+            # The later photo is the suspect one; pairs are stored with it first
+            newer, older = sorted(
+                [(photo.feedback_id, photo.photo_type), (other.feedback_id, other.photo_type)],
+                key=lambda p: _order(*p),
+                reverse=True,
+            )
+            session.add(PhotoMatch(
+                feedback_id=newer[0], photo_type=newer[1],
+                match_feedback_id=older[0], match_photo_type=older[1],
+                distance=distance,
+            ))
+            count += 1
+    return count
+
+
+def match_feedback(feedback_id: int) -> int:
+    """Worker side of enqueue_photo_match: records the feedback's photos that match any other."""
+    with Session(engine) as session:
+        count = _match_in_session(session, feedback_id)
+        session.commit()
+    if count:
+        logger.warning(f"Feedback {feedback_id}: {count} photo(s) match earlier submissions")
+    return count
+
+
+def backfill_photo_hashes(after_id: int = 0, batch_size: Optional[int] = None) -> Optional[int]:
+    """
+    Hashes and matches the photos of the next batch of feedback after `after_id` that has
+    photos without a hash. Returns the ID to continue after, or None when done.
+    """
+    batch_size = batch_size or settings.PHOTO_BACKFILL_BATCH_SIZE
+    has_photo = or_(*[getattr(Feedback, f"photo_{t}").is_not(None) for t in PHOTO_TYPES])
+    with Session(engine) as session:
+        ids = session.exec(
+            select(Feedback.id).where(Feedback.id > after_id, has_photo).order_by(Feedback.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return None
+        hashed = {tuple(row) for row in session.exec(
+            select(PhotoHash.feedback_id, PhotoHash.photo_type).where(PhotoHash.feedback_id.in_(ids))
+        ).all()}
+        updated = []
+        for feedback_id in ids:
+            # One row's photos at a time, so a batch never holds every blob in memory
+            for photo_type in PHOTO_TYPES:
+                if (feedback_id, photo_type) in hashed:
+                    continue
+                data = session.exec(
+                    select(getattr(Feedback, f"photo_{photo_type}")).where(Feedback.id == feedback_id)
+                ).first()
+                if data:
+                    store_photo_hash(session, feedback_id, photo_type, photo_hash(data))
+                    updated.append(feedback_id)
+        session.flush()
+        matched = sum(_match_in_session(session, feedback_id) for feedback_id in dict.fromkeys(updated))
+        session.commit()
+    logger.info(f"Photo hash backfill: {len(set(updated))} feedback hashed up to ID {ids[-1]}, {matched} matches")
+    return ids[-1] if len(ids) == batch_size else None
+
+
+def match_summary(session: Session, matches: list) -> list:
+    """PhotoMatch rows with both sides' RO numbers (None once the feedback is archived)."""
+    ids = {m.feedback_id for m in matches} | {m.match_feedback_id for m in matches}
+    ro_numbers = dict(session.exec(select(Feedback.id, Feedback.ro_number).where(Feedback.id.in_(ids))).all()) if ids else {}
+    return [
+        {
+            **m.model_dump(),
+            "ro_number": ro_numbers.get(m.feedback_id),
+            "match_ro_number": ro_numbers.get(m.match_feedback_id),
+            "same_ro": ro_numbers.get(m.feedback_id) is not None and ro_numbers.get(m.feedback_id) == ro_numbers.get(m.match_feedback_id),
+        }
+        for m in matches
+    ]
@@ -1,40 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional
 import os
-from jose import JWTError, jwt
-from ..database import get_session
-from ..models import Feedback
-from ..config import settings
-from ..security import create_access_token, verify_password, get_password_hash # In real app, hash the config password
-
-router = APIRouter(prefix="/admin", tags=["admin"])
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="admin/login")
-
-def get_current_admin(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None or username != settings.ADMIN_USERNAME:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlmodel import Session, select
-from typing import List
-import os
-from jose import JWTError, jwt
+import shutil
+import uuid
+from starlette.concurrency import run_in_threadpool
 from datetime import timedelta
-from ..database import get_session
-from ..models import Feedback
+from ..database import get_session, get_read_session, read_source, engine, replicas
+from ..engine_profiles import pool_stats
+from ..search import search_feedback
+from ..admission import admission
+from ..jobs import queue_stats, retry_job, enqueue
+from ..alerts import alert_engine
+from ..importer import create_import, detect_format, import_status
+from ..serialization import FastJSONResponse, report_query, encode_reports
+from ..photo_index import SERIAL_KEY as PHOTOS_SERIAL_KEY, PHOTO_TYPES, delete_photo_index, find_similar, match_summary
+from ..filters import filter_conditions
+from ..archive import get_archived_record, iter_archived_records
+from ..analytics import feedback_analytics, BUCKETS
+from fastapi.responses import StreamingResponse, Response
+from fastapi.encoders import jsonable_encoder
+from ..cache import response_cache, REPORTS, IMAGES
+from datetime import datetime
+import json
+import hashlib
+from sqlalchemy import delete, update
+from ..models import Feedback, Alert, ImportRun, PhotoHash, PhotoMatch
 from ..config import settings
 from ..security import create_access_token, verify_password, get_password_hash # In real app, hash the config password
 from ..logger import get_logger
@@ -46,6 +38,7 @@ logger = get_logger(__name__)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="admin/login")
 
 def get_current_admin(token: str = Depends(oauth2_scheme)):
+    from jose import JWTError, jwt # Imported on first use to keep startup fast
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -75,31 +68,362 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 import base64
-from ..models import Feedback, FeedbackRead
+from ..models import Feedback, FeedbackRead, SearchResults, BulkStatusUpdate, BulkDelete, BulkResult, FeedbackFilter
 
 @router.get("/reports", response_model=List[FeedbackRead])
 async def get_reports(
-    session: Session = Depends(get_session),
+    include_photos: bool = True,
+    session: Session = Depends(get_read_session),
     current_user: str = Depends(get_current_admin)
 ):
+    source = read_source(session)
+    cache_key = response_cache.make_key(REPORTS, endpoint="reports", db=source, photos=include_photos)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return FastJSONResponse(cached)
     try:
-        feedbacks = session.exec(select(Feedback)).all()
-        results = []
-        for f in feedbacks:
-            # Convert bytes to base64 string
-            f_dict = f.model_dump()
-            if f.photo_air:
-                f_dict['photo_air'] = base64.b64encode(f.photo_air).decode('utf-8')
-            if f.photo_washroom:
-                f_dict['photo_washroom'] = base64.b64encode(f.photo_washroom).decode('utf-8')
-            if f.photo_receipt:
-                f_dict['photo_receipt'] = base64.b64encode(f.photo_receipt).decode('utf-8')
-            results.append(FeedbackRead(**f_dict))
-        return results
+        # Column tuples straight to JSON bytes: no ORM objects, no FeedbackRead round trip.
+        # Without photos the dashboard table loads them from /feedback/{id}/image/... when they
+        # scroll into view, so only say which ones exist instead of reading the blobs
+        rows = session.execute(report_query(include_photos)).all()
+        body = encode_reports(rows, include_photos)
+        response_cache.set(cache_key, body, source)
+        return FastJSONResponse(body)
     except Exception as e:
         logger.error(f"Error fetching reports: {e}")
         raise HTTPException(status_code=500, detail="Error fetching reports")
 
+@router.get("/search", response_model=SearchResults)
+async def search_reports(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_read_session),
+    current_user: str = Depends(get_current_admin)
+):
+    source = read_source(session)
+    cache_key = response_cache.make_key(REPORTS, endpoint="search", db=source, q=q.strip().lower(), page=page, page_size=page_size)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    try:
+        total, rows = search_feedback(session, q, page, page_size)
+        results = [FeedbackRead(**{k: v for k, v in row.items() if k != "rank"}) for row in rows]
+        body = json.dumps(jsonable_encoder(
+            SearchResults(total=total, page=page, page_size=page_size, results=results)
+        )).encode("utf-8")
+        response_cache.set(cache_key, body, source)
+        return Response(content=body, media_type="application/json")
+    except Exception as e:
+        logger.error(f"Error searching feedback for '{q}': {e}")
+        raise HTTPException(status_code=500, detail="Error searching feedback")
+
+@router.get("/analytics")
+async def get_analytics(
+    request: Request,
+    bucket: str = Query("day"),
+    tz: str = Query(None, description="IANA time zone for bucket boundaries"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    ro_number: Optional[str] = None,
+    feedback_method: Optional[str] = None,
+    session: Session = Depends(get_read_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """Dashboard aggregates (summary, trend buckets, rating distributions, per RO/method, resolution times)."""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(BUCKETS)}")
+    tz = tz or settings.ANALYTICS_TIMEZONE
+    source = read_source(session)
+    cache_key = response_cache.make_key(
+        REPORTS, endpoint="analytics", db=source, bucket=bucket, tz=tz,
+        created_from=created_from, created_to=created_to, ro_number=ro_number, feedback_method=feedback_method,
+    )
+    body = response_cache.get(cache_key)
+    if body is None:
+        try:
+            result = feedback_analytics(
+                session,
+                FeedbackFilter(created_from=created_from, created_to=created_to, ro_number=ro_number, feedback_method=feedback_method),
+                bucket=bucket,
+                tz=tz,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error computing analytics: {e}")
+            raise HTTPException(status_code=500, detail="Error computing analytics")
+        body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+        response_cache.set(cache_key, body, source)
+
+    # Small enough to revalidate on every load; unchanged data costs a 304
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/archive/export")
+async def export_archive(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    session: Session = Depends(get_read_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """Streams archived feedback as NDJSON (photo fields are true/false; fetch photos by ID)."""
+    def generate():
+        for record in iter_archived_records(session, created_from, created_to):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=feedback_archive.ndjson"},
+    )
+
+def _save_import_file(upload: UploadFile, path: str):
+    os.makedirs(settings.IMPORT_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, 1024 * 1024)
+
+@router.post("/import")
+async def start_import(
+    file: UploadFile = File(...), # CSV or NDJSON, optionally gzipped
+    photos: Optional[UploadFile] = File(None), # Zip with the files named in the photo_* columns
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """Queues a bulk import of historical feedback. Poll GET /admin/import/{id} for progress."""
+    try:
+        detect_format(file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    name = uuid.uuid4().hex
+    source = os.path.join(settings.IMPORT_DIR, f"{name}_{os.path.basename(file.filename)}")
+    await run_in_threadpool(_save_import_file, file, source)
+    photos_path = None
+    if photos is not None and photos.filename:
+        photos_path = os.path.join(settings.IMPORT_DIR, f"{name}_photos.zip")
+        await run_in_threadpool(_save_import_file, photos, photos_path)
+
+    run = create_import(session, source, photos_path)
+    enqueue(session, "import.run", {"import_id": run.id}, serial_key=f"import:{run.id}")
+    session.commit()
+    logger.info(f"Import {run.id} queued from {file.filename}")
+    return import_status(run)
+
+@router.get("/import")
+async def list_imports(
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    runs = session.exec(select(ImportRun).order_by(ImportRun.created_at.desc()).limit(20)).all()
+    return [import_status(run) for run in runs]
+
+@router.get("/import/{import_id}")
+async def get_import(
+    import_id: str,
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    run = session.get(ImportRun, import_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return import_status(run)
+
+@router.get("/photos/matches")
+async def get_photo_matches(
+    feedback_id: Optional[int] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """Photos that were submitted before (newest first), optionally only those involving one feedback."""
+    query = select(PhotoMatch)
+    if feedback_id is not None:
+        query = query.where((PhotoMatch.feedback_id == feedback_id) | (PhotoMatch.match_feedback_id == feedback_id))
+    matches = session.exec(query.order_by(PhotoMatch.created_at.desc(), PhotoMatch.id.desc()).limit(limit)).all()
+    return match_summary(session, matches)
+
+@router.get("/photos/similar/{feedback_id}/{photo_type}")
+async def get_similar_photos(
+    feedback_id: int,
+    photo_type: str,
+    max_distance: int = Query(None, ge=0, le=16),
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """On-demand lookup, e.g. with a looser max_distance than PHOTO_MATCH_DISTANCE."""
+    if photo_type not in PHOTO_TYPES:
+        raise HTTPException(status_code=404, detail="Image not found")
+    photo = session.exec(
+        select(PhotoHash).where(PhotoHash.feedback_id == feedback_id, PhotoHash.photo_type == photo_type)
+    ).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="No hash for this photo (run the backfill?)")
+    return [
+        {"feedback_id": other.feedback_id, "photo_type": other.photo_type, "distance": distance}
+        for other, distance in find_similar(session, photo.hash, max_distance)
+        if other.id != photo.id
+    ]
+
+@router.post("/photos/backfill")
+async def start_photo_backfill(
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    """Hashes photos stored before hashing existed (or imported), in batches on the job worker."""
+    enqueue(session, "photos.backfill", {"after_id": 0}, priority=9, serial_key=PHOTOS_SERIAL_KEY)
+    session.commit()
+    logger.info("Photo hash backfill queued")
+    return {"ok": True}
+
+@router.get("/archive/{feedback_id}", response_model=FeedbackRead)
+async def get_archived_feedback(
+    feedback_id: int,
+    session: Session = Depends(get_read_session),
+    current_user: str = Depends(get_current_admin)
+):
+    record = get_archived_record(session, feedback_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Archived feedback not found")
+    for field in ("photo_air", "photo_washroom", "photo_receipt"):
+        if record[field]:
+            record[field] = base64.b64encode(record[field]).decode('utf-8')
+    return FeedbackRead(**record)
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: str = Depends(get_current_admin)):
+    return response_cache.get_stats()
+
+@router.get("/db/stats")
+async def get_db_stats(current_user: str = Depends(get_current_admin)):
+    return {**pool_stats(engine), "read_routing": replicas.get_stats()}
+
+@router.get("/admission/stats")
+async def get_admission_stats(current_user: str = Depends(get_current_admin)):
+    return admission.get_stats()
+
+@router.get("/jobs/stats")
+async def get_job_stats(
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    return queue_stats(session)
+
+@router.get("/alerts")
+async def get_alerts(
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    # Engine stats are those of this process (meaningful where the job worker runs)
+    alerts = session.exec(select(Alert).order_by(Alert.created_at.desc()).limit(limit)).all()
+    return {
+        "alerts": [{**a.model_dump(), "feedback_ids": json.loads(a.feedback_ids)} for a in alerts],
+        "engine": alert_engine.get_stats(),
+    }
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_dead_job(
+    job_id: int,
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    if not retry_job(session, job_id):
+        raise HTTPException(status_code=404, detail="Dead job not found")
+    logger.info(f"Dead job {job_id} re-queued")
+    return {"ok": True}
+
+# Max IDs per IN (...) clause, well below SQLite/Postgres parameter limits
+BULK_CHUNK_SIZE = 500
+
+def _bulk_targets(ids, filter: FeedbackFilter):
+    """Yields WHERE clause lists selecting the targeted rows (chunked for ID lists)."""
+    if ids:
+        unique_ids = sorted(set(ids))
+        for i in range(0, len(unique_ids), BULK_CHUNK_SIZE):
+            yield [Feedback.id.in_(unique_ids[i:i + BULK_CHUNK_SIZE])]
+    else:
+        yield filter_conditions(filter)
+
+def _validate_bulk_target(ids, filter: FeedbackFilter):
+    if not ids and not (filter and filter_conditions(filter)):
+        raise HTTPException(status_code=400, detail="Provide a list of ids or a non-empty filter")
+
+@router.patch("/feedback/bulk/status", response_model=BulkResult)
+async def bulk_update_status(
+    request: BulkStatusUpdate,
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    _validate_bulk_target(request.ids, request.filter)
+    if request.status not in ["pending", "resolved"]:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    try:
+        updated, locked = [], []
+        for conditions in _bulk_targets(request.ids, request.filter):
+            # Resolved feedback is locked, same rule as the single-row endpoint
+            locked += session.exec(
+                select(Feedback.id).where(*conditions, Feedback.status == "resolved")
+            ).all()
+            updated += session.execute(
+                update(Feedback)
+                .where(*conditions, Feedback.status != "resolved")
+                .values(status=request.status, resolved_at=datetime.utcnow() if request.status == "resolved" else None)
+                .returning(Feedback.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+        session.commit()
+        response_cache.invalidate(REPORTS)
+
+        not_found = sorted(set(request.ids or []) - set(updated) - set(locked))
+        logger.info(f"Bulk status update to {request.status}: {len(updated)} updated, {len(locked)} locked")
+        return BulkResult(
+            matched=len(updated) + len(locked),
+            updated=sorted(updated),
+            locked=sorted(locked),
+            not_found=not_found,
+        )
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error in bulk status update: {e}")
+        raise HTTPException(status_code=500, detail="Error updating feedback status")
+
+@router.post("/feedback/bulk/delete", response_model=BulkResult)
+async def bulk_delete_feedback(
+    request: BulkDelete,
+    session: Session = Depends(get_session),
+    current_user: str = Depends(get_current_admin)
+):
+    _validate_bulk_target(request.ids, request.filter)
+    try:
+        deleted = []
+        for conditions in _bulk_targets(request.ids, request.filter):
+            chunk = session.execute(
+                delete(Feedback)
+                .where(*conditions)
+                .returning(Feedback.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            # Deleted photos must not keep matching new submissions
+            for i in range(0, len(chunk), BULK_CHUNK_SIZE):
+                delete_photo_index(session, chunk[i:i + BULK_CHUNK_SIZE])
+            deleted += chunk
+        session.commit()
+        response_cache.invalidate(REPORTS, IMAGES)
+
+        logger.info(f"Bulk delete: {len(deleted)} feedback deleted")
+        return BulkResult(
+            matched=len(deleted),
+            deleted=sorted(deleted),
+            not_found=sorted(set(request.ids or []) - set(deleted)),
+        )
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error in bulk delete: {e}")
+        raise HTTPException(status_code=500, detail="Error deleting feedback")
+
 @router.delete("/feedback/{feedback_id}")
 async def delete_feedback(
     feedback_id: int,
@@ -116,7 +440,9 @@ async def delete_feedback(
 
 
         session.delete(feedback)
+        delete_photo_index(session, [feedback_id])
         session.commit()
+        response_cache.invalidate(REPORTS, IMAGES)
         logger.info(f"Feedback deleted: {feedback_id}")
         return {"ok": True}
     except HTTPException:
@@ -146,11 +472,14 @@ async def update_feedback_status(
              raise HTTPException(status_code=400, detail="Invalid status")
 
         feedback.status = new_status
+        feedback.resolved_at = datetime.utcnow() if new_status == "resolved" else None
         session.add(feedback)
         session.commit()
         session.refresh(feedback)
+        response_cache.invalidate(REPORTS)
         logger.info(f"Feedback {feedback_id} status updated to {new_status}")
-        return feedback
+        # Raw photo bytes can't be JSON encoded; photos are served by the image endpoint
+        return FeedbackRead(**feedback.model_dump(exclude={"photo_air", "photo_washroom", "photo_receipt"}))
     except HTTPException:
         raise
     except Exception as e:
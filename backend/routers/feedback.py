@@ -1,11 +1,26 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException
+import asyncio
+import hashlib
 import uuid
-from sqlmodel import Session
+from sqlmodel import Session, select
 from typing import Optional
 from ..database import get_session
 from ..models import Feedback
-from ..whatsapp import send_whatsapp_message # Import utility
-from ..tasks import send_immediate_negative_report
+from ..jobs import enqueue
+from ..alerts import enqueue_feedback_event
+from ..validation import feedback_error, phone_digits
+from ..images import normalize_image_async, image_media_type, photo_hash_async
+from ..photo_index import store_photo_hash, enqueue_photo_match
+from ..serialization import FastJSONResponse, feedback_response
+from ..uploads import read_upload, consume_uploads
+from ..admission import check_phone_rate
+from ..idempotency import header_key, fingerprint, find_done, record_response, replay
+from ..config import settings
+from ..tracing import set_attributes
+from sqlalchemy.exc import IntegrityError
+from ..archive import get_archived_photo
+from ..cache import response_cache, REPORTS, IMAGES
+from ..engine_profiles import WriterQueueBusy
 
 router = APIRouter(prefix="/feedback", tags=["feedback"])
 
@@ -15,9 +30,40 @@ logger = get_logger(__name__)
 
 from ..models import FeedbackRead
 
+async def _read_photo(session: Session, file: Optional[UploadFile], upload_id: Optional[str], field: str) -> Optional[bytes]:
+    # Photos come either from a finished resumable upload (the web form) or inline (older clients)
+    if upload_id:
+        data = read_upload(session, upload_id)
+        if data is None:
+            raise HTTPException(status_code=400, detail=f"Upload for {field} is missing or incomplete")
+    elif file:
+        data = await file.read()
+    else:
+        return None
+    # Normalize (resize, re-encode, strip EXIF) even if the browser already downscaled it
+    return await normalize_image_async(data)
+
+async def _photo_identity(file: Optional[UploadFile], upload_id: Optional[str]) -> Optional[str]:
+    # Part of the duplicate fingerprint: the upload ID (the form reuses it on retry) or a hash of the inline file
+    if upload_id:
+        return f"upload:{upload_id}"
+    if file:
+        digest = hashlib.sha256(await file.read()).hexdigest()
+        await file.seek(0)
+        return f"sha256:{digest}"
+    return None
+
+def _replay_duplicate(session: Session, duplicate, idempotency_key: Optional[str]):
+    # The middleware's claim on this request's Idempotency-Key is still pending: store the
+    # replayed response under it too, or retries with that key get 409s and then a new row
+    if idempotency_key and idempotency_key.strip():
+        record_response(session, header_key(idempotency_key), duplicate.feedback_id, duplicate.response,
+                        settings.IDEMPOTENCY_TTL_HOURS * 3600)
+        session.commit()
+    return replay(duplicate)
+
 @router.post("/", response_model=FeedbackRead)
 async def submit_feedback(
-    background_tasks: BackgroundTasks,
     phone: str = Form(...),
     is_testimonial: bool = Form(False),
     rating_air: Optional[int] = Form(None),
@@ -27,30 +73,44 @@ async def submit_feedback(
     photo_air: Optional[UploadFile] = File(None),
     photo_washroom: Optional[UploadFile] = File(None),
     photo_receipt: Optional[UploadFile] = File(None),
+    photo_air_upload: Optional[str] = Form(None), # IDs from /feedback/uploads/
+    photo_washroom_upload: Optional[str] = Form(None),
+    photo_receipt_upload: Optional[str] = Form(None),
     ro_number: Optional[str] = Form(None),
     source_id: Optional[str] = Form(None), # Backward compatibility
+    idempotency_key: Optional[str] = Header(None), # Completed keys are replayed by IdempotencyMiddleware
     session: Session = Depends(get_session)
 ):
     try:
-        # Validation: Terms and Conditions
-        if not terms_accepted:
-            raise HTTPException(status_code=400, detail="Terms and Conditions must be accepted")
-
-        # Validation: At least one rating required
-        if rating_air is None and rating_washroom is None:
-            raise HTTPException(status_code=400, detail="At least one rating (Air or Washroom) is required")
-
-        # Validation: Phone Number (Basic Length/Digit Check)
-        # Allow +, spaces, dashes, but ensure at least 10 digits
-        import re
-        clean_phone = re.sub(r'\D', '', phone)
-        if len(clean_phone) < 10 or len(clean_phone) > 15:
-             raise HTTPException(status_code=400, detail="Invalid phone number format")
-
-        # Read file bytes
-        photo_air_bytes = await photo_air.read() if photo_air else None
-        photo_washroom_bytes = await photo_washroom.read() if photo_washroom else None
-        photo_receipt_bytes = await photo_receipt.read() if photo_receipt else None
+        # Validation: terms, at least one rating, phone number (shared with bulk import)
+        error = feedback_error(phone, rating_air, rating_washroom, terms_accepted)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        clean_phone = phone_digits(phone)
+
+        # A retry of a submission we already stored (kiosk timed out waiting for the response) gets
+        # the original response back: no second row, no second WhatsApp message
+        fingerprint_key = fingerprint(
+            clean_phone, rating_air, rating_washroom, comment, ro_number or source_id,
+            await _photo_identity(photo_air, photo_air_upload),
+            await _photo_identity(photo_washroom, photo_washroom_upload),
+            await _photo_identity(photo_receipt, photo_receipt_upload),
+        )
+        duplicate = find_done(session, fingerprint_key)
+        if duplicate:
+            logger.info(f"Duplicate submission from {phone}, replaying feedback {duplicate.feedback_id}")
+            return _replay_duplicate(session, duplicate, idempotency_key)
+
+        await check_phone_rate(phone)
+
+        # Uploads are only read here; they're consumed just before the first write below
+        photo_air_bytes = await _read_photo(session, photo_air, photo_air_upload, "photo_air")
+        photo_washroom_bytes = await _read_photo(session, photo_washroom, photo_washroom_upload, "photo_washroom")
+        photo_receipt_bytes = await _read_photo(session, photo_receipt, photo_receipt_upload, "photo_receipt")
+        # Perceptual hashes of the stored (normalized) photos, to catch photos reused across submissions
+        photo_hashes = dict(zip(("air", "washroom", "receipt"), await asyncio.gather(
+            photo_hash_async(photo_air_bytes), photo_hash_async(photo_washroom_bytes), photo_hash_async(photo_receipt_bytes)
+        )))
 
         feedback = Feedback(
             phone=phone,
@@ -66,38 +126,53 @@ async def submit_feedback(
             photo_washroom=photo_washroom_bytes,
             photo_receipt=photo_receipt_bytes
         )
+        # Consumed in this transaction, so they stay reusable if the submit fails. Nothing is
+        # written before this point: SQLite's write lock isn't held across the image work above
+        upload_ids = [u for u in (photo_air_upload, photo_washroom_upload, photo_receipt_upload) if u]
+        if not consume_uploads(session, upload_ids):
+            session.rollback()
+            raise HTTPException(status_code=400, detail="Upload is missing or was already used")
         session.add(feedback)
-        session.commit()
-        session.refresh(feedback)
-        logger.info(f"New feedback received from {phone}")
-        
-        # Trigger WhatsApp Message
+        session.flush() # Assigns feedback.id for the jobs below
+        set_attributes(**{
+            "feedback.id": feedback.id,
+            "feedback.ro_number": feedback.ro_number,
+            "feedback.photo_bytes": sum(len(p) for p in (photo_air_bytes, photo_washroom_bytes, photo_receipt_bytes) if p),
+        })
+
+        # Queue WhatsApp thank-you and the alert rules update.
+        # Committed together with the feedback so neither can be lost.
         message = "Thank you for your feedback! We appreciate your time."
-        background_tasks.add_task(send_whatsapp_message, phone, message)
+        enqueue(session, "whatsapp.send_message", {"to_number": phone, "message_body": message}, priority=5)
+        enqueue_feedback_event(session, feedback)
+        if any(value is not None for value in photo_hashes.values()):
+            for photo_type, value in photo_hashes.items():
+                store_photo_hash(session, feedback.id, photo_type, value)
+            enqueue_photo_match(session, feedback.id)
 
-        # Trigger Immediate Email if Negative Feedback
-        if rating_air == 1 or rating_washroom == 1:
-            background_tasks.add_task(send_immediate_negative_report, feedback.id)
-        
-        # Return response without raw bytes to avoid serialization errors
-        from ..models import FeedbackRead
-        return FeedbackRead(
-            id=feedback.id,
-            phone=feedback.phone,
-            is_testimonial=feedback.is_testimonial,
-            rating_air=feedback.rating_air,
-            rating_washroom=feedback.rating_washroom,
-            comment=feedback.comment,
-            terms_accepted=feedback.terms_accepted,
-            ro_number=feedback.ro_number,
-            status=feedback.status,
-            feedback_method=feedback.feedback_method,
-            session_id=feedback.session_id,
-            created_at=feedback.created_at,
-            photo_air=None, # Do not return raw bytes
-            photo_washroom=None,
-            photo_receipt=None
-        )
+        # Encoded once: the same bytes are stored for replays and returned (no response_model pass)
+        body = feedback_response(feedback)
+        stored = body.decode("utf-8")
+        record_response(session, fingerprint_key, feedback.id, stored, settings.DUPLICATE_WINDOW_SECONDS)
+        if idempotency_key and idempotency_key.strip():
+            record_response(session, header_key(idempotency_key), feedback.id, stored, settings.IDEMPOTENCY_TTL_HOURS * 3600)
+        try:
+            session.commit()
+        except IntegrityError:
+            # An identical submission committed first; answer with that one instead
+            session.rollback()
+            duplicate = find_done(session, fingerprint_key)
+            if duplicate is None:
+                raise
+            logger.info(f"Concurrent duplicate submission from {phone}, replaying feedback {duplicate.feedback_id}")
+            return _replay_duplicate(session, duplicate, idempotency_key)
+
+        response_cache.invalidate(REPORTS)
+        logger.info(f"New feedback received from {phone}")
+        return FastJSONResponse(body)
+    except (HTTPException, WriterQueueBusy):
+        # WriterQueueBusy: a 503 with Retry-After (main.py), not a 500
+        raise
     except Exception as e:
         logger.error(f"Error submitting feedback: {e}")
         with open("error_log.txt", "w") as f:
@@ -112,20 +187,24 @@ async def get_feedback_image(
     image_type: str, 
     session: Session = Depends(get_session)
 ):
-    feedback = session.get(Feedback, feedback_id)
-    if not feedback:
-        raise HTTPException(status_code=404, detail="Feedback not found")
-    
-    image_data = None
-    if image_type == "air":
-        image_data = feedback.photo_air
-    elif image_type == "washroom":
-        image_data = feedback.photo_washroom
-    elif image_type == "receipt":
-        image_data = feedback.photo_receipt
+    if image_type not in ("air", "washroom", "receipt"):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    cache_key = response_cache.make_key(IMAGES, id=feedback_id, type=image_type)
+    image_data = response_cache.get(cache_key)
+    if image_data is None:
+        # Load only the requested photo column, not the whole row
+        column = getattr(Feedback, f"photo_{image_type}")
+        row = session.exec(select(Feedback.id, column).where(Feedback.id == feedback_id)).first()
+        if row:
+            image_data = row[1]
+        else:
+            # Older feedback may have been moved to the archive
+            image_data = get_archived_photo(session, feedback_id, f"photo_{image_type}")
+        if image_data:
+            response_cache.set(cache_key, image_data)
     
     if not image_data:
         raise HTTPException(status_code=404, detail="Image not found")
         
-    # Defaulting to image/jpeg, browsers usually sniff content type correctly anyway
-    return Response(content=image_data, media_type="image/jpeg")
+    return Response(content=image_data, media_type=image_media_type(image_data))
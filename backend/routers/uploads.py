@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi.responses import JSONResponse
+from sqlmodel import Session
+from ..database import get_session
+from ..models import Upload, UploadCreate, UploadStatus
+from ..uploads import create_upload, append_chunk, pending_uploads
+from ..admission import check_upload_chunk_rate, client_ip, retry_after
+from ..engine_profiles import WriterQueueBusy
+from ..config import settings
+from ..logger import get_logger
+
+# Starting an upload goes through AdmissionMiddleware (per-IP bucket, concurrency limit) and
+# is capped by each client's pending uploads; chunks have their own per-IP bucket
+router = APIRouter(prefix="/feedback/uploads", tags=["uploads"])
+
+logger = get_logger(__name__)
+
+ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/heic", "image/heif", "application/octet-stream"}
+
+
+def _status(upload: Upload) -> UploadStatus:
+    return UploadStatus(
+        upload_id=upload.id,
+        size=upload.size,
+        offset=upload.received,
+        complete=upload.received == upload.size,
+        chunk_size=settings.UPLOAD_CHUNK_BYTES,
+    )
+
+
+@router.get("/config")
+async def get_upload_config():
+    """Client-side image settings, so the form downscales to what the server would store anyway."""
+    return {
+        "max_edge": settings.IMAGE_MAX_EDGE,
+        "quality": settings.IMAGE_QUALITY / 100,
+        "format": "image/webp" if settings.IMAGE_FORMAT.upper() == "WEBP" else "image/jpeg",
+        "chunk_size": settings.UPLOAD_CHUNK_BYTES,
+        "max_bytes": settings.UPLOAD_MAX_BYTES,
+    }
+
+
+@router.post("/", response_model=UploadStatus)
+async def start_upload(request: UploadCreate, http_request: Request, session: Session = Depends(get_session)):
+    if request.size <= 0 or request.size > settings.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Photo must be between 1 byte and {settings.UPLOAD_MAX_BYTES} bytes")
+    if request.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Unsupported photo type")
+    client = client_ip(http_request.scope)
+    count, size, oldest = pending_uploads(session, client)
+    if count >= settings.UPLOAD_MAX_PENDING or size + request.size > settings.UPLOAD_MAX_PENDING_BYTES:
+        logger.warning(f"Rejected upload from {client}: {count} pending uploads, {size} bytes")
+        # The oldest pending upload stops counting once it expires
+        expires = oldest + timedelta(hours=settings.UPLOAD_EXPIRY_HOURS) if oldest else datetime.utcnow()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many unfinished uploads, please submit them or try again later",
+            headers={"Retry-After": retry_after((expires - datetime.utcnow()).total_seconds())},
+        )
+    try:
+        upload = create_upload(session, request.size, request.content_type, client)
+        return _status(upload)
+    except WriterQueueBusy:
+        raise # 503 with Retry-After (main.py)
+    except Exception as e:
+        logger.error(f"Error starting upload: {e}")
+        raise HTTPException(status_code=500, detail="Error starting upload")
+
+
+@router.get("/{upload_id}", response_model=UploadStatus)
+async def get_upload_status(upload_id: str, session: Session = Depends(get_session)):
+    upload = session.get(Upload, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return _status(upload)
+
+
+@router.patch("/{upload_id}", response_model=UploadStatus, dependencies=[Depends(check_upload_chunk_rate)])
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    session: Session = Depends(get_session)
+):
+    """Appends the raw request body at Upload-Offset. On 409 the client resumes from the returned offset."""
+    if int(request.headers.get("content-length") or 0) > settings.UPLOAD_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail=f"Chunks must be at most {settings.UPLOAD_CHUNK_BYTES} bytes")
+    data = await request.body()
+    if not data or len(data) > settings.UPLOAD_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail=f"Chunks must be between 1 and {settings.UPLOAD_CHUNK_BYTES} bytes")
+    try:
+        new_offset = append_chunk(session, upload_id, upload_offset, data)
+    except WriterQueueBusy:
+        session.rollback()
+        raise # 503 with Retry-After (main.py); the client retries the chunk
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error storing chunk for upload {upload_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error storing chunk")
+
+    upload = session.get(Upload, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if new_offset is None:
+        return JSONResponse(status_code=409, content=_status(upload).model_dump())
+    return _status(upload)
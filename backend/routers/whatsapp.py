@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Request, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Request, Depends, HTTPException
 from sqlmodel import Session
 from datetime import datetime
 import json
 from ..database import get_session
 from ..models import Feedback, WhatsAppState
 from ..whatsapp import send_whatsapp_message, send_interactive_message, download_media
+from ..images import normalize_image_async, photo_hash_async
+from ..photo_index import store_photo_hash, enqueue_photo_match
+from ..admission import admission
+from ..jobs import enqueue
+from ..alerts import enqueue_feedback_event
+from ..cache import response_cache, REPORTS
 from ..config import settings
+from ..tracing import set_attributes
 from ..logger import get_logger
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
@@ -29,12 +36,14 @@ async def verify_webhook(request: Request):
     return {"status": "ok"}
 
 @router.post("/webhook")
-async def receive_message(request: Request, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+async def receive_message(request: Request, session: Session = Depends(get_session)):
     """
     Handles incoming WhatsApp messages.
     """
     try:
-        body = await request.json()
+        raw = await request.body()
+        body = json.loads(raw)
+        set_attributes(**{"whatsapp.payload_bytes": len(raw)})
         
         # Check if it's a message
         if body.get("object") == "whatsapp_business_account":
@@ -58,15 +67,50 @@ async def receive_message(request: Request, background_tasks: BackgroundTasks, s
                             user_input = message.get("interactive", {}).get("button_reply", {}).get("id", "")
                         elif msg_type == "image":
                             media_id = message.get("image", {}).get("id")
+                        set_attributes(**{"whatsapp.message_type": msg_type})
                         
-                        # Process in background to avoid timeout
-                        background_tasks.add_task(process_whatsapp_message, from_number, user_input, media_id, session)
-                        
+                        # Drop messages from numbers flooding the bot (200 so Meta doesn't retry)
+                        if settings.ADMISSION_ENABLED and await admission.check_whatsapp(from_number):
+                            logger.warning(f"Rate limited WhatsApp messages from {from_number}")
+                            continue
+
+                        # Process on the job queue to avoid timeout; one message per phone at a time, in order
+                        enqueue(
+                            session,
+                            "whatsapp.process_message",
+                            {"phone": from_number, "user_input": user_input, "media_id": media_id},
+                            priority=10,
+                            serial_key=f"wa:{from_number}",
+                        )
+
+            session.commit()
         return {"status": "received"}
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
         return {"status": "error"}
 
+# The conversation step commits as it goes, so it isn't replayed because a reply or media
+# download failed: those are logged and the step carries on (the send functions raise for
+# their own queue jobs)
+async def _reply(phone: str, text: str):
+    try:
+        await send_whatsapp_message(phone, text)
+    except Exception as e:
+        logger.error(f"Reply to {phone} failed: {e}")
+
+async def _reply_buttons(phone: str, text: str, buttons: list):
+    try:
+        await send_interactive_message(phone, text, buttons)
+    except Exception as e:
+        logger.error(f"Button reply to {phone} failed: {e}")
+
+async def _download(media_id: str):
+    try:
+        return await download_media(media_id)
+    except Exception as e:
+        logger.error(f"Skipping photo {media_id}: {e}")
+        return None
+
 async def process_whatsapp_message(phone: str, user_input: str, media_id: str, session: Session):
     # Get or Create State
     state_record = session.get(WhatsAppState, phone)
@@ -78,6 +122,12 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
     
     current_state = state_record.state
     temp_data = json.loads(state_record.temp_data)
+    # On the job span: which step of the conversation this message was
+    set_attributes(**{
+        "whatsapp.state": current_state,
+        "whatsapp.has_media": bool(media_id),
+        "feedback.id": temp_data.get("feedback_id"),
+    })
     
     logger.info(f"Processing message from {phone} in state {current_state}. Input: {user_input}, Media: {media_id}")
 
@@ -86,7 +136,7 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
     # State Machine
     if current_state == "GREETING":
         # Always greet and ask for Air Rating
-        await send_interactive_message(
+        await _reply_buttons(
             phone, 
             "Welcome to our Feedback Service! 👋\n\nPlease rate our *Air Filling Service*:",
             [("air_1", "1 Star 😞"), ("air_2", "2 Stars 😐"), ("air_3", "3 Stars 😃")]
@@ -97,34 +147,13 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
         if user_input.startswith("air_"):
             rating = int(user_input.split("_")[1])
             temp_data["rating_air"] = rating
-            await send_whatsapp_message(phone, "Thanks! Would you like to upload a photo of the Air Filling area? (Send photo or type 'skip')")
+            await _reply(phone, "Thanks! Would you like to upload a photo of the Air Filling area? (Send photo or type 'skip')")
             next_state = "PHOTO_AIR"
         else:
-            await send_whatsapp_message(phone, "Please select a rating using the buttons above.")
+            await _reply(phone, "Please select a rating using the buttons above.")
 
     elif current_state == "PHOTO_AIR":
-        if media_id:
-            # Download and store photo
-            photo_bytes = await download_media(media_id)
-            if photo_bytes:
-                # Store temporarily in memory? No, database BLOBs are heavy for temp_data JSON.
-                # We can't store bytes in JSON. 
-                # Strategy: Create the Feedback row NOW and update it incrementally? 
-                # Or just store a placeholder and ask user to re-upload if session lost?
-                # Better: Create Feedback row now with status='draft'
-                pass 
-            # For simplicity in this flow, let's assume we skip photo storage in temp_data 
-            # and just say "Photo received". 
-            # REAL IMPLEMENTATION: We need to store this. 
-            # Let's create a partial Feedback record if not exists?
-            # Or just store in a temporary file?
-            # Let's use a simple approach: We will ask for photos at the end? No, flow says "for each".
-            # Okay, let's store bytes in a separate temporary table or just use the Feedback table directly?
-            # Let's use the Feedback table. We need a way to link this session to a feedback ID.
-            # Let's store feedback_id in temp_data.
-            pass
-        
-        # Handling Photo Logic with Feedback Table
+        # Handling Photo Logic with Feedback Table (draft row linked via temp_data["feedback_id"])
         feedback_id = temp_data.get("feedback_id")
         if not feedback_id:
             # Create new feedback row
@@ -143,15 +172,17 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
         feedback = session.get(Feedback, temp_data["feedback_id"])
         
         if media_id:
-            photo_bytes = await download_media(media_id)
+            photo_bytes = await normalize_image_async(await _download(media_id))
             if photo_bytes:
                 feedback.photo_air = photo_bytes
                 session.add(feedback)
+                store_photo_hash(session, feedback.id, "air", await photo_hash_async(photo_bytes))
+                enqueue_photo_match(session, feedback.id)
                 session.commit()
-                await send_whatsapp_message(phone, "Photo received! 📸")
+                await _reply(phone, "Photo received! 📸")
         
         # Move to next step regardless of photo or skip
-        await send_interactive_message(
+        await _reply_buttons(
             phone, 
             "Now, please rate our *Washroom Cleanliness*:",
             [("wash_1", "1 Star 😞"), ("wash_2", "2 Stars 😐"), ("wash_3", "3 Stars 😃")]
@@ -170,23 +201,25 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
                 session.add(feedback)
                 session.commit()
             
-            await send_whatsapp_message(phone, "Thanks! Would you like to upload a photo of the Washroom? (Send photo or type 'skip')")
+            await _reply(phone, "Thanks! Would you like to upload a photo of the Washroom? (Send photo or type 'skip')")
             next_state = "PHOTO_WASHROOM"
         else:
-             await send_whatsapp_message(phone, "Please select a rating using the buttons above.")
+             await _reply(phone, "Please select a rating using the buttons above.")
 
     elif current_state == "PHOTO_WASHROOM":
         feedback_id = temp_data.get("feedback_id")
         if feedback_id and media_id:
-            photo_bytes = await download_media(media_id)
+            photo_bytes = await normalize_image_async(await _download(media_id))
             if photo_bytes:
                 feedback = session.get(Feedback, feedback_id)
                 feedback.photo_washroom = photo_bytes
                 session.add(feedback)
+                store_photo_hash(session, feedback.id, "washroom", await photo_hash_async(photo_bytes))
+                enqueue_photo_match(session, feedback.id)
                 session.commit()
-                await send_whatsapp_message(phone, "Photo received! 📸")
+                await _reply(phone, "Photo received! 📸")
 
-        await send_whatsapp_message(phone, "Almost done! Any additional comments? (Type your comment or 'skip')")
+        await _reply(phone, "Almost done! Any additional comments? (Type your comment or 'skip')")
         next_state = "COMMENT"
 
     elif current_state == "COMMENT":
@@ -201,19 +234,16 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
             session.add(feedback)
             session.commit()
             
-            # Trigger Immediate Report if Negative
-            from ..tasks import send_immediate_negative_report
-            if feedback.rating_air == 1 or feedback.rating_washroom == 1:
-                # We need to run this async, but we are in async function.
-                # However, tasks.py imports might cause circular dependency if not careful.
-                # We did local import above.
-                await send_immediate_negative_report(feedback.id)
-
-        await send_whatsapp_message(phone, "Thank you for your feedback! Have a great day! 🌟")
+            # Feed the alert rules (committed with the state reset below)
+            enqueue_feedback_event(session, feedback)
+
+        await _reply(phone, "Thank you for your feedback! Have a great day! 🌟")
         
         # Reset State
         session.delete(state_record)
         session.commit()
+        response_cache.invalidate(REPORTS)
+        set_attributes(**{"whatsapp.next_state": "DONE"})
         return
 
     # Update State
@@ -222,3 +252,7 @@ async def process_whatsapp_message(phone: str, user_input: str, media_id: str, s
     state_record.updated_at = datetime.utcnow()
     session.add(state_record)
     session.commit()
+    set_attributes(**{"whatsapp.next_state": next_state})
+    if temp_data.get("feedback_id"):
+        # The draft feedback row was created or updated in this step
+        response_cache.invalidate(REPORTS)
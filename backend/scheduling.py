@@ -0,0 +1,227 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, and_, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, func
+from .database import engine
+from .engine_profiles import engine_profile
+from .models import JobRun, SchedulerLease
+from .tracing import span
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Identifies this process in lease rows and job runs
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Arbitrary constant keys for the Postgres advisory locks, one per elector
+ADVISORY_LOCK_KEY = 7340021
+ALERTS_LOCK_KEY = 7340022
+ARCHIVE_LOCK_KEY = 7340023
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class LeaderElector:
+    """
+    Makes sure only one process across all workers holds a role: running scheduled jobs,
+    evaluating the alert rules (see alerts.py) or archiving.
+    Postgres: session level advisory lock held on a dedicated connection (released when the
+    process dies). Other databases, and Postgres behind PgBouncer (where session locks aren't
+    tied to our connection): a lease row renewed on every poll, taken over once expired.
+    """
+
+    def __init__(self, name: str = "scheduler", lock_key: int = ADVISORY_LOCK_KEY):
+        self.name = name
+        self.lock_key = lock_key
+        self.is_leader = False
+        self.lock_connection = None
+
+    def ensure_leadership(self) -> bool:
+        try:
+            if engine.dialect.name == "postgresql" and engine_profile(engine) != "pgbouncer":
+                leader = self._advisory_lock()
+            else:
+                leader = self._lease()
+        except Exception as e:
+            logger.error(f"Leader election failed: {e}")
+            self._drop_connection()
+            leader = False
+
+        if leader != self.is_leader:
+            logger.info(f"{HOLDER_ID} {'became' if leader else 'is no longer'} {self.name} leader")
+        self.is_leader = leader
+        return leader
+
+    def _advisory_lock(self) -> bool:
+        if self.lock_connection is not None:
+            # Still leader as long as the connection holding the lock is alive
+            self.lock_connection.execute(text("SELECT 1"))
+            return True
+        conn = engine.connect()
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+        if acquired:
+            conn.commit()
+            self.lock_connection = conn
+            return True
+        conn.close()
+        return False
+
+    def _lease(self) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        with Session(engine) as session:
+            result = session.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.holder == HOLDER_ID, SchedulerLease.expires_at < now),
+                )
+                .values(holder=HOLDER_ID, expires_at=expires_at)
+            )
+            session.commit()
+            if result.rowcount:
+                return True
+            try:
+                session.add(SchedulerLease(name=self.name, holder=HOLDER_ID, expires_at=expires_at))
+                session.commit()
+                return True
+            except IntegrityError:
+                # Another process holds a live lease
+                session.rollback()
+                return False
+
+    def _drop_connection(self):
+        if self.lock_connection is not None:
+            try:
+                self.lock_connection.close()
+            except Exception:
+                pass
+            self.lock_connection = None
+
+    def release(self):
+        """Gives up leadership on shutdown so another worker can take over immediately."""
+        try:
+            if self.lock_connection is not None:
+                self.lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+                self.lock_connection.commit()
+            elif self.is_leader:
+                with Session(engine) as session:
+                    session.execute(
+                        delete(SchedulerLease).where(
+                            SchedulerLease.name == self.name, SchedulerLease.holder == HOLDER_ID
+                        )
+                    )
+                    session.commit()
+        except Exception as e:
+            logger.error(f"Failed to release {self.name} leadership: {e}")
+        finally:
+            self._drop_connection()
+            self.is_leader = False
+
+
+elector = LeaderElector()
+
+
+def slot_start(moment: datetime, interval_minutes: int) -> datetime:
+    """Start of the fixed (epoch aligned, UTC) interval containing moment."""
+    interval = timedelta(minutes=interval_minutes)
+    return EPOCH + ((moment - EPOCH) // interval) * interval
+
+
+def due_intervals(job_name: str, interval_minutes: int, now: datetime = None):
+    """
+    Returns the start of every completed interval that has no finished run yet, or whose run
+    failed, oldest first. After downtime this catches up on missed intervals (bounded by
+    SCHEDULER_MAX_CATCHUP).
+    """
+    now = now or datetime.utcnow()
+    interval = timedelta(minutes=interval_minutes)
+    latest = slot_start(now, interval_minutes) - interval
+    oldest = latest - interval * (settings.SCHEDULER_MAX_CATCHUP - 1)
+
+    with Session(engine) as session:
+        last_done = session.exec(
+            select(func.max(JobRun.interval_start)).where(JobRun.job_name == job_name, JobRun.status == "done")
+        ).one()
+        # Failed runs are retried while inside the catch-up window, even behind a later done run
+        failed = session.exec(
+            select(JobRun.interval_start).where(
+                JobRun.job_name == job_name, JobRun.status == "failed", JobRun.interval_start >= oldest
+            )
+        ).all()
+
+    if last_done is None:
+        # First run ever: only the most recent interval
+        return sorted(set(failed) | {latest})
+    first = max(last_done + interval, oldest)
+    slots = set(failed)
+    while first <= latest:
+        slots.add(first)
+        first += interval
+    return sorted(slots)
+
+
+def claim_job_run(job_name: str, interval_start: datetime) -> bool:
+    """
+    Claims an interval for this process. The (job_name, interval_start) unique key makes runs
+    idempotent; runs left 'running' by a dead leader or marked 'failed' can be taken over.
+    """
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        try:
+            session.add(JobRun(job_name=job_name, interval_start=interval_start, holder=HOLDER_ID, started_at=now))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+        stale = now - timedelta(seconds=settings.SCHEDULER_JOB_TIMEOUT_SECONDS)
+        result = session.execute(
+            update(JobRun)
+            .where(
+                JobRun.job_name == job_name,
+                JobRun.interval_start == interval_start,
+                or_(JobRun.status == "failed", and_(JobRun.status == "running", JobRun.started_at < stale)),
+            )
+            .values(holder=HOLDER_ID, status="running", started_at=now, finished_at=None)
+        )
+        session.commit()
+        return bool(result.rowcount)
+
+
+def finish_job_run(job_name: str, interval_start: datetime, status: str, error: str = None):
+    """Records the outcome of a run: done, failed, or queued (a queue job reports the result later)."""
+    with Session(engine) as session:
+        run = session.exec(
+            select(JobRun).where(JobRun.job_name == job_name, JobRun.interval_start == interval_start)
+        ).first()
+        if run:
+            run.status = status
+            run.error = error
+            run.finished_at = None if status == "queued" else datetime.utcnow()
+            session.add(run)
+            session.commit()
+
+
+async def run_interval_job(job_name: str, interval_minutes: int, job):
+    """
+    Runs job(start, end) once for every due interval this process manages to claim. A job that
+    only enqueues work returns "queued"; the queue job then records done/failed itself.
+    """
+    interval = timedelta(minutes=interval_minutes)
+    for start in due_intervals(job_name, interval_minutes):
+        if not claim_job_run(job_name, start):
+            continue
+        logger.info(f"Running {job_name} for interval starting {start}")
+        # Root span; jobs enqueued by the run are traced under it
+        with span(f"scheduler {job_name}", **{"scheduler.interval_start": start.isoformat()}) as s:
+            try:
+                status = await job(start, start + interval)
+                finish_job_run(job_name, start, status or "done")
+            except Exception as e:
+                s.record_exception(e)
+                logger.error(f"Job {job_name} failed for interval {start}: {e}")
+                finish_job_run(job_name, start, "failed", str(e))
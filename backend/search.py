@@ -0,0 +1,224 @@
+import re
+from sqlalchemy import text
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Columns returned by search results (photos are fetched separately via the image endpoint)
+RESULT_COLUMNS = [
+    "id", "phone", "is_testimonial", "rating_air", "rating_washroom", "comment",
+    "terms_accepted", "ro_number", "status", "feedback_method", "session_id", "created_at",
+]
+
+# Shortest digit run treated as a phone number query
+MIN_PHONE_DIGITS = 3
+
+# --- SQLite (FTS5) ---
+# A separate FTS5 table keyed by feedback.id, kept in sync by triggers so that
+# every writer (ORM, bulk SQL, imports) updates the index.
+SQLITE_FTS_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts USING fts5(
+    comment, phone_digits, phone_rev, ro_number
+)
+"""
+
+SQLITE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS feedback_fts_ai AFTER INSERT ON feedback BEGIN
+        INSERT INTO feedback_fts(rowid, comment, phone_digits, phone_rev, ro_number)
+        VALUES (new.id, new.comment, phone_digits(new.phone), reverse_text(phone_digits(new.phone)), new.ro_number);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS feedback_fts_ad AFTER DELETE ON feedback BEGIN
+        DELETE FROM feedback_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS feedback_fts_au AFTER UPDATE OF comment, phone, ro_number ON feedback BEGIN
+        UPDATE feedback_fts
+        SET comment = new.comment,
+            phone_digits = phone_digits(new.phone),
+            phone_rev = reverse_text(phone_digits(new.phone)),
+            ro_number = new.ro_number
+        WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_FTS_BACKFILL = """
+INSERT INTO feedback_fts(rowid, comment, phone_digits, phone_rev, ro_number)
+SELECT id, comment, phone_digits(phone), reverse_text(phone_digits(phone)), ro_number FROM feedback
+"""
+
+# --- Postgres (tsvector + GIN) ---
+# Expression indexes keep themselves in sync; the query must use the exact same expressions.
+PG_DIGITS_EXPR = "regexp_replace(phone, '\\D', '', 'g')"
+PG_TSV_EXPR = (
+    "to_tsvector('simple', coalesce(comment, '') || ' ' || coalesce(ro_number, '') || ' ' || "
+    f"{PG_DIGITS_EXPR})"
+)
+PG_REV_EXPR = f"reverse({PG_DIGITS_EXPR})"
+
+PG_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS ix_feedback_search_tsv ON feedback USING GIN ({PG_TSV_EXPR})",
+    f"CREATE INDEX IF NOT EXISTS ix_feedback_search_phone_rev ON feedback ({PG_REV_EXPR} text_pattern_ops)",
+]
+
+# --- LIKE fallback ---
+# Portable digits-only phone expression, so formatted numbers ("+91 98765-43210") match
+# the same digit queries as the phone_digits column of the indexes
+LIKE_DIGITS_EXPR = "f.phone"
+for _separator in ("+", " ", "-", "(", ")", "."):
+    LIKE_DIGITS_EXPR = f"replace({LIKE_DIGITS_EXPR}, '{_separator}', '')"
+
+_fts_available = None
+
+
+def _digits(value):
+    return re.sub(r"\D", "", value) if value else ""
+
+
+def _reverse(value):
+    return value[::-1] if value else ""
+
+
+def register_sqlite_functions(dbapi_connection):
+    """Registers the helper SQL functions used by the FTS triggers on a raw sqlite3 connection."""
+    dbapi_connection.create_function("phone_digits", 1, _digits, deterministic=True)
+    dbapi_connection.create_function("reverse_text", 1, _reverse, deterministic=True)
+
+
+def create_search_index(engine):
+    """Creates the dialect specific search structures. Safe to call on every startup."""
+    global _fts_available
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feedback_fts'")
+                ).first()
+                conn.execute(text(SQLITE_FTS_DDL))
+                for trigger in SQLITE_FTS_TRIGGERS:
+                    conn.execute(text(trigger))
+                if not exists:
+                    # First run: index rows that were stored before search existed
+                    conn.execute(text(SQLITE_FTS_BACKFILL))
+                    logger.info("Search index created and backfilled")
+            elif dialect == "postgresql":
+                for ddl in PG_INDEXES:
+                    conn.execute(text(ddl))
+        _fts_available = dialect in ("sqlite", "postgresql")
+    except Exception as e:
+        # e.g. SQLite built without FTS5 - fall back to LIKE scans
+        logger.warning(f"Search index unavailable, falling back to LIKE search: {e}")
+        _fts_available = False
+
+
+def _tokens(query: str):
+    return re.findall(r"\w+", query.lower())
+
+
+def _columns(prefix="f."):
+    return ", ".join(prefix + c for c in RESULT_COLUMNS)
+
+
+def _sqlite_search(session, tokens, digits, limit, offset):
+    clauses = []
+    if tokens:
+        terms = " AND ".join(f'"{t}"*' for t in tokens)
+        clauses.append(f"({{comment phone_digits ro_number}} : ({terms}))")
+    if digits:
+        # Prefix match on digits, suffix match via the reversed digits column
+        clauses.append(f'(phone_digits : "{digits}"*)')
+        clauses.append(f'(phone_rev : "{digits[::-1]}"*)')
+    match = " OR ".join(clauses)
+
+    total = session.execute(
+        text("SELECT count(*) FROM feedback_fts WHERE feedback_fts MATCH :match"),
+        {"match": match},
+    ).scalar()
+    rows = session.execute(
+        text(
+            f"SELECT {_columns()}, bm25(feedback_fts) AS rank FROM feedback_fts "
+            "JOIN feedback f ON f.id = feedback_fts.rowid "
+            "WHERE feedback_fts MATCH :match "
+            "ORDER BY rank, f.created_at DESC LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit, "offset": offset},
+    ).mappings().all()
+    return total, rows
+
+
+def _postgres_search(session, tokens, digits, limit, offset):
+    conditions = []
+    params = {"limit": limit, "offset": offset}
+    rank = "0"
+    if tokens:
+        params["tsq"] = " & ".join(f"{t}:*" for t in tokens)
+        conditions.append(f"{PG_TSV_EXPR} @@ to_tsquery('simple', :tsq)")
+        rank = f"ts_rank({PG_TSV_EXPR}, to_tsquery('simple', :tsq))"
+    if digits:
+        params["rev"] = digits[::-1] + "%"
+        conditions.append(f"{PG_REV_EXPR} LIKE :rev")
+    where = " OR ".join(conditions)
+
+    total = session.execute(text(f"SELECT count(*) FROM feedback f WHERE {where}"), params).scalar()
+    rows = session.execute(
+        text(
+            f"SELECT {_columns()}, {rank} AS rank FROM feedback f WHERE {where} "
+            "ORDER BY rank DESC, f.created_at DESC LIMIT :limit OFFSET :offset"
+        ),
+        params,
+    ).mappings().all()
+    return total, rows
+
+
+def _like_search(session, tokens, digits, limit, offset):
+    conditions = []
+    params = {"limit": limit, "offset": offset}
+    for i, t in enumerate(tokens):
+        params[f"t{i}"] = f"%{t}%"
+        conditions.append(
+            f"(lower(f.comment) LIKE :t{i} OR lower(f.ro_number) LIKE :t{i} OR {LIKE_DIGITS_EXPR} LIKE :t{i})"
+        )
+    where = " AND ".join(conditions) or "1 = 0"
+    if digits:
+        # Prefix or suffix of the digits, like the indexed paths
+        params["digits_prefix"] = f"{digits}%"
+        params["digits_suffix"] = f"%{digits}"
+        where = f"({where}) OR {LIKE_DIGITS_EXPR} LIKE :digits_prefix OR {LIKE_DIGITS_EXPR} LIKE :digits_suffix"
+
+    total = session.execute(text(f"SELECT count(*) FROM feedback f WHERE {where}"), params).scalar()
+    rows = session.execute(
+        text(
+            f"SELECT {_columns()}, 0 AS rank FROM feedback f WHERE {where} "
+            "ORDER BY f.created_at DESC LIMIT :limit OFFSET :offset"
+        ),
+        params,
+    ).mappings().all()
+    return total, rows
+
+
+def search_feedback(session, query: str, page: int = 1, page_size: int = 50):
+    """
+    Ranked search over comment, phone and RO number.
+    Returns (total_matches, rows) where rows are mappings of RESULT_COLUMNS plus 'rank'.
+    """
+    tokens = _tokens(query)
+    digits = _digits(query)
+    if len(digits) < MIN_PHONE_DIGITS:
+        digits = ""
+    if not tokens and not digits:
+        return 0, []
+
+    limit = page_size
+    offset = (page - 1) * page_size
+    dialect = session.get_bind().dialect.name
+
+    if _fts_available and dialect == "sqlite":
+        return _sqlite_search(session, tokens, digits, limit, offset)
+    if _fts_available and dialect == "postgresql":
+        return _postgres_search(session, tokens, digits, limit, offset)
+    return _like_search(session, tokens, digits, limit, offset)
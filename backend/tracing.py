@@ -0,0 +1,419 @@
+"""
+Lightweight tracing in the OpenTelemetry data model (trace/span IDs, parent links, attributes,
+status, W3C traceparent), without the SDK dependency. Spans are exported in batches from a
+background thread to a JSON lines file and/or an OTLP/HTTP collector (e.g. a local Jaeger or
+otel-collector on :4318).
+
+The current span lives in a context variable, so it follows asyncio tasks and run_in_threadpool
+calls. Queue jobs carry the traceparent of the request that enqueued them (see jobs.enqueue), so
+a webhook and the background processing it caused end up in one trace.
+
+Offline summary of a trace file:
+    python -m backend.tracing logs/traces.jsonl --slowest 10
+"""
+import argparse
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "kind", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str = "internal", attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.status = "unset"
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        if self.sampled and value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_exception(self, exc: BaseException):
+        # Also used for errors the code handles itself (logged and swallowed)
+        self.status = "error"
+        self.error = f"{type(exc).__name__}: {exc}"[:1000]
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None."""
+    try:
+        version, trace_id, span_id, flags = value.strip().split("-")
+        if len(trace_id) != 32 or len(span_id) != 16 or int(trace_id, 16) == 0:
+            return None
+        return trace_id, span_id, bool(int(flags, 16) & 1)
+    except (AttributeError, ValueError):
+        return None
+
+
+def start_span(name: str, parent: Optional[str] = None, kind: str = "internal", attributes: dict = None) -> Span:
+    """
+    Starts a span under the current one (or under the `parent` traceparent, for work picked up
+    from a queue or an incoming request). Doesn't make it current; see span() for that.
+    """
+    current = _current.get()
+    remote = parse_traceparent(parent) if parent else None
+    if remote:
+        trace_id, parent_id, sampled = remote
+    elif current is not None:
+        trace_id, parent_id, sampled = current.trace_id, current.span_id, current.sampled
+    else:
+        # New trace; the sampling decision is made once here and inherited by every child
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, kind: str = "internal", **attributes):
+    """
+    Times the block as a child of the current span and makes it current inside the block.
+    Exceptions escaping the block mark the span as failed. A no-op when tracing is disabled.
+    """
+    if not settings.TRACING_ENABLED:
+        yield _NOOP
+        return
+    s = start_span(name, parent, kind, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    s = _current.get()
+    return s.traceparent if s is not None else None
+
+
+def set_attributes(**attributes):
+    """Adds attributes to the current span, if any (e.g. the RO of the feedback being handled)."""
+    s = _current.get()
+    if s is not None:
+        s.set_attributes(**attributes)
+
+
+class _NoopSpan:
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and writes them from a daemon thread, so exporting never blocks the
+    event loop. Spans are dropped (and counted) if the buffer is full, e.g. a collector is down.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 512, interval_seconds: float = 2.0):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.interval = interval_seconds
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"exported": 0, "dropped": 0, "failed_batches": 0}
+
+    def export(self, s: Span):
+        try:
+            self.queue.put_nowait(s)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def flush(self, timeout: float = 5.0):
+        # Called on shutdown: write whatever is still buffered
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch, timeout)
+
+    def _write(self, batch: list, timeout: float = 5.0):
+        try:
+            if settings.TRACING_FILE:
+                with open(settings.TRACING_FILE, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(s.to_dict(), default=str) + "\n" for s in batch))
+            if settings.TRACING_OTLP_ENDPOINT:
+                import httpx # Only needed with a collector configured
+                httpx.post(settings.TRACING_OTLP_ENDPOINT, json=_otlp_payload(batch), timeout=timeout).raise_for_status()
+            self.stats["exported"] += len(batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+
+exporter = SpanExporter()
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(batch: list) -> dict:
+    # OTLP/HTTP JSON encoding (ExportTraceServiceRequest)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.TRACING_SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "backend.tracing"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                        "name": s.name,
+                        "kind": _OTLP_KINDS.get(s.kind, 1),
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": 2, "message": s.error or ""} if s.status == "error" else {"code": 0},
+                    }
+                    for s in batch
+                ],
+            }],
+        }],
+    }
+
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request (continuing an incoming traceparent, if any). The trace ID is
+    returned in X-Trace-Id so a slow request reported by a client can be looked up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        parent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        name = f"{scope['method']} {scope['path']}"
+        with span(name, parent=parent, kind="server", **{"http.method": scope["method"], "http.target": scope["path"]}) as s:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    s.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        s.status = "error"
+                    if s.sampled:
+                        message.setdefault("headers", [])
+                        message["headers"] = list(message["headers"]) + [(b"x-trace-id", s.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            # Name by route template, not the raw path (keeps /feedback/{id}/image/... groupable)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                s.name = f"{scope['method']} {route.path}"
+
+
+def instrument_engine(db_engine):
+    """Spans for every statement on this engine (SELECT/INSERT/...), parented to the current span."""
+    system = db_engine.dialect.name
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def _start_statement(conn, cursor, statement, parameters, context, executemany):
+        if not settings.TRACING_ENABLED or not settings.TRACING_DB_STATEMENTS or _current.get() is None:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._trace_span = start_span(
+            f"db {verb}", kind="client",
+            attributes={"db.system": system, "db.statement": statement[:MAX_STATEMENT_LENGTH], "db.executemany": executemany or None},
+        )
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def _end_statement(conn, cursor, statement, parameters, context, executemany):
+        s = getattr(context, "_trace_span", None)
+        if s is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                s.set_attribute("db.rows", cursor.rowcount)
+            s.end()
+
+    @event.listens_for(db_engine, "handle_error")
+    def _fail_statement(exception_context):
+        s = getattr(exception_context.execution_context, "_trace_span", None)
+        if s is not None:
+            s.record_exception(exception_context.original_exception)
+            s.end()
+
+
+# Session commits (flush + COMMIT), the usual place where a request spends its DB write time
+@event.listens_for(OrmSession, "before_commit")
+def _start_commit(session):
+    if settings.TRACING_ENABLED and _current.get() is not None:
+        session.info["trace_commit"] = start_span("db.commit", kind="client")
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _end_commit(session):
+    s = session.info.pop("trace_commit", None)
+    if s is not None:
+        s.end()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _end_failed_commit(session):
+    s = session.info.pop("trace_commit", None)
+    if s is not None:
+        s.status = "error"
+        s.error = "rolled back"
+        s.end()
+
+
+def _percentile(values: list, p: float) -> float:
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def summarize(path: str, slowest: int = 5):
+    """Prints latency per span name and the breakdown of the slowest traces."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    if not spans:
+        print("No spans")
+        return
+
+    by_name = {}
+    for s in spans:
+        by_name.setdefault(s["name"], []).append(s["duration_ms"])
+    print(f"{'span':50} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, durations in sorted(by_name.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        print(f"{name[:50]:50} {len(durations):7} {_percentile(durations, 0.5):9.1f} {_percentile(durations, 0.95):9.1f} {durations[-1]:9.1f}")
+
+    traces = {}
+    for s in spans:
+        traces.setdefault(s["trace_id"], []).append(s)
+    # A trace's length: first start to last end, across the request and the jobs it queued
+    def trace_ms(items):
+        return (max(i["start"] * 1000 + i["duration_ms"] for i in items) - min(i["start"] * 1000 for i in items))
+
+    for trace_id, items in sorted(traces.items(), key=lambda item: -trace_ms(item[1]))[:slowest]:
+        print(f"\nTrace {trace_id}: {trace_ms(items):.1f} ms")
+        children = {}
+        for i in items:
+            children.setdefault(i["parent_id"], []).append(i)
+        ids = {i["span_id"] for i in items}
+        begin = min(i["start"] for i in items)
+
+        def show(node, depth):
+            offset = (node["start"] - begin) * 1000
+            attributes = ", ".join(f"{k}={v}" for k, v in node["attributes"].items() if k != "db.statement")
+            status = " ERROR " + (node["error"] or "") if node["status"] == "error" else ""
+            print(f"  {'  ' * depth}{node['name']} +{offset:.1f}ms {node['duration_ms']:.1f}ms {attributes}{status}")
+            for child in sorted(children.get(node["span_id"], []), key=lambda c: c["start"]):
+                show(child, depth + 1)
+
+        # Roots: no parent, or a parent that wasn't sampled into this file
+        for root in sorted([i for i in items if i["parent_id"] not in ids], key=lambda c: c["start"]):
+            show(root, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a trace file written with TRACING_FILE")
+    parser.add_argument("path", nargs="?", default=settings.TRACING_FILE)
+    parser.add_argument("--slowest", type=int, default=5, help="Traces to break down")
+    args = parser.parse_args()
+    summarize(args.path, args.slowest)
@@ -0,0 +1,96 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+from .database import engine
+from .models import Upload, UploadChunk
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def pending_uploads(session: Session, client: str) -> tuple:
+    """
+    (count, declared bytes, oldest created_at) of the uploads a client started that are neither
+    submitted nor expired.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    count, size, oldest = session.exec(
+        select(func.count(Upload.id), func.coalesce(func.sum(Upload.size), 0), func.min(Upload.created_at))
+        .where(Upload.client == client, Upload.created_at >= cutoff)
+    ).one()
+    return count, size, oldest
+
+
+def create_upload(session: Session, size: int, content_type: str, client: Optional[str] = None) -> Upload:
+    upload = Upload(id=uuid.uuid4().hex, size=size, content_type=content_type, client=client)
+    session.add(upload)
+    session.commit()
+    session.refresh(upload)
+    return upload
+
+
+def append_chunk(session: Session, upload_id: str, offset: int, data: bytes) -> Optional[int]:
+    """
+    Stores a chunk that must start exactly at the current offset. Returns the new offset, or
+    None if the offset doesn't match (e.g. a retried chunk that was already stored), in which
+    case the client resumes from the upload's current offset.
+    """
+    # Conditional update claims the byte range, so concurrent retries of the same chunk can't both land
+    result = session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.received == offset,
+            Upload.received + len(data) <= Upload.size,
+        )
+        .values(received=Upload.received + len(data))
+    )
+    if not result.rowcount:
+        session.rollback()
+        return None
+    session.add(UploadChunk(upload_id=upload_id, offset=offset, data=data))
+    session.commit()
+    return offset + len(data)
+
+
+def read_upload(session: Session, upload_id: str) -> Optional[bytes]:
+    """
+    Returns the assembled bytes of a complete upload, None if missing/incomplete. Only reads:
+    the caller consumes it with consume_uploads() right before committing, so no write
+    transaction (SQLite's write lock) is held while the photo is decoded and resized.
+    """
+    upload = session.get(Upload, upload_id)
+    if not upload or upload.received != upload.size:
+        return None
+    chunks = session.exec(
+        select(UploadChunk.data).where(UploadChunk.upload_id == upload_id).order_by(UploadChunk.offset)
+    ).all()
+    return b"".join(chunks)
+
+
+def consume_uploads(session: Session, upload_ids: list) -> bool:
+    """
+    Deletes uploads in the caller's transaction, so they're consumed only if it commits.
+    False if one of them is already gone (consumed by a concurrent submit).
+    """
+    if not upload_ids:
+        return True
+    session.execute(delete(UploadChunk).where(UploadChunk.upload_id.in_(upload_ids)))
+    deleted = session.execute(delete(Upload).where(Upload.id.in_(upload_ids))).rowcount
+    return deleted == len(set(upload_ids))
+
+
+def delete_expired_uploads() -> int:
+    """Removes uploads that were never finished or never referenced by a submission."""
+    cutoff = datetime.utcnow() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    with Session(engine) as session:
+        expired = select(Upload.id).where(Upload.created_at < cutoff)
+        session.execute(delete(UploadChunk).where(UploadChunk.upload_id.in_(expired)))
+        count = session.execute(delete(Upload).where(Upload.created_at < cutoff)).rowcount
+        session.commit()
+    if count:
+        logger.info(f"Deleted {count} expired uploads")
+    return count
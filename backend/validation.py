@@ -0,0 +1,24 @@
+import re
+from typing import Optional
+
+MIN_PHONE_DIGITS = 10
+MAX_PHONE_DIGITS = 15
+
+
+def phone_digits(phone: str) -> str:
+    return re.sub(r"\D", "", phone or "")
+
+
+def feedback_error(phone: str, rating_air: Optional[int], rating_washroom: Optional[int], terms_accepted: bool) -> Optional[str]:
+    """
+    The checks a feedback submission has to pass (web form and bulk import). Returns the error
+    message, or None if it's valid.
+    """
+    if not terms_accepted:
+        return "Terms and Conditions must be accepted"
+    if rating_air is None and rating_washroom is None:
+        return "At least one rating (Air or Washroom) is required"
+    # Allow +, spaces, dashes, but ensure 10-15 digits
+    if not MIN_PHONE_DIGITS <= len(phone_digits(phone)) <= MAX_PHONE_DIGITS:
+        return "Invalid phone number format"
+    return None
@@ -1,5 +1,5 @@
-import httpx
 from .config import settings
+from .tracing import span
 from .logger import get_logger
 
 logger = get_logger(__name__)
@@ -16,6 +16,7 @@ async def send_whatsapp_message(to_number: str, message_body: str):
         logger.warning("WhatsApp credentials missing. Skipping message.")
         return
 
+    import httpx # Imported on first use to keep startup fast
     url = f"https://graph.facebook.com/v17.0/{settings.WHATSAPP_PHONE_ID}/messages"
     headers = {
         "Authorization": f"Bearer {settings.WHATSAPP_TOKEN}",
@@ -35,15 +36,22 @@ async def send_whatsapp_message(to_number: str, message_body: str):
         "text": {"body": message_body},
     }
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            logger.info(f"WhatsApp message sent to {clean_number}")
-    except httpx.HTTPStatusError as e:
-        logger.error(f"WhatsApp API Error: {e.response.text}")
-    except Exception as e:
-        logger.error(f"Failed to send WhatsApp message: {e}")
+    # Errors propagate: as a queue job, a failed send is retried with backoff and dead-lettered
+    with span("whatsapp.send_message", kind="client", **{"whatsapp.type": "text", "message.length": len(message_body)}) as s:
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(url, headers=headers, json=payload)
+                s.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+                logger.info(f"WhatsApp message sent to {clean_number}")
+        except httpx.HTTPStatusError as e:
+            s.record_exception(e)
+            logger.error(f"WhatsApp API Error: {e.response.text}")
+            raise
+        except Exception as e:
+            s.record_exception(e)
+            logger.error(f"Failed to send WhatsApp message: {e}")
+            raise
 
 async def send_interactive_message(to_number: str, body_text: str, buttons: list):
     """
@@ -52,6 +60,7 @@ async def send_interactive_message(to_number: str, body_text: str, buttons: list
     """
     if not settings.ENABLE_WHATSAPP: return
 
+    import httpx # Imported on first use to keep startup fast
     url = f"https://graph.facebook.com/v17.0/{settings.WHATSAPP_PHONE_ID}/messages"
     headers = {
         "Authorization": f"Bearer {settings.WHATSAPP_TOKEN}",
@@ -85,13 +94,17 @@ async def send_interactive_message(to_number: str, body_text: str, buttons: list
         }
     }
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            logger.info(f"WhatsApp interactive message sent to {clean_number}")
-    except Exception as e:
-        logger.error(f"Failed to send WhatsApp interactive message: {e}")
+    with span("whatsapp.send_message", kind="client", **{"whatsapp.type": "interactive", "whatsapp.buttons": len(buttons)}) as s:
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(url, headers=headers, json=payload)
+                s.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+                logger.info(f"WhatsApp interactive message sent to {clean_number}")
+        except Exception as e:
+            s.record_exception(e)
+            logger.error(f"Failed to send WhatsApp interactive message: {e}")
+            raise
 
 async def download_media(media_id: str) -> bytes:
     """
@@ -99,25 +112,29 @@ async def download_media(media_id: str) -> bytes:
     """
     if not settings.ENABLE_WHATSAPP: return None
 
-    try:
-        async with httpx.AsyncClient() as client:
-            # 1. Get Media URL
-            url_info = f"https://graph.facebook.com/v17.0/{media_id}"
-            headers = {"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}"}
-            
-            resp_info = await client.get(url_info, headers=headers)
-            resp_info.raise_for_status()
-            media_url = resp_info.json().get("url")
-            
-            if not media_url:
-                logger.error("Media URL not found")
-                return None
+    import httpx
+    with span("whatsapp.download_media", kind="client", **{"whatsapp.media_id": media_id}) as s:
+        try:
+            async with httpx.AsyncClient() as client:
+                # 1. Get Media URL
+                url_info = f"https://graph.facebook.com/v17.0/{media_id}"
+                headers = {"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}"}
 
-            # 2. Download Media Binary
-            resp_media = await client.get(media_url, headers=headers)
-            resp_media.raise_for_status()
-            return resp_media.content
-            
-    except Exception as e:
-        logger.error(f"Failed to download media {media_id}: {e}")
-        return None
+                resp_info = await client.get(url_info, headers=headers)
+                resp_info.raise_for_status()
+                media_url = resp_info.json().get("url")
+
+                if not media_url:
+                    logger.error("Media URL not found")
+                    return None
+
+                # 2. Download Media Binary
+                resp_media = await client.get(media_url, headers=headers)
+                resp_media.raise_for_status()
+                s.set_attribute("media.bytes", len(resp_media.content))
+                return resp_media.content
+
+        except Exception as e:
+            s.record_exception(e)
+            logger.error(f"Failed to download media {media_id}: {e}")
+            raise
@@ -0,0 +1,264 @@
+"""
+Background job worker.
+
+Usage:
+    python -m backend.worker --concurrency 4
+
+Set JOB_WORKER_EMBEDDED=False on the web service when running this as a separate process.
+"""
+import argparse
+import asyncio
+import json
+import signal
+from datetime import datetime
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from .database import engine, create_db_and_tables
+from .jobs import claim_jobs, complete_job, fail_job, enqueue
+from .archive import archive_old_feedback
+from .uploads import delete_expired_uploads
+from .idempotency import delete_expired as delete_expired_idempotency
+from .scheduling import HOLDER_ID, finish_job_run
+from .tasks import send_immediate_negative_report, send_alert_report, generate_daily_report
+from .alerts import SERIAL_KEY as ALERTS_SERIAL_KEY, alert_elector, alert_engine, observe_feedback
+from .importer import ImportConflict, run_import
+from .photo_index import SERIAL_KEY as PHOTOS_SERIAL_KEY, match_feedback, backfill_photo_hashes
+from .whatsapp import send_whatsapp_message
+from .routers.whatsapp import process_whatsapp_message
+from .tracing import span
+from .config import settings
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+async def _process_whatsapp_message(phone: str, user_input: str, media_id: str = None):
+    with Session(engine) as session:
+        await process_whatsapp_message(phone, user_input, media_id, session)
+
+
+async def _generate_report(start: str, end: str, job_name: str = None):
+    await generate_daily_report(datetime.fromisoformat(start), datetime.fromisoformat(end))
+    if job_name:
+        finish_job_run(job_name, datetime.fromisoformat(start), "done")
+
+
+def _report_dead(error: str, start: str, end: str, job_name: str = None):
+    if job_name:
+        finish_job_run(job_name, datetime.fromisoformat(start), "failed", error)
+
+
+async def _archive():
+    # File and DB heavy; keep it off the event loop
+    await run_in_threadpool(archive_old_feedback)
+
+
+async def _cleanup_uploads():
+    await run_in_threadpool(delete_expired_uploads)
+
+
+async def _cleanup_idempotency():
+    await run_in_threadpool(delete_expired_idempotency)
+
+
+async def _observe_alerts(**event):
+    await run_in_threadpool(observe_feedback, **event)
+
+
+async def _run_import(import_id: str):
+    # Runs in slices so a large import never outlives the job's visibility timeout;
+    # each slice resumes from the checkpoint the previous one committed
+    try:
+        run = await run_in_threadpool(run_import, import_id, settings.IMPORT_SLICE_SECONDS)
+    except ImportConflict:
+        # An earlier slice that overran its timeout is still going (its thread can't be
+        # cancelled) and won't queue a successor; pick up after it's done with its slice
+        with Session(engine) as session:
+            enqueue(session, "import.run", {"import_id": import_id}, serial_key=f"import:{import_id}",
+                    delay_seconds=settings.IMPORT_SLICE_SECONDS)
+            session.commit()
+        return
+    if run.status == "running":
+        with Session(engine) as session:
+            enqueue(session, "import.run", {"import_id": import_id}, serial_key=f"import:{import_id}")
+            session.commit()
+
+
+async def _match_photos(feedback_id: int):
+    await run_in_threadpool(match_feedback, feedback_id)
+
+
+async def _backfill_photo_hashes(after_id: int = 0):
+    # One batch per job, then queue the next from where it stopped
+    next_id = await run_in_threadpool(backfill_photo_hashes, after_id)
+    if next_id is not None:
+        with Session(engine) as session:
+            enqueue(session, "photos.backfill", {"after_id": next_id}, priority=9, serial_key=PHOTOS_SERIAL_KEY)
+            session.commit()
+
+
+# Job kind -> async handler called with the job payload as keyword arguments
+HANDLERS = {
+    "whatsapp.send_message": send_whatsapp_message,
+    "whatsapp.process_message": _process_whatsapp_message,
+    "report.negative": send_immediate_negative_report,
+    "report.alert": send_alert_report,
+    "alerts.observe": _observe_alerts,
+    "import.run": _run_import,
+    "photos.match": _match_photos,
+    "photos.backfill": _backfill_photo_hashes,
+    "report.interval": _generate_report,
+    "archive.run": _archive,
+    "uploads.cleanup": _cleanup_uploads,
+    "idempotency.cleanup": _cleanup_idempotency,
+}
+
+# Tries at marking a finished job complete before leaving it to the visibility timeout
+COMPLETE_ATTEMPTS = 3
+COMPLETE_RETRY_DELAY_SECONDS = 0.5
+
+# Job kind -> called with the error and the payload once a job is dead-lettered
+ON_DEAD = {
+    "report.interval": _report_dead,
+}
+
+
+class Worker:
+    def __init__(self, concurrency: int, worker_id: str = HOLDER_ID):
+        self.concurrency = concurrency
+        self.worker_id = worker_id
+        self.stop_event = asyncio.Event()
+        self.active = set()
+        self.alerts_checked_at = None
+
+    async def execute(self, job_id: int, kind: str, payload: str, attempts: int, traceparent: str = None):
+        handler = HANDLERS.get(kind)
+        if not handler:
+            await self._fail(job_id, kind, payload, f"Unknown job kind: {kind}", permanent=True)
+            return
+        # Continues the trace of whatever enqueued the job (webhook, form submit, scheduler)
+        attributes = {"job.id": job_id, "job.kind": kind, "job.attempt": attempts, "job.payload_bytes": len(payload)}
+        with span(f"job {kind}", parent=traceparent, kind="consumer", **attributes) as s:
+            try:
+                await asyncio.wait_for(handler(**json.loads(payload)), timeout=settings.JOB_VISIBILITY_TIMEOUT_SECONDS)
+            except Exception as e:
+                s.record_exception(e)
+                await self._fail(job_id, kind, payload, f"{type(e).__name__}: {e}")
+                return
+        # Outside the handler's try: the side effects (message, email) already happened, so a
+        # failure to delete the job must not make it look failed and run again
+        await self._complete(job_id, kind)
+
+    async def _complete(self, job_id: int, kind: str):
+        for attempt in range(COMPLETE_ATTEMPTS):
+            try:
+                await run_in_threadpool(complete_job, job_id)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to complete job {job_id} ({kind}), attempt {attempt + 1}: {e}")
+                if attempt + 1 < COMPLETE_ATTEMPTS:
+                    await asyncio.sleep(COMPLETE_RETRY_DELAY_SECONDS * 2 ** attempt)
+        logger.error(
+            f"Job {job_id} ({kind}) succeeded but could not be marked complete; "
+            f"it runs again after its visibility timeout"
+        )
+
+    async def _fail(self, job_id: int, kind: str, payload: str, error: str, permanent: bool = False):
+        try:
+            status = await run_in_threadpool(fail_job, job_id, error, permanent=permanent)
+        except Exception as e:
+            # The claim lapses after the visibility timeout and the job is picked up again
+            logger.error(f"Failed to record failure of job {job_id} ({kind}): {e}")
+            return
+        if status == "dead" and kind in ON_DEAD:
+            try:
+                await run_in_threadpool(ON_DEAD[kind], error, **json.loads(payload))
+            except Exception as hook_error:
+                logger.error(f"Dead-letter hook for job {job_id} ({kind}) failed: {hook_error}")
+
+    async def check_alert_leadership(self):
+        """
+        Alert windows are per process, so one worker evaluates the rules; the others leave
+        alert jobs alone. The lease is renewed at a third of its lifetime.
+        """
+        now = asyncio.get_running_loop().time()
+        if self.alerts_checked_at is not None and now - self.alerts_checked_at < settings.SCHEDULER_LEASE_SECONDS / 3:
+            return
+        self.alerts_checked_at = now
+        was_leader = alert_elector.is_leader
+        if await run_in_threadpool(alert_elector.ensure_leadership) and not was_leader:
+            # Events handled elsewhere meanwhile: start from recent feedback, not stale windows
+            try:
+                await run_in_threadpool(alert_engine.rebuild)
+            except Exception as e:
+                alert_engine.invalidate()
+                logger.error(f"Failed to rebuild alert windows: {e}")
+
+    async def run(self):
+        logger.info(f"Job worker {self.worker_id} started with concurrency {self.concurrency}")
+        while not self.stop_event.is_set():
+            await self.check_alert_leadership()
+            free = self.concurrency - len(self.active)
+            if free <= 0:
+                # Bounded, so a long job doesn't let the alerts lease lapse
+                await asyncio.wait(self.active, timeout=settings.JOB_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                skip = () if alert_elector.is_leader else (ALERTS_SERIAL_KEY,)
+                jobs = await run_in_threadpool(claim_jobs, self.worker_id, free, skip)
+            except Exception as e:
+                logger.error(f"Failed to claim jobs: {e}")
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(self.execute(job.id, job.kind, job.payload, job.attempts, job.traceparent))
+                self.active.add(task)
+                task.add_done_callback(self.active.discard)
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), timeout=settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        # Let in-flight jobs finish; anything cut off is retried after its visibility timeout
+        if self.active:
+            await asyncio.wait(self.active)
+        if alert_elector.is_leader:
+            await run_in_threadpool(alert_elector.release)
+        logger.info(f"Job worker {self.worker_id} stopped")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+_embedded = None
+
+
+def start_embedded_worker():
+    """Runs a worker on the web process event loop (single-container deployments)."""
+    global _embedded
+    worker = Worker(settings.JOB_WORKER_CONCURRENCY)
+    _embedded = (worker, asyncio.get_running_loop().create_task(worker.run()))
+
+
+async def stop_embedded_worker():
+    global _embedded
+    if _embedded:
+        worker, task = _embedded
+        worker.stop()
+        await task
+        _embedded = None
+
+
+async def main(concurrency: int):
+    create_db_and_tables()
+    worker = Worker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the background job worker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
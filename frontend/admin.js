@@ -2,6 +2,7 @@ const API_URL = '/admin';
 let feedbackData = [];
 let airChart = null;
 let washroomChart = null;
+let trendChart = null;
 
 // DOM Elements
 const loginSection = document.getElementById('loginSection');
@@ -62,31 +63,50 @@ function showLogin() {
 function showDashboard() {
     loginSection.classList.add('hidden');
     dashboardSection.classList.remove('hidden');
+    // Charts come from small server-side aggregates, so they don't wait for the full report list
+    fetchAnalytics();
     fetchReports();
 }
 
-// Fetch Data
-async function fetchReports() {
+// Fetch Analytics (aggregated in SQL on the server)
+async function fetchAnalytics() {
     const token = localStorage.getItem('admin_token');
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || 'UTC';
     try {
-        const response = await fetch(`${API_URL}/reports`, {
+        const response = await fetch(`${API_URL}/analytics?bucket=day&tz=${encodeURIComponent(tz)}`, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
-
         if (response.ok) {
-            feedbackData = await response.json();
-            console.log('Reports fetched:', feedbackData.length);
-
+            const analytics = await response.json();
             try {
-                renderStats();
+                renderStats(analytics.summary);
             } catch (e) { console.error('Error rendering stats:', e); }
-
             try {
-                renderCharts();
+                renderCharts(analytics);
             } catch (e) { console.error('Error rendering charts:', e); }
+        } else if (response.status === 401) {
+            logoutBtn.click(); // Token expired
+        }
+    } catch (error) {
+        console.error('Error fetching analytics:', error);
+    }
+}
+
+// Fetch Data
+async function fetchReports() {
+    const token = localStorage.getItem('admin_token');
+    try {
+        // Photos are loaded per row as they scroll into view, not inlined as base64
+        const response = await fetch(`${API_URL}/reports?include_photos=false`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            feedbackData = await response.json();
+            tableWorker.postMessage({ type: 'load', rows: feedbackData });
+            fetchPhotoMatches();
 
             // Initialize filters
-            console.log('Initializing filters to 30days');
             try {
                 setQuickDate('30days');
                 const btn30 = document.querySelector('.quick-date-btn[data-range="30days"]');
@@ -107,11 +127,32 @@ async function fetchReports() {
     }
 }
 
+// Photos reused across submissions (perceptual hash matches, found by the job worker)
+async function fetchPhotoMatches() {
+    const token = localStorage.getItem('admin_token');
+    try {
+        const response = await fetch(`${API_URL}/photos/matches?limit=1000`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok) return;
+        photoMatches = new Map();
+        (await response.json()).forEach(m => {
+            // Flag both sides: the resubmission and the original
+            [m.feedback_id, m.match_feedback_id].forEach(id => {
+                if (!photoMatches.has(id)) photoMatches.set(id, []);
+                photoMatches.get(id).push(m);
+            });
+        });
+        rowPool.forEach(row => { row.dataset.id = ''; });
+        renderRows();
+    } catch (error) {
+        console.error('Error fetching photo matches:', error);
+    }
+}
+
 // Render Stats
-function renderStats() {
-    const total = feedbackData.length;
-    const resolved = feedbackData.filter(f => f.status === 'resolved').length;
-    const pending = total - resolved;
+function renderStats(summary) {
+    const { total, resolved, pending } = summary;
 
     // Assuming these IDs exist in the new HTML, if not, we might need to update HTML or ignore
     // The new HTML removed the stats cards at the top, so we might skip this or check if elements exist
@@ -123,14 +164,9 @@ function renderStats() {
 }
 
 // Render Charts
-function renderCharts() {
-    const airRatings = [0, 0, 0, 0]; // 0 index unused, 1-3 used
-    const washroomRatings = [0, 0, 0, 0];
-
-    feedbackData.forEach(f => {
-        if (f.rating_air >= 1 && f.rating_air <= 3) airRatings[f.rating_air]++;
-        if (f.rating_washroom >= 1 && f.rating_washroom <= 3) washroomRatings[f.rating_washroom]++;
-    });
+function renderCharts(analytics) {
+    const airRatings = [0, 1, 2, 3].map(r => analytics.ratings.air[r] || 0); // 0 index unused, 1-3 used
+    const washroomRatings = [0, 1, 2, 3].map(r => analytics.ratings.washroom[r] || 0);
 
     const ctxAir = document.getElementById('airRatingChart').getContext('2d');
     const ctxWash = document.getElementById('washroomRatingChart').getContext('2d');
@@ -140,6 +176,48 @@ function renderCharts() {
 
     airChart = new Chart(ctxAir, chartConfig('Air Facility', airRatings, '#3b82f6'));
     washroomChart = new Chart(ctxWash, chartConfig('Washroom', washroomRatings, '#10b981'));
+
+    const trendCanvas = document.getElementById('trendChart');
+    if (trendCanvas) {
+        if (trendChart) trendChart.destroy();
+        trendChart = new Chart(trendCanvas.getContext('2d'), trendChartConfig(analytics.trend));
+    }
+}
+
+function trendChartConfig(trend) {
+    return {
+        type: 'bar',
+        data: {
+            labels: trend.map(t => t.bucket.slice(0, 10)),
+            datasets: [
+                {
+                    label: 'Responses',
+                    data: trend.map(t => t.total),
+                    backgroundColor: '#93c5fd',
+                    borderRadius: 4,
+                    yAxisID: 'y'
+                },
+                {
+                    label: 'Negative %',
+                    type: 'line',
+                    data: trend.map(t => Math.round(t.negative_rate * 1000) / 10),
+                    borderColor: '#ef4444',
+                    backgroundColor: '#ef4444',
+                    tension: 0.3,
+                    yAxisID: 'y1'
+                }
+            ]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            scales: {
+                y: { beginAtZero: true, grid: { color: '#f0f0f0' }, ticks: { precision: 0 } },
+                y1: { beginAtZero: true, max: 100, position: 'right', grid: { display: false } },
+                x: { grid: { display: false } }
+            }
+        }
+    };
 }
 
 // Filter State
@@ -172,12 +250,18 @@ document.getElementById('filterMethod').addEventListener('change', (e) => {
     updateActiveFilters();
     renderTable();
 });
+let searchTimer = null;
 document.getElementById('filterSearch').addEventListener('input', (e) => {
-    filters.search = e.target.value.toLowerCase();
     toggleClearSearch(e.target.value);
-    renderTable();
+    // Wait for a pause in typing instead of filtering on every keystroke
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        filters.search = e.target.value.toLowerCase();
+        renderTable();
+    }, SEARCH_DEBOUNCE_MS);
 });
 document.getElementById('clearSearchBtn').addEventListener('click', () => {
+    clearTimeout(searchTimer);
     filters.search = '';
     document.getElementById('filterSearch').value = '';
     toggleClearSearch('');
@@ -284,109 +368,160 @@ function clearAllFilters() {
     document.querySelector('.quick-date-btn[data-range="30days"]').classList.add('active');
 }
 
-// Render Table
+// Table
+// Filtering and sorting run in table-worker.js; the table only materializes the rows in view
+// (plus some overscan) and reuses their <tr>s while scrolling. Thumbnails load when a row
+// scrolls near the viewport.
+const SEARCH_DEBOUNCE_MS = 150;
+const OVERSCAN_ROWS = 10;
+const PHOTO_TYPES = ['air', 'washroom', 'receipt'];
+
+const tableViewport = document.getElementById('tableViewport');
+const tableWorker = new Worker('table-worker.js');
+let filteredOrder = new Int32Array(0); // Positions in feedbackData, filtered and sorted
+let sortState = { key: 'created_at', dir: 'desc' };
+let querySeq = 0;
+let rowHeight = 0; // Measured from the first rendered row
+let renderScheduled = false;
+let photoMatches = new Map(); // feedback id -> photo matches it's part of
+
+const topSpacer = document.createElement('tr');
+const bottomSpacer = document.createElement('tr');
+topSpacer.className = bottomSpacer.className = 'table-spacer';
+topSpacer.innerHTML = bottomSpacer.innerHTML = '<td colspan="9"></td>';
+feedbackTableBody.append(topSpacer, bottomSpacer);
+const rowPool = [];
+
+const thumbnailObserver = new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+        if (!entry.isIntersecting) return;
+        const img = entry.target;
+        thumbnailObserver.unobserve(img);
+        if (img.dataset.src) img.src = img.dataset.src;
+    });
+}, { root: tableViewport, rootMargin: '200px 0px' });
+
+tableWorker.onmessage = (e) => {
+    const msg = e.data;
+    if (msg.type !== 'result' || msg.seq !== querySeq) return; // A newer query is on its way
+    filteredOrder = msg.order;
+    rowPool.forEach(row => { row.dataset.id = ''; }); // The rows may have changed on a reload
+    document.getElementById('resultsCount').textContent = `Showing ${filteredOrder.length} of ${feedbackData.length} results`;
+    document.getElementById('exportBtn').innerHTML = `<i class="fas fa-file-csv"></i> Export CSV (${filteredOrder.length})`;
+    tableViewport.scrollTop = 0;
+    renderRows();
+};
+
 function renderTable() {
-    feedbackTableBody.innerHTML = '';
-
-    const filteredData = feedbackData.filter(f => {
-        // Date Filter
-        // Parse created_at as UTC then convert to local YYYY-MM-DD
-        const getLocalDateStr = (dateStr) => {
-            // Append Z if missing to ensure it's treated as UTC
-            const d = new Date(dateStr.endsWith('Z') ? dateStr : dateStr + 'Z');
-            const year = d.getFullYear();
-            const month = String(d.getMonth() + 1).padStart(2, '0');
-            const day = String(d.getDate()).padStart(2, '0');
-            return `${year}-${month}-${day}`;
-        };
+    // Queries go to the worker in order after the load message, so no need to wait for 'loaded'
+    tableWorker.postMessage({ type: 'query', seq: ++querySeq, filters, sort: sortState });
+}
 
-        if (filters.dateStart) {
-            const fDate = getLocalDateStr(f.created_at);
-            console.log(`Checking Date: Record=${fDate} (${f.created_at}), Start=${filters.dateStart}`);
-            if (fDate < filters.dateStart) return false;
-        }
-        if (filters.dateEnd) {
-            const fDate = getLocalDateStr(f.created_at);
-            console.log(`Checking Date: Record=${fDate} (${f.created_at}), End=${filters.dateEnd}`);
-            if (fDate > filters.dateEnd) return false;
-        }
+tableViewport.addEventListener('scroll', () => {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        renderRows();
+    });
+}, { passive: true });
+window.addEventListener('resize', () => renderRows());
+
+document.querySelectorAll('#feedbackTable th[data-sort]').forEach(th => {
+    th.addEventListener('click', () => {
+        const key = th.dataset.sort;
+        sortState = {
+            key,
+            dir: sortState.key === key && sortState.dir === 'desc' ? 'asc' : 'desc'
+        };
+        document.querySelectorAll('#feedbackTable th[data-sort]').forEach(h => h.removeAttribute('aria-sort'));
+        th.setAttribute('aria-sort', sortState.dir === 'asc' ? 'ascending' : 'descending');
+        renderTable();
+    });
+});
 
-        // Status Filter
-        if (filters.status !== 'all' && f.status !== filters.status) return false;
+function createRow() {
+    const row = document.createElement('tr');
+    row.innerHTML = `
+        <td class="cell-thumb"><img alt="" decoding="async"><i class="fas fa-clone photo-flag" hidden></i></td>
+        <td></td><td></td><td></td><td></td><td></td><td></td>
+        <td><span class="status-badge"></span></td>
+        <td><button class="action-btn btn-view" title="View Details"><i class="fas fa-eye"></i></button></td>
+    `;
+    row.querySelector('.btn-view').addEventListener('click', () => viewDetails(Number(row.dataset.id)));
+    return row;
+}
 
-        // Method Filter
-        if (filters.method !== 'all' && f.feedback_method !== filters.method) return false;
+function fillRow(row, f) {
+    if (row.dataset.id === String(f.id)) return;
+    row.dataset.id = f.id;
+    const cells = row.cells;
+
+    const img = cells[0].firstElementChild;
+    const photo = (f.photos || []).find(type => PHOTO_TYPES.includes(type));
+    thumbnailObserver.unobserve(img);
+    img.removeAttribute('src');
+    img.dataset.src = photo ? `/feedback/${f.id}/image/${photo}` : '';
+    img.hidden = !photo;
+    if (photo) thumbnailObserver.observe(img);
+    const flag = cells[0].lastElementChild;
+    const matches = photoMatches.get(f.id);
+    flag.hidden = !matches;
+    flag.title = matches ? `Photo also submitted in feedback ${matchedIds(f.id, matches).map(id => `#${id}`).join(', ')}` : '';
+
+    cells[1].textContent = new Date(f.created_at + 'Z').toLocaleString();
+    cells[2].textContent = f.ro_number || '-';
+    cells[3].textContent = f.feedback_method || '-';
+    cells[4].textContent = f.phone;
+    cells[5].textContent = getEmoji(f.rating_air);
+    cells[6].textContent = getEmoji(f.rating_washroom);
+    const badge = cells[7].firstElementChild;
+    badge.className = `status-badge ${f.status === 'resolved' ? 'status-resolved' : 'status-pending'}`;
+    badge.textContent = f.status;
+}
 
-        // Search Filter (RO or Phone)
-        if (filters.search) {
-            const ro = (f.ro_number || '').toLowerCase();
-            const phone = f.phone.toLowerCase();
-            const dateStr = new Date(f.created_at).toLocaleDateString().toLowerCase();
-            if (!ro.includes(filters.search) && !phone.includes(filters.search) && !dateStr.includes(filters.search)) return false;
+function renderRows() {
+    const total = filteredOrder.length;
+    const height = rowHeight || 57;
+    const headerHeight = feedbackTableBody.offsetTop;
+    const scrolled = Math.max(0, tableViewport.scrollTop - headerHeight);
+    const first = Math.max(0, Math.floor(scrolled / height) - OVERSCAN_ROWS);
+    const last = Math.min(total, Math.ceil((scrolled + tableViewport.clientHeight) / height) + OVERSCAN_ROWS);
+    const visible = Math.max(0, last - first);
+
+    while (rowPool.length < visible) {
+        const row = createRow();
+        feedbackTableBody.insertBefore(row, bottomSpacer);
+        rowPool.push(row);
+    }
+    for (let k = 0; k < rowPool.length; k++) {
+        const row = rowPool[k];
+        if (k < visible) {
+            fillRow(row, feedbackData[filteredOrder[first + k]]);
+            row.hidden = false;
+        } else if (!row.hidden) {
+            row.hidden = true;
+            row.dataset.id = '';
         }
+    }
 
-        return true;
-    });
+    topSpacer.firstElementChild.style.height = `${first * height}px`;
+    bottomSpacer.firstElementChild.style.height = `${(total - last) * height}px`;
 
-    // Update Count
-    document.getElementById('resultsCount').textContent = `Showing ${filteredData.length} of ${feedbackData.length} results`;
-    document.getElementById('exportBtn').innerHTML = `<i class="fas fa-file-csv"></i> Export CSV (${filteredData.length})`;
-
-    filteredData.forEach(f => {
-        const row = document.createElement('tr');
-        const date = new Date(f.created_at + 'Z').toLocaleString();
-        const statusClass = f.status === 'resolved' ? 'status-resolved' : 'status-pending';
-
-        // Button Logic
-        const isResolved = f.status === 'resolved';
-
-        row.innerHTML = `
-            <td>${date}</td>
-            <td>${f.ro_number || '-'}</td>
-            <td>${f.feedback_method || '-'}</td>
-            <td>${f.phone}</td>
-            <td>${getEmoji(f.rating_air)}</td>
-            <td>${getEmoji(f.rating_washroom)}</td>
-            <td><span class="status-badge ${statusClass}">${f.status}</span></td>
-            <td>
-                <button class="action-btn btn-view" onclick="viewDetails(${f.id})" title="View Details"><i class="fas fa-eye"></i></button>
-            </td>
-        `;
-        feedbackTableBody.appendChild(row);
-    });
+    if (!rowHeight && visible) {
+        rowHeight = rowPool[0].getBoundingClientRect().height;
+        if (Math.abs(rowHeight - height) > 0.5) renderRows(); // Redo the spacers with the real height
+    }
+}
+
+function matchedIds(id, matches) {
+    return [...new Set(matches.map(m => (m.feedback_id === id ? m.match_feedback_id : m.feedback_id)))];
 }
 
 // Export to CSV
 function exportToCSV() {
-    // Re-apply filters to get current view data
-    const dataToExport = feedbackData.filter(f => {
-        // Date Filter
-        const getLocalDateStr = (dateStr) => {
-            const d = new Date(dateStr.endsWith('Z') ? dateStr : dateStr + 'Z');
-            const year = d.getFullYear();
-            const month = String(d.getMonth() + 1).padStart(2, '0');
-            const day = String(d.getDate()).padStart(2, '0');
-            return `${year}-${month}-${day}`;
-        };
-
-        if (filters.dateStart) {
-            const fDate = getLocalDateStr(f.created_at);
-            if (fDate < filters.dateStart) return false;
-        }
-        if (filters.dateEnd) {
-            const fDate = getLocalDateStr(f.created_at);
-            if (fDate > filters.dateEnd) return false;
-        }
-        if (filters.status !== 'all' && f.status !== filters.status) return false;
-        if (filters.method !== 'all' && f.feedback_method !== filters.method) return false;
-        if (filters.search) {
-            const ro = (f.ro_number || '').toLowerCase();
-            const phone = f.phone.toLowerCase();
-            const dateStr = new Date(f.created_at).toLocaleDateString().toLowerCase();
-            if (!ro.includes(filters.search) && !phone.includes(filters.search) && !dateStr.includes(filters.search)) return false;
-        }
-        return true;
-    });
+    // Same rows, in the same order, as the table
+    const dataToExport = Array.from(filteredOrder, i => feedbackData[i]);
 
     if (dataToExport.length === 0) {
         alert("No data to export");
@@ -473,6 +608,7 @@ window.toggleStatus = async (id, currentStatus) => {
         });
 
         if (response.ok) {
+            fetchAnalytics();
             fetchReports(); // Refresh data
         }
     } catch (error) {
@@ -507,18 +643,32 @@ window.viewDetails = (id) => {
     document.getElementById('modalComment').textContent = f.comment || 'No comment';
     document.getElementById('modalTestimonial').textContent = f.is_testimonial ? 'Yes' : 'No';
 
+    const matchesBox = document.getElementById('modalPhotoMatches');
+    const matches = photoMatches.get(f.id) || [];
+    matchesBox.innerHTML = '';
+    matchesBox.classList.toggle('hidden', matches.length === 0);
+    matches.forEach(m => {
+        const mine = m.feedback_id === f.id;
+        const line = document.createElement('p');
+        const otherRo = mine ? m.match_ro_number : m.ro_number;
+        line.textContent = `⚠️ ${mine ? m.photo_type : m.match_photo_type} photo matches the ${mine ? m.match_photo_type : m.photo_type} photo of `
+            + `feedback #${mine ? m.match_feedback_id : m.feedback_id}${otherRo ? ` (RO ${otherRo})` : ''}, ${m.distance} bits apart`;
+        matchesBox.appendChild(line);
+    });
+
     // Clear previous images
     document.querySelector('.modal-images').innerHTML = '';
 
-    addImage(f.photo_air, 'air', 'Air Facility Photo');
-    addImage(f.photo_washroom, 'washroom', 'Washroom Photo');
-    addImage(f.photo_receipt, 'receipt', 'Receipt Photo');
+    const photos = f.photos || [];
+    addImage(f, photos, 'air', 'Air Facility Photo');
+    addImage(f, photos, 'washroom', 'Washroom Photo');
+    addImage(f, photos, 'receipt', 'Receipt Photo');
 
     modal.classList.remove('hidden');
 };
 
-function addImage(imageData, type, label) {
-    if (!imageData) return;
+function addImage(f, photos, type, label) {
+    if (!photos.includes(type)) return;
 
     const container = document.querySelector('.modal-images');
     const imgContainer = document.createElement('div');
@@ -528,7 +678,7 @@ function addImage(imageData, type, label) {
     title.textContent = label;
 
     const img = document.createElement('img');
-    img.src = `data:image/jpeg;base64,${imageData}`;
+    img.src = `/feedback/${f.id}/image/${type}`;
 
     imgContainer.appendChild(title);
     imgContainer.appendChild(img);
@@ -0,0 +1,24 @@
+// Downscales and re-encodes photos off the main thread.
+// Message in: { id, file, maxEdge, quality, format }  Message out: { id, blob } or { id, error }
+self.onmessage = async (e) => {
+    const { id, file, maxEdge, quality, format } = e.data;
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+        const width = Math.round(bitmap.width * scale);
+        const height = Math.round(bitmap.height * scale);
+
+        const canvas = new OffscreenCanvas(width, height);
+        const ctx = canvas.getContext('2d');
+        // JPEG has no alpha channel - flatten transparent images onto white
+        ctx.fillStyle = '#fff';
+        ctx.fillRect(0, 0, width, height);
+        ctx.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+
+        const blob = await canvas.convertToBlob({ type: format, quality });
+        self.postMessage({ id, blob });
+    } catch (error) {
+        self.postMessage({ id, error: String(error) });
+    }
+};
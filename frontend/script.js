@@ -54,6 +54,142 @@ if (roInput) {
     }
 }
 
+// Photo uploads: downscale in the browser, then send in resumable chunks
+const DEFAULT_UPLOAD_CONFIG = { max_edge: 1600, quality: 0.8, format: 'image/jpeg', chunk_size: 256 * 1024, max_bytes: 10 * 1024 * 1024 };
+const MAX_CHUNK_RETRIES = 8;
+let uploadConfig = null;
+let imageWorker = null;
+let workerRequestId = 0;
+const workerRequests = new Map();
+// Finished upload IDs by file, so a retried submit doesn't upload the same photo again
+const completedUploads = new Map();
+// One key per feedback: a retry after a timeout replays the stored result instead of submitting twice
+let submissionKey = null;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+async function getUploadConfig() {
+    if (!uploadConfig) {
+        try {
+            const response = await fetch('/feedback/uploads/config');
+            uploadConfig = response.ok ? await response.json() : DEFAULT_UPLOAD_CONFIG;
+        } catch (error) {
+            uploadConfig = DEFAULT_UPLOAD_CONFIG;
+        }
+    }
+    return uploadConfig;
+}
+
+function getImageWorker() {
+    if (!imageWorker) {
+        imageWorker = new Worker('image-worker.js');
+        imageWorker.onmessage = (e) => {
+            const { id, blob, error } = e.data;
+            const request = workerRequests.get(id);
+            workerRequests.delete(id);
+            if (error) request.reject(new Error(error));
+            else request.resolve(blob);
+        };
+        // Worker failed to load or crashed: fail pending requests so photos fall back to the original
+        imageWorker.onerror = (e) => {
+            workerRequests.forEach(request => request.reject(new Error(e.message || 'Image worker error')));
+            workerRequests.clear();
+        };
+    }
+    return imageWorker;
+}
+
+function downscaleInWorker(file, config) {
+    return new Promise((resolve, reject) => {
+        const id = ++workerRequestId;
+        workerRequests.set(id, { resolve, reject });
+        getImageWorker().postMessage({ id, file, maxEdge: config.max_edge, quality: config.quality, format: config.format });
+    });
+}
+
+async function downscaleOnMainThread(file, config) {
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const scale = Math.min(1, config.max_edge / Math.max(bitmap.width, bitmap.height));
+    const canvas = document.createElement('canvas');
+    canvas.width = Math.round(bitmap.width * scale);
+    canvas.height = Math.round(bitmap.height * scale);
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+    bitmap.close();
+    return new Promise(resolve => canvas.toBlob(resolve, config.format, config.quality));
+}
+
+async function downscalePhoto(file, config) {
+    try {
+        const blob = typeof OffscreenCanvas !== 'undefined' && window.Worker
+            ? await downscaleInWorker(file, config)
+            : await downscaleOnMainThread(file, config);
+        // Keep the original if re-encoding didn't make it smaller (already small photo)
+        if (blob && blob.size < file.size) return blob;
+    } catch (error) {
+        console.warn('Could not downscale photo, uploading original:', error);
+    }
+    return file;
+}
+
+async function getUploadOffset(uploadId) {
+    const response = await fetch(`/feedback/uploads/${uploadId}`);
+    if (!response.ok) throw new Error(`Upload status failed (${response.status})`);
+    return (await response.json()).offset;
+}
+
+async function uploadPhoto(file) {
+    const key = `${file.name}:${file.size}:${file.lastModified}`;
+    if (completedUploads.has(key)) return completedUploads.get(key);
+
+    const config = await getUploadConfig();
+    const blob = await downscalePhoto(file, config);
+    if (blob.size > config.max_bytes) throw new Error('Photo is too large');
+
+    const created = await fetch('/feedback/uploads/', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ size: blob.size, content_type: blob.type || 'application/octet-stream' })
+    });
+    if (!created.ok) throw new Error(`Could not start upload (${created.status})`);
+    const { upload_id: uploadId, chunk_size: chunkSize } = await created.json();
+
+    let offset = 0;
+    let failures = 0;
+    while (offset < blob.size) {
+        try {
+            const response = await fetch(`/feedback/uploads/${uploadId}`, {
+                method: 'PATCH',
+                headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+                body: blob.slice(offset, offset + chunkSize)
+            });
+            // 409: the server already has more than we thought (e.g. the response to a sent chunk was lost)
+            if (response.ok || response.status === 409) {
+                offset = (await response.json()).offset;
+                failures = 0;
+                continue;
+            }
+            if (response.status < 500 && response.status !== 429) {
+                throw Object.assign(new Error(`Upload failed (${response.status})`), { fatal: true });
+            }
+            throw new Error(`Upload failed (${response.status})`);
+        } catch (error) {
+            if (error.fatal || ++failures > MAX_CHUNK_RETRIES) throw error;
+            // Back off, then ask the server where to resume
+            await sleep(Math.min(1000 * 2 ** (failures - 1), 15000));
+            try {
+                offset = await getUploadOffset(uploadId);
+            } catch (statusError) {
+                // Still offline; retry the same chunk
+            }
+        }
+    }
+    completedUploads.set(key, uploadId);
+    return uploadId;
+}
+
 form.addEventListener('submit', async (e) => {
     e.preventDefault();
     const submitBtn = document.getElementById('submitBtn');
@@ -113,8 +249,21 @@ form.addEventListener('submit', async (e) => {
     });
 
     try {
+        // Photos go through the resumable upload endpoint; the submit only references them
+        for (const field of ['photo_air', 'photo_washroom', 'photo_receipt']) {
+            formData.delete(field);
+            const input = document.getElementById(field);
+            if (input && input.files.length > 0) {
+                submitBtn.textContent = 'Uploading photos...';
+                formData.append(`${field}_upload`, await uploadPhoto(input.files[0]));
+            }
+        }
+        submitBtn.textContent = 'Submitting...';
+
+        if (!submissionKey) submissionKey = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
         const response = await fetch('/feedback/', {
             method: 'POST',
+            headers: { 'Idempotency-Key': submissionKey },
             body: formData
         });
 
@@ -123,10 +272,17 @@ form.addEventListener('submit', async (e) => {
             messageDiv.classList.remove('hidden');
             messageDiv.classList.add('success');
             form.reset();
+            completedUploads.clear();
+            submissionKey = null;
             // Reset visual states
             document.querySelectorAll('.emoji-btn').forEach(b => b.classList.remove('selected'));
             document.querySelectorAll('.file-btn').forEach(b => b.textContent = 'Choose File');
         } else {
+            // Uploads may have expired; upload them again on the next attempt
+            if (response.status === 400) {
+                completedUploads.clear();
+                submissionKey = null;
+            }
             throw new Error('Submission failed');
         }
     } catch (error) {
@@ -0,0 +1,126 @@
+// Filters and sorts the admin feedback table off the main thread.
+// The rows are indexed once when loaded: every query then only compares precomputed fields,
+// walking a cached sort order instead of sorting.
+// Messages in:  { type: 'load', rows }  { type: 'query', seq, filters, sort: { key, dir } }
+// Messages out: { type: 'loaded', count }  { type: 'result', seq, order (Int32Array of row positions) }
+let count = 0;
+let days;       // Int32Array, local date as YYYYMMDD
+let times;      // Float64Array, created_at in ms
+let airRatings; // Int8Array, 0 when not rated
+let washroomRatings;
+let statuses = [];
+let methods = [];
+let searchText = [];
+let roNumbers = [];
+let phones = [];
+let sortOrders = {}; // sort key -> Int32Array of row positions, ascending
+
+function parseUTC(value) {
+    // created_at comes back naive (UTC) from the API
+    return Date.parse(value.endsWith('Z') ? value : value + 'Z');
+}
+
+function dayNumber(d) {
+    return d.getFullYear() * 10000 + (d.getMonth() + 1) * 100 + d.getDate();
+}
+
+function load(rows) {
+    count = rows.length;
+    days = new Int32Array(count);
+    times = new Float64Array(count);
+    airRatings = new Int8Array(count);
+    washroomRatings = new Int8Array(count);
+    statuses = new Array(count);
+    methods = new Array(count);
+    searchText = new Array(count);
+    roNumbers = new Array(count);
+    phones = new Array(count);
+    sortOrders = {};
+
+    // toLocaleDateString is slow, and most rows share a day with their neighbours
+    const localeDates = new Map();
+    for (let i = 0; i < count; i++) {
+        const f = rows[i];
+        const time = parseUTC(f.created_at);
+        const d = new Date(time);
+        const day = dayNumber(d);
+        let localeDate = localeDates.get(day);
+        if (localeDate === undefined) {
+            localeDate = d.toLocaleDateString().toLowerCase();
+            localeDates.set(day, localeDate);
+        }
+        times[i] = time;
+        days[i] = day;
+        airRatings[i] = f.rating_air || 0;
+        washroomRatings[i] = f.rating_washroom || 0;
+        statuses[i] = f.status;
+        methods[i] = f.feedback_method;
+        roNumbers[i] = (f.ro_number || '').toLowerCase();
+        phones[i] = (f.phone || '').toLowerCase();
+        // Search matches RO number, phone or the displayed date
+        searchText[i] = `${roNumbers[i]}\n${phones[i]}\n${localeDate}`;
+    }
+}
+
+function compareBy(key) {
+    const byText = (values) => (a, b) => (values[a] < values[b] ? -1 : values[a] > values[b] ? 1 : times[a] - times[b]);
+    const byNumber = (values) => (a, b) => values[a] - values[b] || times[a] - times[b];
+    switch (key) {
+        case 'ro_number': return byText(roNumbers);
+        case 'feedback_method': return byText(methods);
+        case 'phone': return byText(phones);
+        case 'status': return byText(statuses);
+        case 'rating_air': return byNumber(airRatings);
+        case 'rating_washroom': return byNumber(washroomRatings);
+        default: return (a, b) => times[a] - times[b] || a - b;
+    }
+}
+
+function sortOrder(key) {
+    if (!sortOrders[key]) {
+        const order = new Int32Array(count);
+        for (let i = 0; i < count; i++) order[i] = i;
+        order.sort(compareBy(key));
+        sortOrders[key] = order;
+    }
+    return sortOrders[key];
+}
+
+function toDayNumber(value) {
+    // 'YYYY-MM-DD' from the date inputs
+    return value ? Number(value.replace(/-/g, '')) : 0;
+}
+
+function query(filters, sort) {
+    const start = toDayNumber(filters.dateStart);
+    const end = toDayNumber(filters.dateEnd);
+    const status = filters.status !== 'all' ? filters.status : null;
+    const method = filters.method !== 'all' ? filters.method : null;
+    const search = filters.search || '';
+
+    const order = sortOrder(sort.key);
+    const matches = new Int32Array(count);
+    let n = 0;
+    const descending = sort.dir === 'desc';
+    for (let k = 0; k < count; k++) {
+        const i = order[descending ? count - 1 - k : k];
+        if (start && days[i] < start) continue;
+        if (end && days[i] > end) continue;
+        if (status !== null && statuses[i] !== status) continue;
+        if (method !== null && methods[i] !== method) continue;
+        if (search && !searchText[i].includes(search)) continue;
+        matches[n++] = i;
+    }
+    return matches.slice(0, n);
+}
+
+self.onmessage = (e) => {
+    const msg = e.data;
+    if (msg.type === 'load') {
+        load(msg.rows);
+        self.postMessage({ type: 'loaded', count });
+    } else if (msg.type === 'query') {
+        const order = query(msg.filters, msg.sort);
+        self.postMessage({ type: 'result', seq: msg.seq, order }, [order.buffer]);
+    }
+};
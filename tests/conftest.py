@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so the environment has to be in place before backend is imported
+_tmp = tempfile.mkdtemp(prefix="feedback-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+for key, value in {
+    "SECRET_KEY": "test", "ADMIN_USERNAME": "admin", "ADMIN_PASSWORD": "pw",
+    "MAIL_USERNAME": "u", "MAIL_PASSWORD": "p", "MAIL_FROM": "reports@example.com", "MAIL_PORT": "587",
+    "MAIL_SERVER": "localhost", "MAIL_FROM_NAME": "Feedback", "MAIL_TO": "ops@example.com",
+    "TRACING_ENABLED": "false",
+}.items():
+    os.environ.setdefault(key, value)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(_tmp) # Reports and logs are written to the working directory
+os.symlink(os.path.join(ROOT, "frontend"), os.path.join(_tmp, "frontend")) # Mounted by backend.main
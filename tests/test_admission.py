@@ -0,0 +1,48 @@
+import asyncio
+
+from backend.admission import AdmissionMiddleware, admission, client_ip
+from backend.config import settings
+
+
+def _scope(peer, *forwarded, path="/feedback/"):
+    return {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "client": (peer, 50000),
+        "headers": [(b"x-forwarded-for", value.encode()) for value in forwarded],
+    }
+
+
+def test_forwarded_for_is_ignored_from_untrusted_peers():
+    assert client_ip(_scope("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+
+def test_right_most_untrusted_hop_is_the_client():
+    # The client prepended a fake address; the proxy appended the one it saw
+    assert client_ip(_scope("10.0.0.5", "1.2.3.4, 198.51.100.1")) == "198.51.100.1"
+    assert client_ip(_scope("10.0.0.5", "1.2.3.4", "198.51.100.1, 10.0.0.9")) == "198.51.100.1"
+
+
+def test_all_trusted_hops_fall_back_to_the_left_most():
+    assert client_ip(_scope("127.0.0.1", "10.0.0.2, 10.0.0.3")) == "10.0.0.2"
+    assert client_ip(_scope("127.0.0.1")) == "127.0.0.1"
+
+
+def test_webhook_is_exempt_from_the_ip_bucket(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_BURST", 1)
+    statuses = []
+
+    async def app(scope, receive, send):
+        statuses.append(200)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    middleware = AdmissionMiddleware(app, paths=["/feedback/", "/whatsapp/webhook"], ip_exempt=["/whatsapp/webhook"])
+    for path in ["/whatsapp/webhook"] * 3 + ["/feedback/"] * 2:
+        asyncio.run(middleware(_scope("192.0.2.50", path=path), None, send))
+    assert statuses == [200, 200, 200, 200, 429]
+    admission.backend.buckets.clear()
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, delete, select
+
+from backend import alerts
+from backend.alerts import AlertEngine, observe_feedback
+from backend.database import engine, create_db_and_tables
+from backend.jobs import claim_jobs, enqueue
+from backend.models import Alert, Feedback, Job
+
+
+@pytest.fixture(autouse=True)
+def clean_db(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Job))
+        session.exec(delete(Alert))
+        session.exec(delete(Feedback))
+        session.commit()
+    monkeypatch.setattr(alerts, "alert_engine", AlertEngine("ro:negatives>=2/30m"))
+
+
+def _negative(ro_number="RO1"):
+    with Session(engine) as session:
+        feedback = Feedback(phone="9876543210", ro_number=ro_number, rating_air=1, terms_accepted=True)
+        session.add(feedback)
+        session.commit()
+        session.refresh(feedback)
+        return dict(feedback_id=feedback.id, ro_number=ro_number, rating_air=1, rating_washroom=None,
+                    created_at=feedback.created_at.isoformat())
+
+
+def _alert_count():
+    with Session(engine) as session:
+        return len(session.exec(select(Alert)).all())
+
+
+def test_observe_is_idempotent_per_feedback():
+    first = _negative()
+    # The engine isn't loaded yet, so this rebuilds the windows, already counting the event
+    assert observe_feedback(**first) == 0
+    second = _negative()
+    assert observe_feedback(**second) == 1
+    # A retry of either event neither counts it twice nor alerts again
+    assert observe_feedback(**second) == 0
+    assert observe_feedback(**first) == 0
+    assert alerts.alert_engine.windows[(0, "RO1")].value == 2
+    assert _alert_count() == 1
+
+
+def test_failed_commit_is_retried_in_full(monkeypatch):
+    events = [_negative()]
+    observe_feedback(**events[0])
+    events.append(_negative())
+
+    def broken_enqueue(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(alerts, "enqueue", broken_enqueue)
+        with pytest.raises(RuntimeError):
+            observe_feedback(**events[1])
+    assert _alert_count() == 0
+
+    # No cooldown was started by the failed attempt, and the retry doesn't double count
+    assert observe_feedback(**events[1]) == 1
+    assert alerts.alert_engine.windows[(0, "RO1")].value == 2
+    assert _alert_count() == 1
+
+
+def test_alert_jobs_are_left_to_the_leader():
+    with Session(engine) as session:
+        enqueue(session, "alerts.observe", _negative(), serial_key=alerts.SERIAL_KEY)
+        enqueue(session, "uploads.cleanup", {})
+        session.commit()
+    assert [job.kind for job in claim_jobs("follower", 10, (alerts.SERIAL_KEY,))] == ["uploads.cleanup"]
+    assert [job.kind for job in claim_jobs("leader", 10)] == ["alerts.observe"]
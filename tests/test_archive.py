@@ -0,0 +1,63 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, delete, func, select
+
+from backend import archive
+from backend.archive import archive_old_feedback
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.models import ArchiveIndex, ArchiveSegment, Feedback, SchedulerLease
+
+
+@pytest.fixture(autouse=True)
+def old_feedback(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_AFTER_DAYS", 30)
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    create_db_and_tables()
+    with Session(engine) as session:
+        for model in (Feedback, ArchiveIndex, ArchiveSegment, SchedulerLease):
+            session.exec(delete(model))
+        old = datetime.utcnow() - timedelta(days=60)
+        session.add_all([Feedback(phone=f"98765432{i:02d}", rating_air=3, terms_accepted=True, created_at=old) for i in range(5)])
+        session.commit()
+
+
+def _segments():
+    with Session(engine) as session:
+        return session.exec(select(func.count(ArchiveSegment.name))).one()
+
+
+def test_concurrent_run_in_the_same_process_is_skipped(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+    archive_batch = archive.archive_batch
+
+    def slow_batch(*args):
+        started.set()
+        finish.wait(5)
+        return archive_batch(*args)
+
+    monkeypatch.setattr(archive, "archive_batch", slow_batch)
+    first = threading.Thread(target=archive_old_feedback)
+    first.start()
+    started.wait(5)
+    # E.g. the retry of a job whose thread outlived its visibility timeout
+    assert archive_old_feedback() == 0
+    finish.set()
+    first.join()
+    assert _segments() == 1
+
+
+def test_run_is_skipped_while_another_process_holds_the_lease():
+    with Session(engine) as session:
+        session.add(SchedulerLease(name="archive", holder="other-host:1:abc", expires_at=datetime.utcnow() + timedelta(minutes=5)))
+        session.commit()
+    assert archive_old_feedback() == 0
+    assert _segments() == 0
+
+
+def test_lease_is_released_after_a_run():
+    assert archive_old_feedback() == 5
+    with Session(engine) as session:
+        assert session.get(SchedulerLease, "archive") is None
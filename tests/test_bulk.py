@@ -0,0 +1,116 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, delete, select
+
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.main import app
+from backend.models import Feedback
+from backend.routers.admin import BULK_CHUNK_SIZE
+
+
+@pytest.fixture
+def client(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Feedback))
+        session.commit()
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    client = TestClient(app)
+    token = client.post("/admin/login", data={"username": "admin", "password": "pw"}).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+@pytest.fixture
+def statements():
+    # SQL statements sent to the database, to check ID lists are chunked
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield sent
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def _add(count, **fields):
+    with Session(engine) as session:
+        rows = [Feedback(phone="9876543210", terms_accepted=True, **fields) for _ in range(count)]
+        session.add_all(rows)
+        session.commit()
+        return [row.id for row in rows]
+
+
+def _statuses():
+    with Session(engine) as session:
+        return dict(session.exec(select(Feedback.id, Feedback.status)).all())
+
+
+def test_empty_target_is_rejected(client):
+    _add(2)
+    for body in ({"status": "resolved"}, {"status": "resolved", "ids": []}, {"status": "resolved", "filter": {}}):
+        assert client.patch("/admin/feedback/bulk/status", json=body).status_code == 400
+    for body in ({}, {"ids": []}, {"filter": {"negative_only": False}}):
+        assert client.post("/admin/feedback/bulk/delete", json=body).status_code == 400
+    assert set(_statuses().values()) == {"pending"}
+
+
+def test_status_update_reports_locked_and_missing_rows(client):
+    pending = _add(2)
+    resolved = _add(1, status="resolved")
+    missing = max(pending + resolved) + 100
+
+    response = client.patch(
+        "/admin/feedback/bulk/status",
+        json={"ids": pending + resolved + [missing, pending[0]], "status": "resolved"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["matched"] == 3
+    assert result["updated"] == pending
+    assert result["locked"] == resolved
+    assert result["not_found"] == [missing]
+    assert set(_statuses().values()) == {"resolved"}
+
+    # Resolved rows stay locked, also when targeted through a filter
+    result = client.patch(
+        "/admin/feedback/bulk/status", json={"filter": {"status": "resolved"}, "status": "pending"}
+    ).json()
+    assert result["updated"] == []
+    assert result["locked"] == sorted(pending + resolved)
+    assert result["not_found"] == []
+
+
+def test_id_lists_are_chunked(client, statements):
+    ids = _add(BULK_CHUNK_SIZE * 2 + 1)
+    missing = [ids[-1] + 1, ids[-1] + 2]
+
+    result = client.patch(
+        "/admin/feedback/bulk/status", json={"ids": ids + missing, "status": "resolved"}
+    ).json()
+    assert result["updated"] == ids
+    assert result["not_found"] == missing
+    updates = [s for s in statements if s.startswith("UPDATE feedback")]
+    assert len(updates) == 3
+    assert set(_statuses().values()) == {"resolved"}
+
+    statements.clear()
+    result = client.post("/admin/feedback/bulk/delete", json={"ids": ids + missing}).json()
+    assert result["matched"] == len(ids)
+    assert result["deleted"] == ids
+    assert result["not_found"] == missing
+    assert len([s for s in statements if s.startswith("DELETE FROM feedback ")]) == 3
+    assert _statuses() == {}
+
+
+def test_delete_by_filter(client):
+    kept = _add(2, ro_number="RO-1")
+    deleted = _add(2, ro_number="RO-2")
+
+    result = client.post("/admin/feedback/bulk/delete", json={"filter": {"ro_number": "RO-2"}}).json()
+    assert result["deleted"] == deleted
+    assert result["not_found"] == []
+    assert sorted(_statuses()) == kept
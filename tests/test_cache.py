@@ -0,0 +1,45 @@
+import pytest
+from sqlmodel import Session, delete
+
+from backend.cache import REPORTS, ResponseCache
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.models import CacheVersion
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(CacheVersion))
+        session.commit()
+
+
+def _cache():
+    return ResponseCache(max_bytes=1024 * 1024, ttl_seconds=300)
+
+
+def test_invalidation_reaches_other_workers():
+    worker_a, worker_b = _cache(), _cache()
+    key = worker_b.make_key(REPORTS, endpoint="reports")
+    worker_b.set(key, b"[]")
+
+    worker_a.invalidate(REPORTS)
+    assert worker_b.get(worker_b.make_key(REPORTS, endpoint="reports")) is None
+
+
+def test_replica_reads_are_not_cached_right_after_an_invalidation(monkeypatch):
+    worker_a, worker_b = _cache(), _cache()
+    worker_a.invalidate(REPORTS)
+
+    key = worker_b.make_key(REPORTS, endpoint="reports", db="replica")
+    worker_b.set(key, b"[]", "replica")
+    assert worker_b.get(key) is None
+    primary_key = worker_b.make_key(REPORTS, endpoint="reports", db="primary")
+    worker_b.set(primary_key, b"[]", "primary")
+    assert worker_b.get(primary_key) == b"[]"
+
+    # Once the replica has had time to catch up, its results are cached again
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", 0)
+    worker_b.set(key, b"[]", "replica")
+    assert worker_b.get(key) == b"[]"
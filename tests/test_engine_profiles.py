@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.engine_profiles import SQLiteWriterQueue, WriterQueueBusy
+
+
+@pytest.fixture
+def busy_queue():
+    # Another thread (e.g. a threadpool job) is mid-write
+    queue = SQLiteWriterQueue(timeout_seconds=5, loop_timeout_seconds=0.01)
+    holder = {}
+    acquired, done = threading.Event(), threading.Event()
+
+    def writer():
+        queue.acquire(holder)
+        acquired.set()
+        done.wait(5)
+        queue.release(holder)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    acquired.wait(5)
+    yield queue, done
+    done.set()
+    thread.join()
+
+
+def test_event_loop_thread_fails_fast_instead_of_blocking(busy_queue):
+    queue, _ = busy_queue
+
+    async def write_on_loop():
+        queue.acquire({})
+
+    with pytest.raises(WriterQueueBusy):
+        asyncio.run(write_on_loop())
+    assert queue.stats["loop_busy"] == 1
+
+
+def test_threadpool_writer_waits_its_turn(busy_queue):
+    queue, done = busy_queue
+    info = {}
+    threading.Timer(0.05, done.set).start()
+    queue.acquire(info)
+    assert info["writer"]
+    queue.release(info)
+
+
+def test_second_loop_connection_fails_fast_while_another_holds_the_lock(tmp_path, monkeypatch):
+    from sqlalchemy import text
+
+    from backend.config import settings
+    from backend.engine_profiles import create_profiled_engine, pool_stats
+
+    monkeypatch.setattr(settings, "SQLITE_BUSY_TIMEOUT_MS", 3000)
+    engine = create_profiled_engine(f"sqlite:///{tmp_path / 'queue.db'}", "sqlite")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+
+    async def two_sessions_on_the_loop():
+        # E.g. a submit mid-transaction while another request's handler writes
+        with engine.connect() as first, engine.connect() as second:
+            first.execute(text("INSERT INTO t VALUES (1)"))
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(WriterQueueBusy):
+                second.execute(text("INSERT INTO t VALUES (2)"))
+            first.commit()
+            return asyncio.get_running_loop().time() - started
+
+    elapsed = asyncio.run(two_sessions_on_the_loop())
+    assert elapsed < 0.5 # Not SQLite's busy_timeout
+    assert pool_stats(engine)["writer_queue"]["loop_busy"] == 1
+    engine.dispose()
@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete, func, select
+
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.idempotency import REPLAY_HEADER, header_key
+from backend.main import app
+from backend.models import Feedback, IdempotencyRecord, Job
+
+
+@pytest.fixture
+def client(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        for model in (Feedback, IdempotencyRecord, Job):
+            session.exec(delete(model))
+        session.commit()
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    return TestClient(app)
+
+
+def _submit(client, key):
+    form = {"phone": "9876543210", "rating_air": "2", "terms_accepted": "true", "comment": "Queue was long"}
+    return client.post("/feedback/", data=form, headers={"Idempotency-Key": key})
+
+
+def test_fingerprint_replay_completes_the_new_idempotency_key(client):
+    first = _submit(client, "first-key")
+    assert first.status_code == 200
+
+    # Same submission under a new key (e.g. the page was reloaded): answered from the fingerprint
+    second = _submit(client, "second-key")
+    assert second.headers.get(REPLAY_HEADER) == "true"
+    assert second.json()["id"] == first.json()["id"]
+    with Session(engine) as session:
+        record = session.get(IdempotencyRecord, header_key("second-key"))
+        assert (record.status, record.feedback_id) == ("done", first.json()["id"])
+
+    # A retry with that key is replayed by the middleware, not a 409 or a new row
+    third = _submit(client, "second-key")
+    assert third.status_code == 200
+    assert third.json()["id"] == first.json()["id"]
+    with Session(engine) as session:
+        assert session.exec(select(func.count(Feedback.id))).one() == 1
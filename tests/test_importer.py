@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from sqlmodel import Session, delete, func, select
+
+from backend import importer
+from backend.database import engine, create_db_and_tables
+from backend.importer import ImportConflict, create_import, run_import
+from backend.models import Feedback, ImportRun
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Feedback))
+        session.exec(delete(ImportRun))
+        session.commit()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "feedback.csv"
+    lines = ["phone,rating_air,ro_number"] + [f"98765432{i:02d},3,RO{i}" for i in range(20)]
+    path.write_text("\n".join(lines) + "\n")
+    with Session(engine) as session:
+        return create_import(session, str(path)).id
+
+
+def _feedback_count():
+    with Session(engine) as session:
+        return session.exec(select(func.count(Feedback.id))).one()
+
+
+def test_deadline_is_checked_per_record(source, monkeypatch):
+    parse = importer.parse_record
+
+    def slow_parse(*args):
+        time.sleep(0.02)
+        return parse(*args)
+
+    monkeypatch.setattr(importer, "parse_record", slow_parse)
+    run = run_import(source, max_seconds=0.05, batch_size=1000)
+    assert run.status == "running"
+    assert 0 < run.rows_done < 20
+    assert _feedback_count() == run.rows_done
+
+    run = run_import(source)
+    assert run.status == "done"
+    assert _feedback_count() == 20
+
+
+def test_second_runner_cannot_move_the_checkpoint(source):
+    def other_runner_moves_ahead(run):
+        with Session(engine) as session:
+            stored = session.get(ImportRun, source)
+            stored.rows_done += 5
+            session.add(stored)
+            session.commit()
+
+    with pytest.raises(ImportConflict):
+        run_import(source, batch_size=5, progress=other_runner_moves_ahead)
+    # Only the first batch was written, and the run isn't marked failed
+    assert _feedback_count() == 5
+    with Session(engine) as session:
+        stored = session.get(ImportRun, source)
+        assert (stored.status, stored.rows_done) == ("running", 10)
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, delete
+
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.jobs import claim_jobs, enqueue
+from backend.models import Feedback, Job
+from backend.worker import Worker
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Job))
+        session.exec(delete(Feedback))
+        session.commit()
+
+
+@pytest.fixture
+def smtp_down(monkeypatch):
+    from fastapi_mail import FastMail
+
+    async def send_message(self, message, template_name=None):
+        raise ConnectionRefusedError("SMTP server unavailable")
+
+    monkeypatch.setattr(FastMail, "send_message", send_message)
+
+
+def _run_once(worker):
+    jobs = claim_jobs(worker.worker_id, 10)
+    for job in jobs:
+        asyncio.run(worker.execute(job.id, job.kind, job.payload, job.attempts, job.traceparent))
+    return len(jobs)
+
+
+def _make_due(job_id):
+    # Skip the retry backoff
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        job.run_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+
+
+def _job(job_id):
+    with Session(engine) as session:
+        return session.get(Job, job_id)
+
+
+def test_failed_smtp_send_is_retried_then_dead_lettered(smtp_down):
+    with Session(engine) as session:
+        feedback = Feedback(phone="9876543210", rating_air=1, terms_accepted=True)
+        session.add(feedback)
+        session.flush()
+        job = enqueue(session, "report.negative", {"feedback_id": feedback.id}, max_attempts=3)
+        session.commit()
+        job_id = job.id
+
+    worker = Worker(concurrency=1)
+    assert _run_once(worker) == 1
+    job = _job(job_id)
+    assert job.status == "queued"
+    assert job.attempts == 1
+    assert "SMTP server unavailable" in job.last_error
+
+    for attempt in (2, 3):
+        _make_due(job_id)
+        assert _run_once(worker) == 1
+        assert _job(job_id).attempts == attempt
+
+    job = _job(job_id)
+    assert job.status == "dead"
+    assert job.attempts == job.max_attempts == 3
+    _make_due(job_id)
+    assert _run_once(worker) == 0
+
+
+def test_successful_send_completes_the_job(monkeypatch):
+    from fastapi_mail import FastMail
+    sent = []
+
+    async def send_message(self, message, template_name=None):
+        sent.append(message.subject)
+
+    monkeypatch.setattr(FastMail, "send_message", send_message)
+    with Session(engine) as session:
+        feedback = Feedback(phone="9876543210", rating_air=1, terms_accepted=True)
+        session.add(feedback)
+        session.flush()
+        job = enqueue(session, "report.negative", {"feedback_id": feedback.id})
+        session.commit()
+        job_id = job.id
+
+    assert _run_once(Worker(concurrency=1)) == 1
+    assert sent == ["URGENT: Negative Feedback Received"]
+    assert _job(job_id) is None # Finished jobs are deleted
+
+
+def test_failure_to_complete_does_not_retry_the_send(monkeypatch):
+    from fastapi_mail import FastMail
+    from sqlalchemy.exc import OperationalError
+    from backend import jobs, worker as worker_module
+    sent = []
+
+    async def send_message(self, message, template_name=None):
+        sent.append(message.subject)
+
+    calls = []
+
+    def flaky_complete(job_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise OperationalError("DELETE FROM job", {}, Exception("database is locked"))
+        jobs.complete_job(job_id)
+
+    monkeypatch.setattr(FastMail, "send_message", send_message)
+    monkeypatch.setattr(worker_module, "complete_job", flaky_complete)
+    monkeypatch.setattr(worker_module, "COMPLETE_RETRY_DELAY_SECONDS", 0)
+    with Session(engine) as session:
+        feedback = Feedback(phone="9876543210", rating_air=1, terms_accepted=True)
+        session.add(feedback)
+        session.flush()
+        job = enqueue(session, "report.negative", {"feedback_id": feedback.id})
+        session.commit()
+        job_id = job.id
+
+    assert _run_once(Worker(concurrency=1)) == 1
+    assert sent == ["URGENT: Negative Feedback Received"]
+    assert calls == [job_id, job_id]
+    assert _job(job_id) is None
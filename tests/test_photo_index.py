@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete, select
+
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.main import app
+from backend.models import Feedback, PhotoHash, PhotoMatch
+from backend.photo_index import match_feedback, store_photo_hash
+
+PHOTO_HASH = 0x0F0F_3C3C_5A5A_9999
+
+
+@pytest.fixture
+def client(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        for model in (PhotoMatch, PhotoHash, Feedback):
+            session.exec(delete(model))
+        session.commit()
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    client = TestClient(app)
+    token = client.post("/admin/login", data={"username": "admin", "password": "pw"}).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+def _reused_photos(count):
+    # The same air photo (one bit apart) in every submission
+    ids = []
+    with Session(engine) as session:
+        for i in range(count):
+            feedback = Feedback(phone="9876543210", rating_air=1, terms_accepted=True, ro_number=f"RO{i}")
+            session.add(feedback)
+            session.flush()
+            store_photo_hash(session, feedback.id, "air", PHOTO_HASH ^ i)
+            ids.append(feedback.id)
+        session.commit()
+    for feedback_id in ids:
+        match_feedback(feedback_id)
+    return ids
+
+
+def _matched_ids(client):
+    return {m["feedback_id"] for m in client.get("/admin/photos/matches").json()} | {
+        m["match_feedback_id"] for m in client.get("/admin/photos/matches").json()
+    }
+
+
+def test_deleting_feedback_removes_its_hashes_and_matches(client):
+    first, second, third = _reused_photos(3)
+    assert _matched_ids(client) == {first, second, third}
+
+    assert client.delete(f"/admin/feedback/{first}").status_code == 200
+    assert _matched_ids(client) == {second, third}
+    similar = client.get(f"/admin/photos/similar/{third}/air").json()
+    assert [s["feedback_id"] for s in similar] == [second]
+
+    assert client.post("/admin/feedback/bulk/delete", json={"ids": [second]}).status_code == 200
+    assert client.get("/admin/photos/matches").json() == []
+    assert client.get(f"/admin/photos/similar/{third}/air").json() == []
+    with Session(engine) as session:
+        assert session.exec(select(PhotoHash.feedback_id)).all() == [third]
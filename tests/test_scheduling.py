@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, delete, select
+
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.jobs import claim_jobs
+from backend.models import Feedback, Job, JobRun
+from backend.scheduling import due_intervals, run_interval_job, slot_start
+from backend.tasks import enqueue_interval_report
+from backend.worker import Worker
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Job))
+        session.exec(delete(JobRun))
+        session.exec(delete(Feedback))
+        session.commit()
+
+
+@pytest.fixture
+def smtp_down(monkeypatch):
+    from fastapi_mail import FastMail
+
+    async def send_message(self, message, template_name=None):
+        raise ConnectionRefusedError("SMTP server unavailable")
+
+    monkeypatch.setattr(FastMail, "send_message", send_message)
+
+
+def _run(name):
+    with Session(engine) as session:
+        return session.exec(select(JobRun).where(JobRun.job_name == name)).one()
+
+
+def _drain(worker):
+    # Runs every claimable job, skipping retry backoff, until the queue is empty
+    while True:
+        with Session(engine) as session:
+            for job in session.exec(select(Job).where(Job.status == "queued")).all():
+                job.run_at = datetime.utcnow()
+                session.add(job)
+            session.commit()
+        jobs = claim_jobs(worker.worker_id, 10)
+        if not jobs:
+            return
+        for job in jobs:
+            asyncio.run(worker.execute(job.id, job.kind, job.payload, job.attempts, job.traceparent))
+
+
+def _report_interval():
+    # A single feedback in the last completed interval, so the report has something to send
+    latest = slot_start(datetime.utcnow(), settings.REPORT_INTERVAL_MINUTES) - timedelta(minutes=settings.REPORT_INTERVAL_MINUTES)
+    with Session(engine) as session:
+        session.add(Feedback(phone="9876543210", rating_air=4, terms_accepted=True, created_at=latest + timedelta(minutes=1)))
+        session.commit()
+    asyncio.run(run_interval_job("daily_report", settings.REPORT_INTERVAL_MINUTES, enqueue_interval_report))
+    return latest
+
+
+def test_report_run_stays_queued_until_the_job_succeeds(monkeypatch):
+    from fastapi_mail import FastMail
+
+    async def send_message(self, message, template_name=None):
+        pass
+
+    monkeypatch.setattr(FastMail, "send_message", send_message)
+    _report_interval()
+    assert _run("daily_report").status == "queued"
+
+    _drain(Worker(concurrency=1))
+    assert _run("daily_report").status == "done"
+    assert due_intervals("daily_report", settings.REPORT_INTERVAL_MINUTES) == []
+
+
+def test_dead_lettered_report_marks_the_run_failed_and_is_retried(smtp_down):
+    start = _report_interval()
+    _drain(Worker(concurrency=1))
+
+    run = _run("daily_report")
+    assert run.status == "failed"
+    assert "SMTP server unavailable" in run.error
+    assert due_intervals("daily_report", settings.REPORT_INTERVAL_MINUTES) == [start]
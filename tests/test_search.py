@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, delete
+
+from backend import search
+from backend.database import engine, create_db_and_tables
+from backend.models import Feedback
+from backend.search import search_feedback
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(Feedback))
+        session.commit()
+
+
+@pytest.fixture(params=["fts", "like"])
+def search_path(request, monkeypatch):
+    # Both paths must return the same rows; the LIKE scan is the fallback without FTS5
+    if request.param == "like":
+        monkeypatch.setattr(search, "_fts_available", False)
+    else:
+        assert search._fts_available
+    return request.param
+
+
+def _add(**fields):
+    with Session(engine) as session:
+        feedback = Feedback(terms_accepted=True, **fields)
+        session.add(feedback)
+        session.commit()
+        return feedback.id
+
+
+def _ids(query):
+    with Session(engine) as session:
+        total, rows = search_feedback(session, query)
+    assert total == len(rows)
+    return sorted(row["id"] for row in rows)
+
+
+def _fts_row(feedback_id):
+    with Session(engine) as session:
+        return session.execute(
+            text("SELECT comment, phone_digits, phone_rev, ro_number FROM feedback_fts WHERE rowid = :id"),
+            {"id": feedback_id},
+        ).first()
+
+
+def test_triggers_keep_the_index_in_sync():
+    feedback_id = _add(phone="+91 98765-43210", comment="AC not cooling", ro_number="RO-7")
+    assert tuple(_fts_row(feedback_id)) == ("AC not cooling", "919876543210", "012345678919", "RO-7")
+
+    with Session(engine) as session:
+        feedback = session.get(Feedback, feedback_id)
+        feedback.comment = "Washroom dirty"
+        feedback.phone = "9123456780"
+        session.add(feedback)
+        session.commit()
+    assert tuple(_fts_row(feedback_id)) == ("Washroom dirty", "9123456780", "0876543219", "RO-7")
+    assert _ids("cooling") == []
+    assert _ids("washroom") == [feedback_id]
+
+    with Session(engine) as session:
+        session.exec(delete(Feedback).where(Feedback.id == feedback_id))
+        session.commit()
+    assert _fts_row(feedback_id) is None
+    assert _ids("washroom") == []
+
+
+def test_text_and_ro_number_match(search_path):
+    cooling = _add(phone="9000000001", comment="AC not cooling at all", ro_number="DL-0042")
+    dirty = _add(phone="9000000002", comment="Washroom dirty", ro_number="MH-0117")
+
+    assert _ids("cooling") == [cooling]
+    assert _ids("COOL") == [cooling]
+    assert _ids("washroom dirty") == [dirty]
+    assert _ids("mh") == [dirty]
+    assert _ids("nothing here") == []
+
+
+def test_phone_prefix_and_suffix_match_formatted_numbers(search_path):
+    formatted = _add(phone="+91 98765-43210")
+    plain = _add(phone="9123443210")
+    other = _add(phone="8000000000")
+
+    assert _ids("43210") == [formatted, plain]
+    assert _ids("9876543210") == [formatted]
+    assert _ids("919876543210") == [formatted]
+    assert _ids("98765-43210") == [formatted]
+    assert _ids("+91 98765") == [formatted]
+    assert _ids("800") == [other]
+    assert _ids("55555") == []
@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.benchmarks import HEAVY_MODULES, IMPORT_PROBE
+from backend.config import settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def slow_schema_check(monkeypatch):
+    # Holds the deferred schema check until the test releases it; the first try fails
+    release = threading.Event()
+    calls = []
+
+    def create_db_and_tables():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionRefusedError("database is waking up")
+        release.wait(5)
+
+    monkeypatch.setattr(settings, "FAST_STARTUP", True)
+    monkeypatch.setattr(settings, "JOB_WORKER_EMBEDDED", False)
+    monkeypatch.setattr(settings, "STARTUP_DB_RETRY_SECONDS", 0)
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    monkeypatch.setattr(main, "create_db_and_tables", create_db_and_tables)
+    monkeypatch.setattr(main, "start_scheduler", lambda: None)
+    monkeypatch.setattr(main, "stop_scheduler", lambda: None)
+    monkeypatch.setattr(main, "_schema_ready", False)
+    yield release, calls
+    release.set()
+
+
+def _wait_ready(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/health/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.01)
+    return response
+
+
+def test_not_ready_until_deferred_schema_check_finishes(slow_schema_check):
+    release, calls = slow_schema_check
+    with TestClient(main.app) as client:
+        assert client.get("/health/live").status_code == 200
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "starting", "schema": False}
+
+        release.set()
+        response = _wait_ready(client)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready", "schema": True, "database": True}
+    assert len(calls) == 2 # Retried after the failed first try
+
+
+def test_import_does_not_load_heavy_modules():
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=os.getcwd(), env=env,
+                         capture_output=True, text=True, check=True)
+    loaded = json.loads(out.stdout.strip().splitlines()[-1])["loaded"]
+    assert loaded == [], f"imported eagerly by backend.main: {loaded}"
+    assert {"fpdf", "fastapi_mail", "apscheduler", "httpx", "jose", "PIL"} <= set(HEAVY_MODULES)
@@ -0,0 +1,94 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete
+
+from backend.admission import admission
+from backend.config import settings
+from backend.database import engine, create_db_and_tables
+from backend.main import app
+from backend.models import Upload, UploadChunk
+
+
+@pytest.fixture
+def client(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(UploadChunk))
+        session.exec(delete(Upload))
+        session.commit()
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    admission.backend.buckets.clear()
+    yield TestClient(app)
+    admission.backend.buckets.clear()
+
+
+def _start(client, size=1000):
+    return client.post("/feedback/uploads/", json={"size": size, "content_type": "image/jpeg"})
+
+
+def test_pending_uploads_are_capped_per_client(client, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_PENDING", 2)
+    assert _start(client).status_code == 200
+    assert _start(client).status_code == 200
+    response = _start(client)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_pending_upload_bytes_are_capped_per_client(client, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_PENDING_BYTES", 1500)
+    assert _start(client).status_code == 200
+    assert _start(client).status_code == 429
+
+
+def test_starting_uploads_uses_the_ip_bucket(client, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_BURST", 1)
+    assert _start(client).status_code == 200
+    assert _start(client).status_code == 429
+
+
+def test_chunks_are_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_UPLOAD_CHUNKS_BURST", 2)
+    upload_id = _start(client, size=3).json()["upload_id"]
+    statuses = [
+        client.patch(f"/feedback/uploads/{upload_id}", content=b"x", headers={"Upload-Offset": str(offset)}).status_code
+        for offset in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+def _jpeg():
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_upload_is_consumed_on_commit_without_holding_the_write_lock(client, monkeypatch):
+    from backend.database import engine as db_engine
+    from backend.engine_profiles import pool_stats
+    from backend.routers import feedback
+
+    data = _jpeg()
+    upload_id = _start(client, size=len(data)).json()["upload_id"]
+    assert client.patch(f"/feedback/uploads/{upload_id}", content=data, headers={"Upload-Offset": "0"}).status_code == 200
+
+    queue_busy = []
+    normalize = feedback.normalize_image_async
+
+    async def watched_normalize(photo):
+        queue_busy.append(pool_stats(db_engine)["writer_queue"]["busy"])
+        return await normalize(photo)
+
+    monkeypatch.setattr(feedback, "normalize_image_async", watched_normalize)
+    form = {"phone": "9876543210", "rating_air": "3", "terms_accepted": "true", "photo_air_upload": upload_id}
+    assert client.post("/feedback/", data=form).status_code == 200
+    assert queue_busy == [False]
+    with Session(engine) as session:
+        assert session.get(Upload, upload_id) is None
+
+    # Already consumed
+    form["comment"] = "Second try"
+    assert client.post("/feedback/", data=form).status_code == 400